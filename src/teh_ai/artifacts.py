@@ -0,0 +1,206 @@
+"""
+Allure attachments without rescanning the working directory or re-reading files.
+
+Tests register the files they produce (``track``); after the test call the
+conftest attaches exactly those files to that test's Allure result. A file is
+attached once per run however many tests register it unchanged.
+
+Only the attachment entry is added on the test thread. The bytes are written
+into ``allure-results`` by one background thread: a hardlink where the file
+system allows it, else a streaming copy, and JSON above ``gzip_bytes`` is
+gzip-compressed on the way (``application/gzip``, ``.json.gz``).
+Session-level files such as the Excel report become Allure global
+attachments the same way.
+"""
+import gzip
+import os
+import queue
+import shutil
+import threading
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+DEFAULT_GZIP_BYTES = 1024 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def _allure_reporter():
+    """The ``AllureReporter`` of the running allure-pytest listener, or None."""
+    try:
+        from allure_commons import plugin_manager
+    except ImportError:
+        return None
+    for plugin in plugin_manager.get_plugins():
+        reporter = getattr(plugin, "allure_logger", None)
+        if reporter is not None:
+            return reporter
+    return None
+
+
+def _attachment_type(attachment_type, path):
+    """``(mime_type, extension)`` from an ``allure.attachment_type`` member, a mime string or the file name."""
+    if attachment_type is not None and hasattr(attachment_type, "mime_type"):
+        return attachment_type.mime_type, attachment_type.extension
+    extension = "".join(Path(path).suffixes).lstrip(".") or "attach"
+    return attachment_type, extension
+
+
+class AttachmentManager:
+    """Attach test artifacts to Allure once, writing them on a background thread.
+
+    Args:
+        results_dir: The ``--alluredir`` folder (None disables attaching;
+            tracking still works)
+        gzip_bytes: JSON files larger than this are attached gzip-compressed
+    """
+
+    def __init__(self, results_dir=None, gzip_bytes=DEFAULT_GZIP_BYTES):
+        self.results_dir = Path(results_dir) if results_dir else None
+        self.gzip_bytes = gzip_bytes
+        self.attached = 0
+        self.linked = 0
+        self.copied = 0
+        self.compressed = 0
+        self.failed = 0
+        self._tracked = defaultdict(list)
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def track(self, nodeid, path, name=None, attachment_type=None):
+        """Record that test ``nodeid`` produced ``path``."""
+        with self._lock:
+            self._tracked[nodeid].append((Path(path), name, attachment_type))
+
+    def attach_tracked(self, nodeid):
+        """Attach the files test ``nodeid`` tracked to its Allure result; returns how many."""
+        with self._lock:
+            tracked = self._tracked.pop(nodeid, [])
+        return sum(self.attach(path, name, attachment_type) for path, name, attachment_type in tracked)
+
+    def attach(self, path, name=None, attachment_type=None):
+        """Attach a file to the current Allure test; False if already attached or unavailable."""
+        plan = self._plan(path, attachment_type)
+        if plan is None:
+            return False
+        reporter = _allure_reporter()
+        if reporter is None:
+            return False
+        path, mime_type, extension, compress = plan
+        file_name = reporter._attach(uuid.uuid4(), name=name or path.name,
+                                     attachment_type=mime_type, extension=extension)
+        self._write(path, file_name, compress)
+        return True
+
+    def attach_global(self, path, name=None, attachment_type=None):
+        """Attach a file to the whole run (an Allure global attachment)."""
+        plan = self._plan(path, attachment_type)
+        if plan is None:
+            return False
+        try:
+            from allure_commons import plugin_manager
+            from allure_commons.model2 import ATTACHMENT_PATTERN, GlobalAttachment, Globals
+            from allure_commons.utils import now
+        except ImportError:
+            print("Skipping global attachment: allure-python-commons without global attachments")
+            return False
+        path, mime_type, extension, compress = plan
+        file_name = ATTACHMENT_PATTERN.format(prefix=uuid.uuid4(), ext=extension)
+        plugin_manager.hook.report_globals(globals_item=Globals(attachments=[
+            GlobalAttachment(source=file_name, name=name or path.name, type=mime_type, timestamp=now())
+        ]))
+        self._write(path, file_name, compress)
+        return True
+
+    def _plan(self, path, attachment_type):
+        """``(path, mime_type, extension, compress)``, or None when there is nothing to attach."""
+        if self.results_dir is None:
+            return None
+        path = Path(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._seen:
+                return None
+            self._seen.add(key)
+        mime_type, extension = _attachment_type(attachment_type, path)
+        compress = extension == "json" and stat.st_size > self.gzip_bytes
+        if compress:
+            mime_type, extension = "application/gzip", "json.gz"
+        return path, mime_type, extension, compress
+
+    def _write(self, source, file_name, compress):
+        with self._lock:
+            self.attached += 1
+            if self._thread is None:
+                self.results_dir.mkdir(parents=True, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="allure-attachments",
+                                                daemon=True)
+                self._thread.start()
+        self._queue.put((source, self.results_dir / file_name, compress))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            source, target, compress = job
+            try:
+                outcome = self._materialize(source, target, compress)
+            except OSError as e:
+                outcome = "failed"
+                print(f"Could not attach {source}: {e}")
+            with self._lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def _materialize(self, source, target, compress):
+        if compress:
+            with open(source, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+            return "compressed"
+        try:
+            os.link(source, target)
+            return "linked"
+        except OSError:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+            return "copied"
+
+    def summary(self):
+        with self._lock:
+            return {"attached": self.attached, "linked": self.linked, "copied": self.copied,
+                    "compressed": self.compressed, "failed": self.failed,
+                    "pending": self._queue.qsize()}
+
+    def close(self):
+        """Wait until every queued attachment has been written."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+_manager = None
+
+
+def get_attachment_manager():
+    """Get or create the process-wide attachment manager."""
+    global _manager
+    if _manager is None:
+        _manager = AttachmentManager()
+    return _manager
+
+
+def configure_attachments(results_dir, **kwargs):
+    """Replace the process-wide manager, e.g. once ``--alluredir`` is known."""
+    global _manager
+    if _manager is not None:
+        _manager.close()
+    _manager = AttachmentManager(results_dir, **kwargs)
+    return _manager
@@ -0,0 +1,285 @@
+"""
+Latency regression gate: repeated samples per question against a saved baseline.
+
+``collect_latencies`` asks every question ``repeats`` times, interleaved
+round-robin so slow periods of the API hit every question alike, and keeps the
+latency of each successful, uncached call. The samples of one run can be saved
+as the baseline (``save_baseline``) and a later run compared with it
+(``compare``):
+
+* a one-sided Mann-Whitney U test per question (does the current run tend to be
+  slower?), computed exactly over all sample pairs with NumPy broadcasting and
+  a tie-corrected normal approximation, with Holm's correction across
+  questions so a large corpus does not fail by chance;
+* the effect size of each question: the median ratio with a bootstrap
+  confidence interval (all resamples drawn at once) and the rank-biserial
+  correlation (``+1``: every current call slower than every baseline call).
+
+A question only counts as regressed when the corrected p-value is below
+``alpha`` *and* its median slowed down by at least ``min_slowdown``, so single
+slow calls and statistically real but negligible shifts do not fail the run.
+
+Compare two saved runs from the command line::
+
+    python -m teh_ai.benchmark test_results/latency_baseline_qa.json test_results/latency_samples_<run_id>.json
+"""
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from teh_ai.corpus import question_id
+
+DEFAULT_BASELINE_DIR = "test_results"
+DEFAULT_ALPHA = 0.01
+DEFAULT_MIN_SLOWDOWN = 1.10
+DEFAULT_MIN_SAMPLES = 5
+BOOTSTRAP_RESAMPLES = 2000
+
+
+def baseline_path(environment, directory=DEFAULT_BASELINE_DIR):
+    """Default baseline file of an environment."""
+    return os.path.join(directory, f"latency_baseline_{environment}.json")
+
+
+def collect_latencies(questions, repeats, client=None, concurrency=1):
+    """Ask every question ``repeats`` times; returns ``{question_id: sample}``.
+
+    Each sample is ``{"query", "latencies", "errors"}`` with the latencies of
+    the successful calls in seconds. The calls bypass the response cache, so
+    every repeat reaches the API.
+
+    Args:
+        questions: Questions to time
+        repeats: Calls per question
+        client: ``AskClient`` to use (defaults to ``playwrt2.get_client()``)
+        concurrency: Calls in flight at once (``1`` keeps queueing out of the numbers)
+    """
+    if client is None:
+        from teh_ai.playwrt2 import get_client
+        client = get_client()
+    samples = {}
+    for question in questions:
+        samples.setdefault(question_id(question), {"query": question, "latencies": [], "errors": 0})
+
+    def timed(question):
+        start = time.perf_counter()
+        try:
+            _, stats = client.ask(question, use_cache=False)
+        except Exception:
+            return question, None
+        if (stats.get("status_code") or 0) >= 400:
+            return question, None
+        return question, time.perf_counter() - start
+
+    calls = [question for _ in range(repeats) for question in questions]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for question, latency in pool.map(timed, calls):
+            sample = samples[question_id(question)]
+            if latency is None:
+                sample["errors"] += 1
+            else:
+                sample["latencies"].append(latency)
+    return samples
+
+
+def save_baseline(path, samples, environment, run_id=None):
+    """Write one run's samples as a baseline (or plain samples) file; returns the path."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment, "run_id": run_id, "created": time.time(),
+                   "questions": samples}, f)
+    return path
+
+
+def load_baseline(path):
+    """Read a file written by ``save_baseline``; None when it does not exist."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided Mann-Whitney U test that ``current`` tends to be larger than ``baseline``.
+
+    Returns ``(u, p_value)``; ``u`` counts the (current, baseline) pairs where
+    the current value is larger, ties counting one half.
+    """
+    import numpy as np
+
+    current = np.asarray(current, dtype=float)
+    baseline = np.asarray(baseline, dtype=float)
+    n1, n2 = current.size, baseline.size
+    diff = current[:, None] - baseline[None, :]
+    u = float((diff > 0).sum() + 0.5 * (diff == 0).sum())
+
+    n = n1 + n2
+    _, ties = np.unique(np.concatenate([current, baseline]), return_counts=True)
+    variance = n1 * n2 / 12 * ((n + 1) - float((ties ** 3 - ties).sum()) / (n * (n - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def bootstrap_median_ratio(current, baseline, confidence=0.95, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """Confidence interval ``(low, high)`` of median(current) / median(baseline)."""
+    import numpy as np
+
+    current = np.asarray(current, dtype=float)
+    baseline = np.asarray(baseline, dtype=float)
+    rng = np.random.default_rng(seed)
+    current_medians = np.median(current[rng.integers(0, current.size, (resamples, current.size))], axis=1)
+    baseline_medians = np.median(baseline[rng.integers(0, baseline.size, (resamples, baseline.size))], axis=1)
+    ratios = current_medians / np.maximum(baseline_medians, 1e-9)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(ratios, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def holm(p_values):
+    """Holm-Bonferroni adjusted p-values, in the input order."""
+    import numpy as np
+
+    p = np.asarray(p_values, dtype=float)
+    if not p.size:
+        return p
+    order = np.argsort(p)
+    adjusted = np.minimum(1.0, np.maximum.accumulate((p.size - np.arange(p.size)) * p[order]))
+    result = np.empty_like(adjusted)
+    result[order] = adjusted
+    return result
+
+
+class RegressionReport:
+    """Per-question comparison of a run's latencies with the baseline."""
+
+    def __init__(self, rows, alpha, min_slowdown, baseline_run_id=None):
+        self.rows = rows
+        self.alpha = alpha
+        self.min_slowdown = min_slowdown
+        self.baseline_run_id = baseline_run_id
+
+    @property
+    def tested(self):
+        """Rows with enough samples on both sides to be tested."""
+        return [row for row in self.rows if row["p_value"] is not None]
+
+    @property
+    def regressions(self):
+        return [row for row in self.rows if row["verdict"] == "regressed"]
+
+    def summary(self):
+        verdicts = {}
+        for row in self.rows:
+            verdicts[row["verdict"]] = verdicts.get(row["verdict"], 0) + 1
+        return {"questions": len(self.rows), "verdicts": verdicts, "alpha": self.alpha,
+                "min_slowdown": self.min_slowdown, "baseline_run_id": self.baseline_run_id}
+
+    def format(self):
+        """A fixed-width table, regressions first, then by slowdown."""
+        lines = [f"{'verdict':<12} {'base p50':>9} {'now p50':>9} {'ratio':>6} {'95% CI':>13} "
+                 f"{'effect':>7} {'p(adj)':>8}  query"]
+        order = sorted(self.rows, key=lambda r: (r["verdict"] != "regressed", -(r["median_ratio"] or 0)))
+        for row in order:
+            if row["median_ratio"] is None:
+                lines.append(f"{row['verdict']:<12} {'':>9} {'':>9} {'':>6} {'':>13} {'':>7} {'':>8}  "
+                             f"{row['query']}")
+                continue
+            ci = f"{row['ratio_ci_low']:.2f}-{row['ratio_ci_high']:.2f}"
+            lines.append(f"{row['verdict']:<12} {row['baseline_p50']:>8.2f}s {row['current_p50']:>8.2f}s "
+                         f"{row['median_ratio']:>6.2f} {ci:>13} {row['rank_biserial']:>+7.2f} "
+                         f"{row['p_adjusted']:>8.4f}  {row['query']}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "questions": self.rows}, f, indent=2)
+        return path
+
+    def assert_no_regressions(self):
+        """Raise AssertionError listing every regressed question."""
+        failures = [f"{row['query']!r}: median {row['baseline_p50']:.2f}s -> {row['current_p50']:.2f}s "
+                    f"(x{row['median_ratio']:.2f}, p={row['p_adjusted']:.2g})"
+                    for row in self.regressions]
+        assert not failures, "Latency regressed: " + "; ".join(failures)
+
+
+def compare(baseline, current, alpha=DEFAULT_ALPHA, min_slowdown=DEFAULT_MIN_SLOWDOWN,
+            min_samples=DEFAULT_MIN_SAMPLES):
+    """Compare current samples with a baseline; returns a ``RegressionReport``.
+
+    Args:
+        baseline: Baseline as read by ``load_baseline``
+        current: ``{question_id: sample}`` from ``collect_latencies`` (or a loaded file)
+        alpha: Significance level after Holm's correction
+        min_slowdown: Median ratio a significant slowdown must reach to count
+        min_samples: Successful calls needed on each side to test a question
+    """
+    import numpy as np
+
+    current = current.get("questions", current)
+    golden = baseline.get("questions", {})
+    rows, tested = [], []
+    for qid, sample in current.items():
+        row = {"question_id": qid, "query": sample["query"],
+               "baseline_samples": 0, "current_samples": len(sample["latencies"]),
+               "errors": sample.get("errors", 0), "baseline_p50": None, "current_p50": None,
+               "median_ratio": None, "ratio_ci_low": None, "ratio_ci_high": None,
+               "rank_biserial": None, "u": None, "p_value": None, "p_adjusted": None}
+        rows.append(row)
+        if qid not in golden:
+            row["verdict"] = "new"
+            continue
+        before = np.asarray(golden[qid]["latencies"], dtype=float)
+        after = np.asarray(sample["latencies"], dtype=float)
+        row["baseline_samples"] = before.size
+        if before.size < min_samples or after.size < min_samples:
+            row["verdict"] = "too few"
+            continue
+        u, p = mann_whitney_greater(after, before)
+        low, high = bootstrap_median_ratio(after, before)
+        row.update(baseline_p50=float(np.median(before)), current_p50=float(np.median(after)),
+                   median_ratio=float(np.median(after) / max(np.median(before), 1e-9)),
+                   ratio_ci_low=low, ratio_ci_high=high,
+                   rank_biserial=2 * u / (before.size * after.size) - 1, u=u, p_value=p)
+        tested.append(row)
+
+    for row, adjusted in zip(tested, holm([row["p_value"] for row in tested])):
+        row["p_adjusted"] = float(adjusted)
+        if adjusted < alpha and row["median_ratio"] >= min_slowdown:
+            row["verdict"] = "regressed"
+        elif row["median_ratio"] <= 1 / min_slowdown:
+            row["verdict"] = "faster"
+        else:
+            row["verdict"] = "unchanged"
+    return RegressionReport(rows, alpha, min_slowdown, baseline.get("run_id"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.benchmark",
+                                     description="Compare saved latency samples with a baseline.")
+    parser.add_argument("baseline", help="baseline file")
+    parser.add_argument("current", help="samples file of the run to check")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    parser.add_argument("--min-slowdown", type=float, default=DEFAULT_MIN_SLOWDOWN)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    baseline, current = load_baseline(args.baseline), load_baseline(args.current)
+    if baseline is None or current is None:
+        parser.error("both files must exist")
+    report = compare(baseline, current, alpha=args.alpha, min_slowdown=args.min_slowdown)
+    print(report.format())
+    print(json.dumps(report.summary()))
+    if args.output:
+        report.save(args.output)
+    return 1 if report.regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
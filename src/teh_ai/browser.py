@@ -0,0 +1,153 @@
+"""
+Long-lived Playwright browser session used to read the token from localStorage.
+
+The browser is launched (or attached to over CDP) once per process and reused
+for every token fetch. All three localStorage keys are read in a single
+``page.evaluate`` call, and images, fonts, media and stylesheets are blocked
+because nothing but the origin's localStorage is needed.
+
+Playwright's sync API is bound to the thread that started it, while token
+refreshes run on background threads, so every Playwright call goes through
+one dedicated worker thread.
+"""
+import atexit
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+
+# Reads every requested key in one round-trip: {key: value-or-null}
+READ_KEYS_JS = "keys => Object.fromEntries(keys.map(k => [k, localStorage.getItem(k)]))"
+
+
+class BrowserSession:
+    """Reusable browser context for localStorage reads.
+
+    Args:
+        executable_path: Browser binary for a persistent launch (e.g. msedge.exe)
+        user_data_dir: Browser profile holding the signed-in session
+        cdp_url: Attach to an already-running browser instead of launching one,
+            e.g. ``http://localhost:9222`` (Edge started with ``--remote-debugging-port``)
+        headless: Launch headless (ignored when attaching over CDP)
+        block_scripts: Also block scripts from other hosts than the page's own.
+            Off by default because the app's login scripts may be what renews
+            the token in localStorage.
+    """
+
+    def __init__(self, executable_path=None, user_data_dir=None, cdp_url=None, headless=True,
+                 block_scripts=False):
+        self.executable_path = executable_path
+        self.user_data_dir = user_data_dir
+        self.cdp_url = cdp_url
+        self.headless = headless
+        self.block_scripts = block_scripts
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playwright")
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._host = None
+
+    def read_local_storage(self, url, keys):
+        """Open ``url`` and return ``{key: value}`` for the given localStorage keys."""
+        return self._executor.submit(self._read, url, list(keys)).result()
+
+    def _route(self, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            return route.abort()
+        if (self.block_scripts and request.resource_type == "script"
+                and urlparse(request.url).hostname != self._host):
+            return route.abort()
+        return route.continue_()
+
+    def _start(self):
+        from playwright.sync_api import sync_playwright
+
+        self._playwright = sync_playwright().start()
+        try:
+            if self.cdp_url:
+                self._browser = self._playwright.chromium.connect_over_cdp(self.cdp_url)
+                contexts = self._browser.contexts
+                self._context = contexts[0] if contexts else self._browser.new_context()
+            else:
+                self._context = self._playwright.chromium.launch_persistent_context(
+                    user_data_dir=self.user_data_dir,
+                    executable_path=self.executable_path,
+                    headless=self.headless,
+                    ignore_https_errors=True,
+                )
+        except Exception:
+            # Leave no half-started driver behind so the next fetch can retry cleanly
+            self._stop()
+            raise
+
+    def _read(self, url, keys):
+        started = time.perf_counter()
+        cold = self._context is None
+        if cold:
+            self._start()
+        launched = time.perf_counter()
+
+        self._host = urlparse(url).hostname
+        page = self._context.new_page()
+        try:
+            # Route on our own page only: over CDP the context is the user's browser
+            page.route("**/*", self._route)
+            page.goto(url, wait_until="domcontentloaded")
+            values = page.evaluate(READ_KEYS_JS, keys)
+        finally:
+            page.close()
+
+        done = time.perf_counter()
+        timing = (f"localStorage read from {self._host} in {done - started:.2f}s "
+                  f"({'cold' if cold else 'warm'} start, launch {launched - started:.2f}s, "
+                  f"page {done - launched:.2f}s)")
+        print(timing)
+        log.info(timing)
+        log.debug("localStorage keys present: %s", [k for k, v in values.items() if v])
+        return values
+
+    def _stop(self):
+        if self._context is not None and not self.cdp_url:
+            self._context.close()
+        if self._browser is not None:
+            self._browser.close()
+        if self._playwright is not None:
+            self._playwright.stop()
+        self._playwright = self._browser = self._context = None
+
+    def close(self):
+        """Close the browser (or detach from it) and stop the worker thread."""
+        try:
+            self._executor.submit(self._stop).result()
+        except RuntimeError:
+            pass    # interpreter shutdown: the driver process exits with us
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+_session = None
+
+
+def get_browser_session(executable_path=None, user_data_dir=None):
+    """Get or create the process-wide browser session.
+
+    ``TEH_AI_CDP_URL`` switches to attaching over CDP and
+    ``TEH_AI_BLOCK_SCRIPTS=1`` enables third-party script blocking.
+    """
+    global _session
+    if _session is None:
+        _session = BrowserSession(
+            executable_path=executable_path,
+            user_data_dir=user_data_dir,
+            cdp_url=os.environ.get("TEH_AI_CDP_URL"),
+            block_scripts=os.environ.get("TEH_AI_BLOCK_SCRIPTS") == "1",
+        )
+        atexit.register(_session.close)
+    return _session
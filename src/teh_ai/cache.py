@@ -0,0 +1,171 @@
+"""
+Opt-in response cache in front of the /ask API.
+
+Answers are keyed on (endpoint, message, conversationId, isAgenticApproach)
+and kept in two layers: an in-memory LRU for the current process and a sqlite
+file shared across runs, both with TTL and size-based eviction.
+
+Modes (``TEH_AI_CACHE_MODE``):
+
+* ``off``          - never touch the cache (default)
+* ``read-through`` - serve hits from the cache, call the API on a miss and store it
+* ``record``       - always call the API and overwrite the cached answer
+* ``replay-only``  - serve hits only; a miss raises ``CacheMiss`` and no request
+  (and no token fetch) is ever made
+
+The conversationId in the key is the one passed explicitly by the caller, or
+``"default"`` for the conversation taken from the browser's localStorage, so
+replaying never needs a token. Requests that start a new conversation
+(``NEW_CONVERSATION``) are never cached, since each must get its own
+conversationId; in replay-only mode they raise ``CacheMiss``.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MODES = ("off", "read-through", "record", "replay-only")
+DEFAULT_CACHE_PATH = "test_results/response_cache.sqlite"
+
+
+class CacheMiss(KeyError):
+    """Raised in replay-only mode when a question has no cached answer."""
+
+
+def cache_key(endpoint, message, conversation_id=None, is_agentic="false"):
+    """Stable key for one /ask request."""
+    raw = json.dumps([endpoint, message, conversation_id or "default", str(is_agentic).lower()],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-level (memory LRU + sqlite) cache of /ask answers.
+
+    Args:
+        path: sqlite file for the on-disk layer (None keeps the cache in memory only)
+        mode: One of ``MODES``
+        ttl: Seconds an entry stays valid
+        max_items: Entries kept in the in-memory LRU
+        max_bytes: Total size of the on-disk layer before the oldest entries are evicted
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, mode="read-through", ttl=24 * 3600,
+                 max_items=1024, max_bytes=256 * 1024 * 1024):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL, size INTEGER NOT NULL,"
+                " value BLOB NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from ``TEH_AI_CACHE_*`` variables, or None when the mode is off."""
+        mode = os.environ.get("TEH_AI_CACHE_MODE", "off")
+        if mode == "off":
+            return None
+        return cls(
+            path=os.environ.get("TEH_AI_CACHE_PATH", DEFAULT_CACHE_PATH),
+            mode=mode,
+            ttl=float(os.environ.get("TEH_AI_CACHE_TTL", 24 * 3600)),
+        )
+
+    @property
+    def reads(self):
+        return self.mode in ("read-through", "replay-only")
+
+    @property
+    def writes(self):
+        return self.mode in ("read-through", "record")
+
+    def get(self, key):
+        """Return the cached entry and the layer it came from, or ``(None, None)``."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], "memory"
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT created, value FROM responses WHERE key = ?",
+                                       (key,)).fetchone()
+                if row is not None and now - row[0] < self.ttl:
+                    value = json.loads(row[1])
+                    self._remember(key, row[0], value)
+                    self.hits += 1
+                    return value, "disk"
+            self.misses += 1
+            return None, None
+
+    def put(self, key, value):
+        """Store a JSON-serialisable entry in both layers."""
+        now = time.time()
+        blob = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                 (key, now, len(blob), blob))
+                self._evict_disk(now)
+                self._db.commit()
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the oldest entries until the store fits again
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY created"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        """Remove every entry from both layers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
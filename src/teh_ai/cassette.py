@@ -0,0 +1,72 @@
+"""
+Record /ask traffic into a cassette file for offline replay.
+
+A cassette is a JSONL file with one interaction per line: the request
+(method, path, query parameters and headers, with the token redacted), the
+response (status, headers, body) and the latency observed when it was
+recorded. ``teh_ai.stub`` serves cassettes back over HTTP.
+
+Set ``TEH_AI_RECORD_CASSETTE=<file>`` to record every real call made through
+``ask_api``.
+"""
+import os
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from teh_ai.sink import JsonlSink, read_records
+
+REDACTED_HEADERS = {"authorization", "cookie", "set-cookie"}
+
+
+def _headers(headers):
+    return {k: ("<redacted>" if k.lower() in REDACTED_HEADERS else v) for k, v in headers.items()}
+
+
+def interaction_key(params):
+    """Match key for a request: message, conversationId and isAgenticApproach."""
+    return (params.get("message"), params.get("conversationId") or None,
+            str(params.get("isAgenticApproach", "false")).lower())
+
+
+class CassetteRecorder:
+    """Append real interactions to a cassette file (thread-safe)."""
+
+    def __init__(self, path):
+        self.sink = JsonlSink(path, fsync_every=1)
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get("TEH_AI_RECORD_CASSETTE")
+        return cls(path) if path else None
+
+    def record(self, response, latency):
+        """Record a ``requests`` or ``httpx`` response and the seconds it took."""
+        url = urlsplit(str(response.request.url))
+        self.sink.write({
+            "request": {
+                "method": response.request.method,
+                "path": url.path,
+                "params": dict(parse_qsl(url.query, keep_blank_values=True)),
+                "headers": _headers(response.request.headers),
+            },
+            "response": {
+                "status": response.status_code,
+                "headers": _headers(response.headers),
+                "body": response.text,
+            },
+            "latency": round(latency, 6),
+            "recorded_at": time.time(),
+        })
+
+    def close(self):
+        self.sink.close()
+
+
+def load_cassette(*paths):
+    """Return ``{interaction_key: [interaction, ...]}`` from one or more cassette files."""
+    interactions = {}
+    for path in paths:
+        for interaction in read_records(path):
+            key = interaction_key(interaction["request"]["params"])
+            interactions.setdefault(key, []).append(interaction)
+    return interactions
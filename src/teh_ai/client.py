@@ -0,0 +1,406 @@
+"""
+Pooled, keep-alive HTTP client for the /ask API.
+
+A single ``AskClient`` owns one ``requests.Session`` whose adapter keeps a pool
+of open connections to the API Gateway endpoint, so consecutive questions reuse
+the same TCP/TLS connection instead of paying a new handshake every time.
+Responses are negotiated compressed (every encoding urllib3 can decode here)
+and decoded with ``teh_ai.codec``; the stats report wire and decoded sizes.
+"""
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.request import ACCEPT_ENCODING
+
+from teh_ai import codec
+from teh_ai.cache import CacheMiss, cache_key
+from teh_ai.streaming import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_BUFFER, AnswerStream
+
+# Per-thread connection phase timings of the request in flight (nanoseconds).
+_local = threading.local()
+
+# Response headers API Gateway uses for its request id, in order of preference
+REQUEST_ID_HEADERS = ("x-amzn-RequestId", "apigw-requestid", "x-amz-apigw-id")
+# Pass as conversation_id to start a new conversation instead of the browser's one
+NEW_CONVERSATION = ""
+# Ask for server-sent events, but accept the regular JSON answer too
+STREAM_ACCEPT = "text/event-stream, application/json;q=0.9"
+
+
+def _reset_phases():
+    _local.phases = {"handshakes": 0, "dns_ns": 0, "connect_ns": 0, "tls_ns": 0}
+    return _local.phases
+
+
+def _phases():
+    phases = getattr(_local, "phases", None)
+    return phases if phases is not None else _reset_phases()
+
+
+def _ms(ns):
+    return round(ns / 1_000_000, 3)
+
+
+class _TimedConnectionMixin:
+    """Time DNS, TCP connect and TLS separately whenever a new connection is made."""
+
+    def _new_conn(self):
+        phases = _phases()
+        start = time.perf_counter_ns()
+        host = self._dns_host
+        try:
+            infos = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            infos = None    # let urllib3 raise its own NameResolutionError below
+        resolved = time.perf_counter_ns()
+        phases["dns_ns"] += resolved - start
+
+        try:
+            if infos:
+                # Connect to the address just resolved so DNS isn't timed twice
+                self._dns_host = infos[0][4][0]
+            try:
+                sock = super()._new_conn()
+            except NewConnectionError:
+                if not infos:
+                    raise
+                self._dns_host = host    # fall back to trying every address
+                sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        phases["connect_ns"] += time.perf_counter_ns() - resolved
+        return sock
+
+    def connect(self):
+        phases = _phases()
+        phases["handshakes"] += 1
+        before = phases["dns_ns"] + phases["connect_ns"]
+        start = time.perf_counter_ns()
+        super().connect()
+        total = time.perf_counter_ns() - start
+        # Whatever connect() spent beyond DNS + TCP is the TLS handshake (0 for http)
+        phases["tls_ns"] += max(0, total - (phases["dns_ns"] + phases["connect_ns"] - before))
+
+
+class _TrackedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that keeps connections alive and times new handshakes."""
+
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+
+
+class AskClient:
+    """Call the /ask API over a persistent connection pool.
+
+    Args:
+        base_url: Full URL of the /ask endpoint
+        token_provider: Callable returning the token dict from ``get_token``
+        pool_connections: Number of host pools to keep
+        pool_maxsize: Maximum open connections per host
+        keep_alive: Enable HTTP and TCP keep-alive on pooled sockets
+        verify: TLS verification flag passed to requests
+        timeout: Request timeout in seconds (None waits forever)
+        cache: Optional ``teh_ai.cache.ResponseCache`` consulted before the network
+        recorder: Optional ``teh_ai.cassette.CassetteRecorder`` that records every
+            real request and response
+        resilience: Optional ``teh_ai.resilience.Resilience`` that rate limits,
+            retries 429/5xx and connection errors, and circuit-breaks the endpoint
+    """
+
+    def __init__(self, base_url, token_provider, pool_connections=4, pool_maxsize=10,
+                 keep_alive=True, verify=False, timeout=None, cache=None, recorder=None,
+                 resilience=None):
+        self.base_url = base_url
+        self.token_provider = token_provider
+        self.cache = cache
+        self.recorder = recorder
+        self.resilience = resilience
+        self.verify = verify
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+
+        self.session = requests.Session()
+        adapter = PooledAdapter(
+            keep_alive=keep_alive,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if keep_alive:
+            self.session.headers["Connection"] = "keep-alive"
+        # gzip/deflate, plus br and zstd when brotli / zstandard are installed
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+        self._auth_token = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests_sent = 0
+        self.handshakes = 0
+
+    @property
+    def last_stats(self):
+        """Stats of the last request made by the calling thread."""
+        return getattr(self._local, "stats", None)
+
+    @property
+    def last_body(self):
+        """Decoded body bytes of the last answer fetched by the calling thread.
+
+        Pass it as ``raw`` to ``ResponseLogger.log_response`` to log the body
+        as received instead of re-encoding the parsed answer.
+        """
+        return getattr(self._local, "body", None)
+
+    def _auth(self):
+        """Return token data, rebuilding the auth header only when the token changes."""
+        token_data = self.token_provider()
+        token = token_data["access_token"]
+        if token != self._auth_token:
+            with self._lock:
+                self.session.headers["Authorization"] = f"Bearer {token}"
+                self._auth_token = token
+        return token_data
+
+    def build_params(self, token_data, question, conversation_id=None):
+        """Build the /ask query parameters for one question.
+
+        ``conversation_id`` None continues the browser's conversation from the
+        token data, ``NEW_CONVERSATION`` starts a new one, and any other value
+        continues that conversation.
+        """
+        params = {
+            "userId": token_data["user_id"],
+            "status": "true",
+            "message": question,
+            "isAgenticApproach": "false"
+        }
+        if conversation_id is None:
+            conversation_id = token_data.get("conversation_id")  # Can be None if new
+        if conversation_id:
+            params["conversationId"] = conversation_id
+        return params
+
+    def cache_lookup(self, question, conversation_id=None, use_cache=True):
+        """Consult the response cache before a request.
+
+        Returns ``(key, hit)``: ``key`` to pass to ``cache_store`` afterwards
+        (None when the cache does not apply) and ``hit``, the cached
+        ``(payload, stats)`` or None. New conversations are never cached, since
+        each must get its own conversationId, and neither are calls made with
+        ``use_cache=False``. Raises ``CacheMiss`` in replay-only mode when the
+        request would have to go to the network.
+        """
+        if self.cache is None:
+            return None, None
+        if conversation_id == NEW_CONVERSATION or not use_cache:
+            if self.cache.mode == "replay-only":
+                self._local.stats = {"cache": "miss"}
+                raise CacheMiss(f"{question!r} must go to the network (replay-only mode)")
+            return None, None
+        key = cache_key(self.base_url, question, conversation_id, "false")
+        if self.cache.reads:
+            cached, layer = self.cache.get(key)
+            if cached is not None:
+                return key, (cached["response"], {"status_code": cached["status_code"],
+                                                  "elapsed_seconds": 0.0, "cache": f"hit-{layer}"})
+            if self.cache.mode == "replay-only":
+                self._local.stats = {"cache": "miss"}
+                raise CacheMiss(f"No cached answer for {question!r} (replay-only mode)")
+        return key, None
+
+    def cache_store(self, key, payload, status_code, stats):
+        """Store a fetched answer under a ``cache_lookup`` key, when the cache writes."""
+        if key is not None and self.cache.writes:
+            self.cache.put(key, {"response": payload, "status_code": status_code})
+            stats["cache"] = "stored"
+
+    def ask(self, question, timeout=None, conversation_id=None, use_cache=True):
+        """Send one question and return ``(response_json, stats)``.
+
+        Raises ``requests.HTTPError`` for non-2xx responses; the stats for the
+        failed call are still available through ``last_stats``.
+
+        Besides status and connection reuse, the stats split the call into
+        phases (``phase_*_ms``): token fetch, DNS, TCP connect, TLS handshake,
+        time to first byte, body download and JSON decode, plus the API
+        Gateway ``request_id``, the ``content_encoding`` and the body size on
+        the wire (``wire_bytes``) and decoded (``body_bytes``). The phases describe the final attempt; with
+        ``resilience`` set, ``retries``, ``retry_wait_ms`` and
+        ``throttle_wait_ms`` are reported apart and ``end_to_end_ms`` covers
+        the whole call.
+
+        Args:
+            question: The question text
+            timeout: Per-call timeout in seconds, overriding the client default
+            conversation_id: Conversation to continue, or ``NEW_CONVERSATION``
+                (see ``build_params``)
+            use_cache: False bypasses the response cache, e.g. to time the API
+        """
+        # a call that fails before its attempt completes must not report the previous call's stats
+        self._local.stats = {}
+        self._local.body = None
+        key, hit = self.cache_lookup(question, conversation_id, use_cache)
+        if hit is not None:
+            self._local.stats = hit[1]
+            return hit
+
+        response, stats, started, sent, headers_at = self._send(question, timeout,
+                                                                conversation_id=conversation_id)
+        body = response.content    # download the body (stream=True stopped after the headers)
+        downloaded = time.perf_counter_ns()
+        stats["elapsed_seconds"] = round((downloaded - sent) / 1e9, 4)
+        stats["phase_download_ms"] = _ms(downloaded - headers_at)
+        stats["content_encoding"] = response.headers.get("Content-Encoding", "identity")
+        stats["wire_bytes"] = response.raw.tell()
+        stats["body_bytes"] = len(body)
+        self._local.body = body
+        if self.recorder is not None:
+            self.recorder.record(response, (downloaded - sent) / 1e9)
+
+        response.raise_for_status()
+        payload = codec.loads(body)
+        decoded = time.perf_counter_ns()
+        stats["phase_decode_ms"] = _ms(decoded - downloaded)
+        stats["phase_total_ms"] = _ms(decoded - started)
+        if "end_to_end_ms" in stats:
+            stats["end_to_end_ms"] = round(stats["end_to_end_ms"] + _ms(decoded - headers_at), 3)
+        self.cache_store(key, payload, response.status_code, stats)
+        return payload, stats
+
+    def ask_stream(self, question, timeout=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   max_buffer=DEFAULT_MAX_BUFFER, conversation_id=None):
+        """Send one question and return an ``AnswerStream`` over the answer text.
+
+        The call returns as soon as the response headers arrive; iterating the
+        stream yields the answer in pieces and records ``stream_ttft_ms`` and
+        the inter-chunk gaps into its stats. Streaming bypasses the response
+        cache and the cassette recorder; in replay-only cache mode it raises
+        ``CacheMiss`` without touching the network.
+
+        Raises ``requests.HTTPError`` for non-2xx responses without reading
+        the body.
+
+        Args:
+            question: The question text
+            timeout: Per-read timeout in seconds, overriding the client default
+            chunk_size: Largest piece read from the socket at a time
+            max_buffer: Characters of answer kept in memory (see ``AnswerStream``)
+            conversation_id: Conversation to continue (see ``build_params``)
+        """
+        self._local.stats = {}
+        self._local.body = None
+        if self.cache is not None and self.cache.mode == "replay-only":
+            self._local.stats = {"cache": "miss"}
+            raise CacheMiss(f"Streamed answers are not cached ({question!r}, replay-only mode)")
+        response, stats, _, sent, _ = self._send(question, timeout,
+                                                 headers={"Accept": STREAM_ACCEPT},
+                                                 conversation_id=conversation_id)
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        return AnswerStream(response, sent, stats, chunk_size=chunk_size, max_buffer=max_buffer)
+
+    def _send(self, question, timeout, headers=None, conversation_id=None):
+        """Send the request, with retries when ``resilience`` is set, until headers arrive.
+
+        Returns ``(response, stats, started_ns, sent_ns, headers_ns)`` of the
+        final attempt; the stats hold everything known up to its headers. A
+        retryable status that runs out of retries is returned as is.
+        """
+        resilience = self.resilience
+        if resilience is None:
+            return self._attempt(question, timeout, headers, conversation_id)
+
+        call_started = time.perf_counter_ns()
+        attempts = []
+
+        def send():
+            attempts.append(self._attempt(question, timeout, headers, conversation_id))
+            return attempts[-1][0]
+
+        _, waits = resilience.call(self.base_url, send, requests.RequestException)
+        result = attempts[-1]
+        result[1].update(waits, end_to_end_ms=_ms(result[4] - call_started))
+        return result
+
+    def _attempt(self, question, timeout, headers=None, conversation_id=None):
+        """Send the request once and return as soon as the headers are in."""
+        started = time.perf_counter_ns()
+        token_data = self._auth()
+        params = self.build_params(token_data, question, conversation_id)
+        phases = _reset_phases()
+
+        sent = time.perf_counter_ns()
+        response = self.session.get(self.base_url, params=params, verify=self.verify,
+                                    timeout=timeout if timeout is not None else self.timeout,
+                                    headers=headers, stream=True)
+        headers_at = time.perf_counter_ns()
+        handshakes = phases["handshakes"]
+        setup_ns = phases["dns_ns"] + phases["connect_ns"] + phases["tls_ns"]
+
+        stats = {
+            "status_code": response.status_code,
+            "connection_reused": handshakes == 0,
+            "new_handshakes": handshakes,
+            "request_id": next((response.headers[h] for h in REQUEST_ID_HEADERS
+                                if h in response.headers), None),
+            "phase_token_ms": _ms(sent - started),
+            "phase_dns_ms": _ms(phases["dns_ns"]),
+            "phase_connect_ms": _ms(phases["connect_ns"]),
+            "phase_tls_ms": _ms(phases["tls_ns"]),
+            "phase_ttfb_ms": _ms(max(0, headers_at - sent - setup_ns)),
+        }
+        self._local.stats = stats
+        with self._lock:
+            self.requests_sent += 1
+            self.handshakes += handshakes
+        return response, stats, started, sent, headers_at
+
+    def pool_stats(self):
+        """Return aggregate connection reuse counters for this client."""
+        with self._lock:
+            sent, handshakes = self.requests_sent, self.handshakes
+        return {
+            "requests_sent": sent,
+            "handshakes": handshakes,
+            "reuse_ratio": round(1 - handshakes / sent, 4) if sent else 0.0,
+        }
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
@@ -0,0 +1,46 @@
+"""
+JSON encoding and decoding on the hot paths: response bodies, the logged
+``Response`` column and JSONL sink lines.
+
+orjson is used when it is installed (several times faster in both
+directions); otherwise the standard library. Either way the output is compact
+UTF-8 JSON, and anything orjson refuses (non-string keys, integers beyond 64
+bits, ``NaN`` literals in old files) falls back to the standard library.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:     # optional speed-up
+    orjson = None
+
+
+def loads(data):
+    """Decode JSON from ``bytes`` or ``str``."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj, default=None):
+    """Encode to a compact JSON ``str`` (non-ASCII kept as is)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+
+def dumps_line(obj):
+    """Encode one JSONL line as UTF-8 ``bytes``, unknown types via ``str``."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+            + "\n").encode("utf-8")
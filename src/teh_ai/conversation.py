@@ -0,0 +1,230 @@
+"""
+Independent multi-turn conversations against the /ask API.
+
+A ``Conversation`` starts its own ``conversationId`` (instead of reusing the
+one in the browser's localStorage) and keeps asking follow-ups in it.
+``run_dialogues`` plays scripted dialogues in many conversations at once and
+``depth_report`` shows how turn latency grows with conversation depth and
+with the number of concurrent conversations.
+
+Dialogue files are JSON lists::
+
+    [
+      {"name": "rim", "turns": ["What is RIM?", "Tell me more about it"]},
+      ...
+    ]
+
+Usage::
+
+    python -m teh_ai.conversation tests/dialogues.json --sessions 1 2 4 --output depth.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from teh_ai.client import NEW_CONVERSATION
+from teh_ai.histogram import LatencyHistogram
+
+CONVERSATION_ID_KEYS = ("conversationId", "conversation_id", "conversationID")
+DEFAULT_CONCURRENCY = 4     # conversations in flight at once, like ask_many
+
+
+def extract_conversation_id(payload):
+    """The conversation id the API returned in an answer, or None."""
+    if not isinstance(payload, dict):
+        return None
+    for container in (payload, payload.get("data")):
+        if isinstance(container, dict):
+            for key in CONVERSATION_ID_KEYS:
+                if container.get(key):
+                    return str(container[key])
+    return None
+
+
+def load_dialogues(path):
+    """Read a dialogue file: a list of ``{"name": ..., "turns": [...]}`` objects."""
+    with open(path, encoding="utf-8") as f:
+        dialogues = json.load(f)
+    for i, dialogue in enumerate(dialogues):
+        if not dialogue.get("turns"):
+            raise ValueError(f"Dialogue {dialogue.get('name', i)!r} in {path} has no turns")
+        dialogue.setdefault("name", f"dialogue_{i}")
+    return dialogues
+
+
+class Conversation:
+    """One conversation with its own id, asked turn by turn.
+
+    Args:
+        client: ``AskClient`` to send the turns through
+        conversation_id: Existing conversation to continue (default: start a new one)
+    """
+
+    def __init__(self, client, conversation_id=None):
+        self.client = client
+        self.conversation_id = conversation_id
+        self.turns = 0
+        self.context_chars = 0
+
+    def ask(self, question, timeout=None):
+        """Ask the next turn; returns ``(payload, stats)`` like ``AskClient.ask``.
+
+        The stats gain ``conversation_id``, ``turn`` (1-based) and
+        ``context_chars``, the size of the questions and answers that came
+        before this turn.
+        """
+        context = self.context_chars
+        payload, stats = self.client.ask(question, timeout=timeout,
+                                         conversation_id=self.conversation_id or NEW_CONVERSATION)
+        if self.conversation_id is None:
+            self.conversation_id = extract_conversation_id(payload)
+            if self.conversation_id is None:
+                print("No conversationId in the answer; follow-up turns start new conversations")
+        self.turns += 1
+        answer = ""
+        if isinstance(payload, dict):
+            answer = payload.get("answer") or payload.get("message") or ""
+        self.context_chars += len(question) + len(str(answer))
+        stats.update(conversation_id=self.conversation_id, turn=self.turns,
+                     context_chars=context)
+        return payload, stats
+
+
+def _play(client, dialogue, session, timeout):
+    """Play one dialogue in a fresh conversation; one record per turn."""
+    conversation = Conversation(client)
+    records = []
+    for question in dialogue["turns"]:
+        start = time.perf_counter()
+        record = {"dialogue": dialogue["name"], "session": session, "turn": conversation.turns + 1,
+                  "question": question, "context_chars": conversation.context_chars}
+        try:
+            payload, stats = conversation.ask(question, timeout=timeout)
+        except Exception as e:
+            record.update(response={"error": str(e)}, stats=client.last_stats or {},
+                          error=str(e), execution_time=time.perf_counter() - start,
+                          conversation_id=conversation.conversation_id)
+            records.append(record)
+            break    # later turns would no longer be in context
+        record.update(response=payload, stats=stats, error=None,
+                      execution_time=time.perf_counter() - start,
+                      conversation_id=conversation.conversation_id)
+        records.append(record)
+    return records
+
+
+def run_dialogues(dialogues, sessions=1, timeout=None, client=None, concurrency=DEFAULT_CONCURRENCY):
+    """Play every dialogue in ``sessions`` parallel conversations each.
+
+    The ``len(dialogues) * sessions`` conversations run at most
+    ``concurrency`` at a time, every one with its own conversation id; turns
+    within a conversation are sequential. Returns one record per turn with
+    ``dialogue``, ``session``, ``turn``, ``question``, ``context_chars``,
+    ``conversation_id``, ``response``, ``stats``, ``error`` and
+    ``execution_time`` (so they can go straight to
+    ``ResponseLogger.log_results``), plus ``concurrent_conversations``, the
+    number of conversations that ran at once.
+
+    Args:
+        dialogues: Dialogues from ``load_dialogues``
+        sessions: Parallel conversations per dialogue
+        timeout: Per-turn timeout in seconds
+        client: ``AskClient`` to use (defaults to ``playwrt2.get_client()``)
+        concurrency: Conversations in flight at once
+    """
+    if client is None:
+        from teh_ai.playwrt2 import get_client
+        client = get_client()
+    jobs = [(dialogue, session) for dialogue in dialogues for session in range(sessions)]
+    workers = max(1, min(concurrency, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        played = list(pool.map(lambda job: _play(client, job[0], job[1], timeout), jobs))
+    records = [record for conversation in played for record in conversation]
+    for record in records:
+        record["concurrent_conversations"] = workers
+    return records
+
+
+def _slope(points):
+    """Least-squares slope of ``(x, y)`` points, or None with fewer than two distinct x."""
+    n = len(points)
+    if n < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+def depth_report(records):
+    """Summarise turn records by concurrency level and turn depth.
+
+    For every ``concurrent_conversations`` level: latency percentiles and mean
+    context size per turn, the error count, and ``seconds_per_turn`` /
+    ``seconds_per_kchar``, the fitted latency growth per extra turn and per
+    1000 characters of context.
+    """
+    levels = {}
+    for record in records:
+        levels.setdefault(record.get("concurrent_conversations", 1), []).append(record)
+
+    report = {}
+    for level, rows in sorted(levels.items()):
+        by_turn = {}
+        for row in rows:
+            by_turn.setdefault(row["turn"], []).append(row)
+        turns = {}
+        for turn, turn_rows in sorted(by_turn.items()):
+            histogram = LatencyHistogram()
+            ok = [r for r in turn_rows if r["error"] is None]
+            for r in ok:
+                histogram.record(r["execution_time"])
+            turns[turn] = {
+                "requests": len(turn_rows),
+                "errors": len(turn_rows) - len(ok),
+                "mean_context_chars": round(sum(r["context_chars"] for r in turn_rows)
+                                            / len(turn_rows)),
+                "latency": histogram.summary(),
+            }
+        ok = [r for r in rows if r["error"] is None]
+        per_turn = _slope([(r["turn"], r["execution_time"]) for r in ok])
+        per_char = _slope([(r["context_chars"], r["execution_time"]) for r in ok])
+        report[level] = {
+            "conversations": len({(r["dialogue"], r["session"]) for r in rows}),
+            "errors": len(rows) - len(ok),
+            "seconds_per_turn": round(per_turn, 4) if per_turn is not None else None,
+            "seconds_per_kchar": round(per_char * 1000, 4) if per_char is not None else None,
+            "turns": turns,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.conversation",
+                                     description="Scripted multi-turn dialogues against /ask.")
+    parser.add_argument("dialogues", help="dialogue JSON file")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1],
+                        help="parallel conversations per dialogue; several values sweep them")
+    parser.add_argument("--timeout", type=float, help="per-turn timeout in seconds")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="conversations in flight at once")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    dialogues = load_dialogues(args.dialogues)
+    records = []
+    for sessions in args.sessions:
+        records.extend(run_dialogues(dialogues, sessions=sessions, timeout=args.timeout,
+                                     concurrency=args.concurrency))
+    report = depth_report(records)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
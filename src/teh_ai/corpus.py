@@ -0,0 +1,227 @@
+"""
+Lazily streamed question corpora.
+
+Questions are read one at a time from CSV, JSONL (optionally ``.gz``/``.zst``)
+or Parquet, so a corpus of 100k questions can be filtered, sampled and
+sharded without ever being loaded into memory as a whole. Every item is a
+dict::
+
+    {"id": "15", "question_id": "3f2a9c0d1b7e", "question": "...",
+     "doc_type": "sharepoint", "tags": ["binder"]}
+
+``id`` is the source row id (or the line number when the file has none);
+``question_id`` is derived from the normalised question text, so it is the
+same in every corpus, run and shard.
+
+Column names are matched case-insensitively: ``question`` (or ``message``),
+``id``, ``doc_type`` and ``tags`` (a list, or a ``,``/``;`` separated string).
+"""
+import csv
+import hashlib
+import heapq
+import re
+from itertools import islice
+from pathlib import Path
+
+FORMATS = ("csv", "jsonl", "parquet")
+QUESTION_COLUMNS = ("question", "message")
+
+
+def normalize_question(text):
+    """Case- and whitespace-insensitive form of a question, used for ids and dedupe."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def question_id(text):
+    """Stable short id for a question, independent of case and spacing."""
+    return hashlib.sha1(normalize_question(text).encode("utf-8")).hexdigest()[:12]
+
+
+def _unit(seed, qid):
+    """Deterministic value in [0, 1) for a question under a seed."""
+    digest = hashlib.sha1(f"{seed}:{qid}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def corpus_format(path):
+    """``csv``, ``jsonl`` or ``parquet`` from a file name (compression suffixes ignored)."""
+    suffixes = [s.lower() for s in Path(path).suffixes if s.lower() not in (".gz", ".zst")]
+    suffix = suffixes[-1] if suffixes else ""
+    if suffix in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if suffix in (".parquet", ".pq"):
+        return "parquet"
+    if suffix == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the corpus format of {path}, expected one of {FORMATS}")
+
+
+def read_rows(path, encoding=None, batch_size=10_000):
+    """Yield the raw rows (dicts) of a CSV, JSONL or Parquet file one at a time."""
+    fmt = corpus_format(path)
+    if fmt == "csv":
+        with open(path, newline="", encoding=encoding or "latin1") as f:
+            yield from csv.DictReader(f)
+    elif fmt == "jsonl":
+        from teh_ai.sink import read_records
+        yield from read_records(path)
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet corpora require pyarrow: pip install pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+
+
+def _tags(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(t).strip() for t in value if str(t).strip()]
+    return [t.strip() for t in re.split(r"[,;]", str(value)) if t.strip()]
+
+
+def _item(row, line):
+    fields = {str(k).strip().lower(): v for k, v in row.items()}
+    question = next((fields[c] for c in QUESTION_COLUMNS if fields.get(c)), None)
+    if question is None:
+        return None
+    doc_type = fields.get("doc_type")
+    row_id = fields.get("id")
+    return {
+        "id": str(row_id) if row_id not in (None, "") else str(line),
+        "question_id": question_id(question),
+        "question": str(question),
+        "doc_type": str(doc_type).strip() if doc_type not in (None, "") else None,
+        "tags": _tags(fields.get("tags")),
+    }
+
+
+def iter_corpus(path, doc_types=None, tags=None, dedupe=True, encoding=None, batch_size=10_000):
+    """Yield corpus items from a CSV, JSONL or Parquet file one at a time.
+
+    Args:
+        path: Corpus file
+        doc_types: Keep only these ``doc_type`` values (case-insensitive)
+        tags: Keep only items carrying at least one of these tags
+        dedupe: Drop questions whose normalised text was already yielded
+        encoding: Text encoding of CSV files (default ``latin1``, like the
+            shipped ``test_questions.csv``)
+        batch_size: Rows per Parquet record batch
+    """
+    wanted_types = {t.lower() for t in doc_types} if doc_types else None
+    wanted_tags = {t.lower() for t in tags} if tags else None
+    seen = set()
+    for line, row in enumerate(read_rows(path, encoding, batch_size), start=1):
+        item = _item(row, line)
+        if item is None:
+            continue
+        if wanted_types is not None and (item["doc_type"] or "").lower() not in wanted_types:
+            continue
+        if wanted_tags is not None and not wanted_tags & {t.lower() for t in item["tags"]}:
+            continue
+        if dedupe:
+            if item["question_id"] in seen:
+                continue
+            seen.add(item["question_id"])
+        yield item
+
+
+def shard(items, index, count):
+    """Keep the items of shard ``index`` out of ``count``, by question id.
+
+    The assignment only depends on the question text, so every process
+    computes the same shards without coordinating.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} out of range for {count} shard(s)")
+    for item in items:
+        if int(item["question_id"], 16) % count == index:
+            yield item
+
+
+def sample_fraction(items, fraction, seed=0):
+    """Stream a seeded Bernoulli sample keeping about ``fraction`` of the items.
+
+    Each item is kept or dropped by a hash of the seed and its question id,
+    so the same question is always picked for the same seed, and every
+    ``doc_type`` keeps about the same share (stratified in expectation).
+    """
+    for item in items:
+        if _unit(seed, item["question_id"]) < fraction:
+            yield item
+
+
+def sample(items, n, seed=0, stratify=None):
+    """Seeded sample of ``n`` items in one pass, in corpus order.
+
+    Memory is bounded by ``n`` (per stratum when stratifying).
+
+    Args:
+        items: Corpus items
+        n: Sample size (per stratum when ``stratify`` is set)
+        seed: Seed; the same seed and corpus give the same sample
+        stratify: Item key to stratify on, e.g. ``"doc_type"``
+    """
+    # Bottom-n by seeded hash is a uniform random sample (a keyed reservoir)
+    reservoirs = {}
+    for position, item in enumerate(items):
+        stratum = item.get(stratify) if stratify else None
+        heap = reservoirs.setdefault(stratum, [])
+        key = -_unit(seed, item["question_id"])
+        if len(heap) < n:
+            heapq.heappush(heap, (key, position, item))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, position, item))
+    chosen = [entry for heap in reservoirs.values() for entry in heap]
+    return [item for _, _, item in sorted(chosen, key=lambda entry: entry[1])]
+
+
+class Corpus:
+    """A corpus file plus filters, sampling and sharding, re-read on every iteration.
+
+    Args:
+        path: CSV, JSONL or Parquet file
+        doc_types, tags, dedupe, encoding: See ``iter_corpus``
+        fraction: Keep about this share of the questions (``sample_fraction``)
+        limit: Keep a seeded sample of this many questions (``sample``);
+            per ``stratify`` value when that is set
+        stratify: Item key to stratify ``limit`` on, e.g. ``"doc_type"``
+        seed: Seed for ``fraction`` and ``limit``
+        shard_index, shard_count: Keep one shard of the corpus (``shard``)
+    """
+
+    def __init__(self, path, doc_types=None, tags=None, dedupe=True, encoding=None,
+                 fraction=None, limit=None, stratify=None, seed=0, shard_index=0,
+                 shard_count=1):
+        self.path = Path(path)
+        self.doc_types = doc_types
+        self.tags = tags
+        self.dedupe = dedupe
+        self.encoding = encoding
+        self.fraction = fraction
+        self.limit = limit
+        self.stratify = stratify
+        self.seed = seed
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def __iter__(self):
+        items = iter_corpus(self.path, self.doc_types, self.tags, self.dedupe, self.encoding)
+        if self.shard_count > 1:
+            items = shard(items, self.shard_index, self.shard_count)
+        if self.fraction is not None:
+            items = sample_fraction(items, self.fraction, self.seed)
+        if self.limit is not None:
+            items = iter(sample(items, self.limit, self.seed, self.stratify))
+        return items
+
+    def questions(self):
+        """Iterate over the question texts only."""
+        return (item["question"] for item in self)
+
+    def head(self, n):
+        """The first ``n`` items."""
+        return list(islice(self, n))
+
@@ -0,0 +1,212 @@
+"""
+Golden-answer index for answer drift detection across runs.
+
+Every question id keeps one golden answer per environment, stored as a
+64-value MinHash signature of its word 3-shingles in a sqlite file. The index
+of the active environment is held in memory, so checking a new answer costs
+one signature plus a vectorised comparison (microseconds), and the estimated
+Jaccard similarity below ``threshold`` flags the answer as drifted.
+
+The index grows incrementally: at the end of a run the logged records of that
+run are folded in, adding golden answers for questions seen for the first
+time (or replacing them all with ``rebase=True``). Old runs are never re-read;
+``python -m teh_ai.drift`` seeds the index from logged JSONL streams::
+
+    python -m teh_ai.drift test_results/api_responses_*.jsonl --env qa
+"""
+import argparse
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from teh_ai.corpus import question_id
+from teh_ai.evaluation import TOKEN_RE, answer_text
+from teh_ai.history import answer_hash
+
+DEFAULT_INDEX_PATH = "test_results/golden_index.sqlite"
+DEFAULT_THRESHOLD = 0.5
+NUM_PERM = 64
+SHINGLE_SIZE = 3
+_PRIME = (1 << 31) - 1
+
+
+@functools.lru_cache(maxsize=None)
+def _permutations():
+    """Fixed hash permutations, so signatures stay comparable across processes and runs."""
+    import numpy as np
+
+    rng = np.random.default_rng(20240611)
+    return (rng.integers(1, _PRIME, size=(NUM_PERM, 1), dtype=np.uint64),
+            rng.integers(0, _PRIME, size=(NUM_PERM, 1), dtype=np.uint64))
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hashes of the word ``size``-grams of a text (the words themselves when shorter)."""
+    import numpy as np
+
+    words = TOKEN_RE.findall(str(text).lower())
+    if len(words) < size:
+        grams = words
+    else:
+        grams = (" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return np.fromiter({zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams}, dtype=np.uint64)
+
+
+def signature(text):
+    """MinHash signature (``NUM_PERM`` uint32 values) of a text; None when it has no words."""
+    import numpy as np
+
+    hashes = shingles(text)
+    if not hashes.size:
+        return None
+    a, b = _permutations()
+    return ((a * hashes + b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float((a == b).sum()) / NUM_PERM
+
+
+class DriftIndex:
+    """Golden answers of one environment, checked in memory and persisted in sqlite.
+
+    Args:
+        path: sqlite file shared by every environment
+        environment: Environment label the golden answers belong to
+        threshold: Similarity below which an answer counts as drifted
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, environment="default", threshold=DEFAULT_THRESHOLD):
+        self.path = path
+        self.environment = environment
+        self.threshold = threshold
+        self.checked = 0
+        self.drifted = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS golden ("
+            " env TEXT NOT NULL, question_id TEXT NOT NULL, query TEXT, answer_hash TEXT NOT NULL,"
+            " signature BLOB NOT NULL, run_id TEXT, updated REAL NOT NULL,"
+            " PRIMARY KEY (env, question_id))"
+        )
+        self._db.commit()
+
+        import numpy as np
+
+        self._golden = {
+            qid: (digest, np.frombuffer(blob, dtype=np.uint32), run_id)
+            for qid, digest, blob, run_id in self._db.execute(
+                "SELECT question_id, answer_hash, signature, run_id FROM golden WHERE env = ?",
+                (environment,))
+        }
+
+    @classmethod
+    def from_env(cls, environment):
+        """Build the index when ``TEH_AI_DRIFT=1`` or ``TEH_AI_DRIFT_INDEX`` is set, else None."""
+        path = os.environ.get("TEH_AI_DRIFT_INDEX")
+        if not path and os.environ.get("TEH_AI_DRIFT") != "1":
+            return None
+        return cls(path or DEFAULT_INDEX_PATH, environment,
+                   float(os.environ.get("TEH_AI_DRIFT_THRESHOLD", DEFAULT_THRESHOLD)))
+
+    def __len__(self):
+        return len(self._golden)
+
+    def check(self, question, response):
+        """Compare an answer with the golden one.
+
+        Returns ``{}`` when the question has no golden answer yet (or the
+        answer is empty), else ``drift_similarity``, ``drifted`` and the
+        ``golden_run_id`` the golden answer came from.
+        """
+        golden = self._golden.get(question_id(question))
+        text = answer_text(response)
+        if golden is None or not text.strip():
+            return {}
+        digest, golden_signature, run_id = golden
+        if answer_hash(text) == digest:
+            score = 1.0
+        else:
+            current = signature(text)
+            score = 0.0 if current is None else similarity(current, golden_signature)
+        drifted = score < self.threshold
+        with self._lock:
+            self.checked += 1
+            self.drifted += drifted
+        return {"drift_similarity": round(score, 4), "drifted": drifted, "golden_run_id": run_id}
+
+    def update(self, records, run_id, rebase=False):
+        """Fold one run's logger records into the index; returns the golden answers written.
+
+        Only successful answers count. A question already in the index keeps
+        its golden answer unless ``rebase`` is set, in which case this run's
+        answer replaces it.
+        """
+        rows = {}
+        for record in records:
+            if (record.get("Status_Code") or 0) >= 400:
+                continue
+            response = record.get("Response")
+            try:
+                response = json.loads(response)
+            except (TypeError, ValueError):
+                pass
+            text = answer_text(response)
+            current = signature(text)
+            qid = question_id(record.get("Query"))
+            if current is None or (not rebase and (qid in self._golden or qid in rows)):
+                continue
+            rows[qid] = (record.get("Query"), answer_hash(text), current)
+
+        now = time.time()
+        verb = "INSERT OR REPLACE" if rebase else "INSERT OR IGNORE"
+        with self._lock:
+            self._db.executemany(
+                f"{verb} INTO golden (env, question_id, query, answer_hash, signature, run_id, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.environment, qid, query, digest, current.tobytes(), run_id, now)
+                 for qid, (query, digest, current) in rows.items()])
+            self._db.commit()
+            for qid, (_, digest, current) in rows.items():
+                self._golden[qid] = (digest, current, run_id)
+        return len(rows)
+
+    def summary(self):
+        with self._lock:
+            return {"environment": self.environment, "golden_answers": len(self._golden),
+                    "checked": self.checked, "drifted": self.drifted, "threshold": self.threshold}
+
+    def close(self):
+        self._db.close()
+
+
+def main(argv=None):
+    from teh_ai.sink import read_records
+
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.drift",
+                                     description="Add logged runs to the golden-answer index.")
+    parser.add_argument("streams", nargs="+", help="api_responses_<run_id>.jsonl files, oldest first")
+    parser.add_argument("--env", required=True, help="environment label, e.g. qa")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="sqlite index file")
+    parser.add_argument("--rebase", action="store_true",
+                        help="replace existing golden answers with these runs' answers")
+    args = parser.parse_args(argv)
+
+    index = DriftIndex(args.index, args.env)
+    for path in args.streams:
+        run_id = os.path.basename(path).split(".")[0].removeprefix("api_responses_")
+        print(f"{path}: {index.update(read_records(path), run_id, rebase=args.rebase)} golden answers")
+    print(json.dumps(index.summary()))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
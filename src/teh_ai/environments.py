@@ -0,0 +1,243 @@
+"""
+Environment profiles and cross-environment comparison.
+
+A profile ties together the /ask endpoint, the web app whose localStorage
+holds the token, and where the token comes from. Every environment keeps its
+own token cache file, so switching between dev and qa never hands one
+environment the other's token. The default profile keeps the original
+``token_cache.json``, so existing signed-in caches stay valid.
+
+``TEH_AI_ENV`` picks the active profile for the suite (default ``qa``).
+``TEH_AI_ENV_FILE`` points at a JSON file of extra or overriding profiles::
+
+    {"uat": {"api_base_url": "https://.../uat/v2/ask", "app_url": "https://uat.taskly.lilly.com/"}}
+
+Token sources:
+
+* ``browser`` - read ``token``/``userId``/``conversationId`` from the app's
+  localStorage through the shared browser session (default)
+* ``static``  - use ``TEH_AI_TOKEN_<NAME>`` (or ``TEH_AI_TOKEN``) and
+  ``TEH_AI_USER_ID_<NAME>`` (or ``TEH_AI_USER_ID``), e.g. for the stub server
+
+``compare_environments`` fans the same questions out to several environments
+at once and lines up their latencies and answers::
+
+    python -m teh_ai.environments --env dev --env qa --csv tests/test_questions.csv --output env_diff.xlsx
+"""
+import argparse
+import difflib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from teh_ai.histogram import LatencyHistogram
+from teh_ai.history import answer_hash
+
+DEFAULT_ENV = "qa"
+DEFAULT_TOKEN_FILE = "token_cache.json"    # the default profile's cache from before profiles existed
+TOKEN_SOURCES = ("browser", "static")
+
+PROFILES = {
+    "dev": {
+        "api_base_url": "https://3exg2qgqb3-vpce-069388414a9f87f40.execute-api.us-east-2.amazonaws.com/dev/v2/ask",
+        "app_url": "https://dev.taskly.lilly.com/",
+    },
+    "qa": {
+        "api_base_url": "https://k77ornbz5e-vpce-058757a9c034d181c.execute-api.us-east-2.amazonaws.com/qa/v2/ask",
+        "app_url": "https://qa.taskly.lilly.com/",
+    },
+}
+
+
+class Environment:
+    """One deployment of the app and its /ask API.
+
+    Args:
+        name: Profile name (``dev``, ``qa``, ...)
+        api_base_url: Full URL of the /ask endpoint
+        app_url: Web app whose localStorage holds the token
+        token_source: One of ``TOKEN_SOURCES``
+        token_file: Token cache file (defaults to ``token_cache.json`` for the
+            default profile and ``token_cache_<name>.json`` for the others)
+    """
+
+    def __init__(self, name, api_base_url, app_url, token_source="browser", token_file=None):
+        if token_source not in TOKEN_SOURCES:
+            raise ValueError(f"Unknown token source {token_source!r}, expected one of {TOKEN_SOURCES}")
+        self.name = name
+        self.api_base_url = api_base_url
+        self.app_url = app_url
+        self.token_source = token_source
+        self.token_file = token_file or (DEFAULT_TOKEN_FILE if name == DEFAULT_ENV
+                                         else f"token_cache_{name}.json")
+
+    @property
+    def app_origin(self):
+        """``scheme://host`` of the app, the localStorage origin holding the token."""
+        parts = urlsplit(self.app_url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def static_token(self):
+        """``(token, user_id)`` for the static token source; token is None when unset."""
+        suffix = self.name.upper().replace("-", "_")
+        token = os.environ.get(f"TEH_AI_TOKEN_{suffix}") or os.environ.get("TEH_AI_TOKEN")
+        user_id = os.environ.get(f"TEH_AI_USER_ID_{suffix}") or \
+            os.environ.get("TEH_AI_USER_ID", "stub-user")
+        return token, user_id
+
+    def __repr__(self):
+        return f"Environment({self.name!r}, {self.api_base_url!r})"
+
+
+def load_profiles(path=None):
+    """Built-in profiles merged with the JSON file at ``path`` (or ``TEH_AI_ENV_FILE``)."""
+    profiles = {name: dict(profile) for name, profile in PROFILES.items()}
+    path = path or os.environ.get("TEH_AI_ENV_FILE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for name, profile in json.load(f).items():
+                profiles.setdefault(name, {}).update(profile)
+    return profiles
+
+
+def get_environment(name=None, profiles=None):
+    """Build the ``Environment`` for a profile name (default ``TEH_AI_ENV`` or ``qa``).
+
+    For the active profile, ``TEH_AI_API_BASE_URL`` overrides the endpoint and
+    a set ``TEH_AI_TOKEN`` switches the token source to ``static``.
+    """
+    active = os.environ.get("TEH_AI_ENV", DEFAULT_ENV)
+    name = name or active
+    profiles = profiles if profiles is not None else load_profiles()
+    if name not in profiles:
+        raise KeyError(f"Unknown environment {name!r}, expected one of {sorted(profiles)}")
+    profile = dict(profiles[name])
+    if name == active:
+        profile["api_base_url"] = os.environ.get("TEH_AI_API_BASE_URL", profile["api_base_url"])
+        if os.environ.get("TEH_AI_TOKEN"):
+            profile["token_source"] = "static"
+    elif os.environ.get(f"TEH_AI_TOKEN_{name.upper().replace('-', '_')}"):
+        profile["token_source"] = "static"
+    return Environment(name, **profile)
+
+
+def _similarity(a, b):
+    """0..1 similarity of two answers (1.0 when identical)."""
+    if a == b:
+        return 1.0
+    return round(difflib.SequenceMatcher(None, str(a), str(b), autojunk=False).ratio(), 4)
+
+
+def _answer(result):
+    response = result["response"]
+    if isinstance(response, dict):
+        return response.get("answer") or response.get("message") or response.get("error") or ""
+    return str(response)
+
+
+def compare_environments(questions, environments, concurrency=4, baseline=None):
+    """Ask every question in every environment in parallel and diff the results.
+
+    Args:
+        questions: Question strings
+        environments: Environment names (or ``Environment`` objects)
+        concurrency: Questions in flight per environment
+        baseline: Environment the others are compared with (default: the first)
+
+    Returns ``(rows, summary)``: one row per question with each environment's
+    latency, status and answer side by side plus the latency delta and answer
+    similarity against the baseline, and per-environment latency percentiles
+    and error counts.
+    """
+    from teh_ai.playwrt2 import get_client
+    from teh_ai.runner import ask_many
+
+    environments = [env if isinstance(env, Environment) else get_environment(env)
+                    for env in environments]
+    names = [env.name for env in environments]
+    baseline = baseline or names[0]
+    questions = list(questions)
+
+    with ThreadPoolExecutor(max_workers=len(environments)) as pool:
+        futures = {env.name: pool.submit(ask_many, questions, concurrency=concurrency,
+                                         client=get_client(env))
+                   for env in environments}
+        results = {name: future.result() for name, future in futures.items()}
+
+    rows = []
+    for i, question in enumerate(questions):
+        row = {"Question": question}
+        base = results[baseline][i]
+        for name in names:
+            result = results[name][i]
+            row[f"{name}_Latency_Seconds"] = round(result["execution_time"], 3)
+            row[f"{name}_Status"] = result["stats"].get("status_code") or \
+                ("error" if result["error"] else None)
+            row[f"{name}_Answer"] = _answer(result)
+        for name in names:
+            if name == baseline:
+                continue
+            result = results[name][i]
+            row[f"{name}_Latency_Delta_Seconds"] = round(result["execution_time"]
+                                                         - base["execution_time"], 3)
+            row[f"{name}_Same_Answer"] = answer_hash(_answer(result)) == answer_hash(_answer(base))
+            row[f"{name}_Similarity"] = _similarity(_answer(base), _answer(result))
+        rows.append(row)
+
+    summary = {}
+    for name in names:
+        histogram = LatencyHistogram()
+        for result in results[name]:
+            if result["error"] is None:
+                histogram.record(result["execution_time"])
+        summary[name] = {
+            "api_base_url": next(env.api_base_url for env in environments if env.name == name),
+            "errors": sum(result["error"] is not None for result in results[name]),
+            "latency": histogram.summary(),
+        }
+        if name != baseline:
+            summary[name]["changed_answers"] = sum(not row[f"{name}_Same_Answer"] for row in rows)
+    return rows, summary
+
+
+def save_report(rows, summary, path):
+    """Write the side-by-side rows (``Comparison``) and summary (``Summary``) to Excel."""
+    import pandas as pd
+
+    summary_rows = [{"Environment": name, "Api_Base_Url": s["api_base_url"], "Errors": s["errors"],
+                     "Changed_Answers": s.get("changed_answers"),
+                     **{f"Latency_{k}": v for k, v in s["latency"].items()}}
+                    for name, s in summary.items()]
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(summary_rows).to_excel(writer, sheet_name="Summary", index=False)
+        pd.DataFrame(rows).to_excel(writer, sheet_name="Comparison", index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.environments",
+                                     description="Compare /ask latency and answers across environments.")
+    parser.add_argument("--env", action="append", required=True,
+                        help="environment profile (repeat; the first is the baseline)")
+    parser.add_argument("--question", action="append", help="question to send (repeatable)")
+    parser.add_argument("--csv", help="question corpus (CSV, JSONL or Parquet)")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions in flight per environment")
+    parser.add_argument("--output", help="write the comparison workbook (.xlsx) to this file")
+    args = parser.parse_args(argv)
+
+    questions = list(args.question or [])
+    if args.csv:
+        from teh_ai.corpus import iter_corpus
+        questions.extend(item["question"] for item in iter_corpus(args.csv))
+    if not questions:
+        parser.error("give at least one --question or a --csv file")
+
+    rows, summary = compare_environments(questions, args.env, concurrency=args.concurrency)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        print("Comparison written to", save_report(rows, summary, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Asynchronous answer scoring off the request path.
+
+``Evaluator.submit`` only puts a completed response on a queue; a dispatcher
+thread groups queued responses into batches and scores every batch in a
+``ProcessPoolExecutor``, so scoring never slows the request loop down and
+CPU-heavy scorers don't fight the request threads for the GIL. Finished
+scores are handed to ``on_scores`` (``ResponseLogger.log_scores`` writes
+them next to the responses).
+
+Scorers are pluggable: pass built-in names or ``"package.module:Class"``
+paths. A scorer has a ``name`` and ``score_batch(items, golden)`` returning
+one dict of scores per item. Built-ins:
+
+* ``format``     - answer length, word count, empty/error answers, numbered steps
+* ``keywords``   - share of the golden entry's ``keywords`` found in the answer
+* ``similarity`` - TF-IDF cosine similarity against the golden answer,
+  computed for a whole batch at once with NumPy
+
+Golden answers (``TEH_AI_GOLDEN``) are a CSV/JSONL/Parquet corpus with
+``question``, ``answer`` and optional ``keywords`` columns, loaded once per
+worker process.
+"""
+import importlib
+import math
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from teh_ai.corpus import question_id, read_rows
+
+DEFAULT_SCORERS = ("format", "keywords", "similarity")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STEP_RE = re.compile(r"(?m)^\s*(?:\d+[.)]|step\s+\d+|[-*•])\s+", re.IGNORECASE)
+
+
+def answer_text(response):
+    """The answer string of an /ask response (dict or already-serialised text)."""
+    if isinstance(response, dict):
+        value = response.get("answer") or response.get("message") or ""
+        return value if isinstance(value, str) else str(value)
+    return "" if response is None else str(response)
+
+
+def _tokens(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class GoldenSet:
+    """Golden answers keyed by question id, with a TF-IDF model fitted on them.
+
+    Args:
+        entries: Dicts with ``question``, ``answer`` and optional ``keywords``
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        for entry in entries:
+            keywords = entry.get("keywords") or []
+            if isinstance(keywords, str):
+                keywords = [k.strip() for k in re.split(r"[,;]", keywords) if k.strip()]
+            self.entries[question_id(entry["question"])] = {
+                "answer": str(entry.get("answer") or ""), "keywords": list(keywords)}
+
+        # IDF over the golden answers; each golden answer kept as a sparse unit vector
+        documents = {qid: Counter(_tokens(e["answer"])) for qid, e in self.entries.items()}
+        df = Counter(term for counts in documents.values() for term in counts)
+        self.vocabulary = {term: i for i, term in enumerate(sorted(df))}
+        n = len(documents)
+        self.idf = [math.log((1 + n) / (1 + df[term])) + 1 for term in sorted(df)]
+        self.vectors = {qid: self._sparse(counts) for qid, counts in documents.items()}
+
+    @classmethod
+    def load(cls, path):
+        """Read golden answers from a CSV, JSONL or Parquet file."""
+        entries = []
+        for row in read_rows(path):
+            fields = {str(k).strip().lower(): v for k, v in row.items()}
+            if fields.get("question"):
+                entries.append(fields)
+        return cls(entries)
+
+    def _sparse(self, counts):
+        pairs = [(self.vocabulary[t], c * self.idf[self.vocabulary[t]])
+                 for t, c in counts.items() if t in self.vocabulary]
+        norm = math.sqrt(sum(v * v for _, v in pairs)) or 1.0
+        return [i for i, _ in pairs], [v / norm for _, v in pairs]
+
+    def get(self, question):
+        return self.entries.get(question_id(question))
+
+    def vector(self, question):
+        return self.vectors.get(question_id(question))
+
+
+class FormatScorer:
+    """Answer length, word count, empty/error answers and numbered steps."""
+
+    name = "format"
+
+    def score_batch(self, items, golden):
+        scores = []
+        for item in items:
+            text = item["answer"]
+            status = item.get("status_code", 200)
+            scores.append({
+                "answer_chars": len(text),
+                "answer_words": len(text.split()),
+                "empty_answer": not text.strip(),
+                # status 0 (or None): the call never got a response
+                "error_answer": bool(item.get("error")) or not status or status >= 400,
+                "numbered_steps": len(STEP_RE.findall(text)),
+            })
+        return scores
+
+
+class KeywordScorer:
+    """Share of the golden entry's keywords that appear in the answer."""
+
+    name = "keywords"
+
+    def score_batch(self, items, golden):
+        scores = []
+        for item in items:
+            entry = golden.get(item["question"])
+            keywords = entry["keywords"] if entry else []
+            if not keywords:
+                scores.append({"keyword_coverage": None, "missing_keywords": None})
+                continue
+            text = item["answer"].lower()
+            missing = [k for k in keywords if k.lower() not in text]
+            scores.append({"keyword_coverage": round(1 - len(missing) / len(keywords), 4),
+                           "missing_keywords": ", ".join(missing)})
+        return scores
+
+
+class SimilarityScorer:
+    """TF-IDF cosine similarity against the golden answer, one NumPy pass per batch."""
+
+    name = "similarity"
+
+    def score_batch(self, items, golden):
+        import numpy as np
+
+        rows = [(i, golden.vector(item["question"])) for i, item in enumerate(items)]
+        rows = [(i, vector) for i, vector in rows if vector is not None and vector[0]]
+        scores = [{"golden_similarity": None} for _ in items]
+        if not rows:
+            return scores
+
+        # One dense (batch x vocabulary) matrix for the answers and one for their
+        # golden answers, then a row-wise dot product of the unit vectors
+        size = len(golden.vocabulary)
+        answers = np.zeros((len(rows), size), dtype=np.float32)
+        targets = np.zeros((len(rows), size), dtype=np.float32)
+        idf = np.asarray(golden.idf, dtype=np.float32)
+        for r, (i, (indices, values)) in enumerate(rows):
+            targets[r, indices] = values
+            for term, count in Counter(_tokens(items[i]["answer"])).items():
+                column = golden.vocabulary.get(term)
+                if column is not None:
+                    answers[r, column] = count
+        answers *= idf
+        norms = np.linalg.norm(answers, axis=1, keepdims=True)
+        answers /= np.where(norms == 0, 1, norms)
+        similarity = np.einsum("ij,ij->i", answers, targets)
+        for r, (i, _) in enumerate(rows):
+            scores[i]["golden_similarity"] = round(float(similarity[r]), 4)
+        return scores
+
+
+BUILTIN_SCORERS = {cls.name: cls for cls in (FormatScorer, KeywordScorer, SimilarityScorer)}
+
+
+def load_scorer(spec):
+    """Instantiate a scorer from a built-in name or a ``"module:Class"`` path."""
+    if spec in BUILTIN_SCORERS:
+        return BUILTIN_SCORERS[spec]()
+    module, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown scorer {spec!r}; use one of {sorted(BUILTIN_SCORERS)} "
+                         "or 'package.module:Class'")
+    return getattr(importlib.import_module(module), attr)()
+
+
+# Per worker process: scorers and golden set, built once by _init_worker
+_worker = {}
+
+
+def _init_worker(golden_path, scorer_specs):
+    _worker["golden"] = GoldenSet.load(golden_path) if golden_path else GoldenSet()
+    _worker["scorers"] = [load_scorer(spec) for spec in scorer_specs]
+
+
+def score_batch(items):
+    """Score one batch in a worker process; one dict per item incl. its ``record_id``."""
+    results = [{"record_id": item["record_id"]} for item in items]
+    for scorer in _worker["scorers"]:
+        try:
+            batch = scorer.score_batch(items, _worker["golden"])
+        except Exception as e:
+            batch = [{f"{scorer.name}_error": f"{type(e).__name__}: {e}"}] * len(items)
+        for result, scores in zip(results, batch):
+            result.update(scores)
+    return results
+
+
+class Evaluator:
+    """Queue completed responses and score them in batches on a process pool.
+
+    Args:
+        golden_path: Golden answers file (None scores without golden answers)
+        scorers: Scorer names or ``"module:Class"`` paths
+        workers: Worker processes (default: ``os.cpu_count()`` capped at 4)
+        batch_size: Responses per batch sent to a worker
+        max_wait: Seconds a partial batch may wait for more responses
+        max_queued: Responses held before ``submit`` starts dropping (never blocks)
+        on_scores: Called with each finished batch of score dicts
+    """
+
+    def __init__(self, golden_path=None, scorers=DEFAULT_SCORERS, workers=None, batch_size=32,
+                 max_wait=0.5, max_queued=100_000, on_scores=None):
+        self.golden_path = golden_path
+        self.scorers = tuple(scorers)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.on_scores = on_scores
+        self.submitted = 0
+        self.scored = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+        for spec in self.scorers:
+            load_scorer(spec)    # fail fast on a typo instead of in every worker
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        # Never fork: this process already runs threads (HTTP pools, the sink, this dispatcher)
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() \
+            else "spawn"
+        self._pool = ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                         mp_context=multiprocessing.get_context(start_method),
+                                         initializer=_init_worker,
+                                         initargs=(golden_path, self.scorers))
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name="evaluator", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build an evaluator when ``TEH_AI_EVALUATE=1`` or ``TEH_AI_GOLDEN`` is set, else None."""
+        golden = os.environ.get("TEH_AI_GOLDEN")
+        if not golden and os.environ.get("TEH_AI_EVALUATE") != "1":
+            return None
+        workers = os.environ.get("TEH_AI_EVAL_WORKERS")
+        return cls(golden_path=golden or None, workers=int(workers) if workers else None, **kwargs)
+
+    def submit(self, record_id, question, response, status_code=200, error=None):
+        """Queue one response for scoring; returns False if the queue was full."""
+        item = {"record_id": record_id, "question": str(question),
+                "answer": answer_text(response), "status_code": status_code, "error": error}
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _dispatch(self):
+        """Send a batch when it is full or its oldest response waited ``max_wait`` seconds."""
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._send(batch)
+                batch, deadline = [], None
+                continue
+            if item is None:
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+            if len(batch) >= self.batch_size:
+                self._send(batch)
+                batch, deadline = [], None
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        self._pool.submit(score_batch, batch).add_done_callback(self._done)
+
+    def _done(self, future):
+        try:
+            scores = future.result()
+        except Exception as e:
+            with self._lock:
+                self.failed_batches += 1
+            print(f"Scoring batch failed: {type(e).__name__}: {e}")
+            return
+        with self._lock:
+            self.scored += len(scores)
+        if self.on_scores is not None:
+            self.on_scores(scores)
+
+    def summary(self):
+        with self._lock:
+            return {"submitted": self.submitted, "scored": self.scored, "dropped": self.dropped,
+                    "failed_batches": self.failed_batches, "queued": self._queue.qsize()}
+
+    def close(self):
+        """Score everything still queued, then stop the dispatcher and the pool."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
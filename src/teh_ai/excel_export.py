@@ -0,0 +1,270 @@
+"""
+Bounded-memory Excel export for logged responses.
+
+Records are read in chunks of ``CHUNK_ROWS`` and written through a streaming
+workbook (xlsxwriter ``constant_memory`` when installed, otherwise openpyxl
+write-only mode), so only one chunk is ever held in memory. Column widths are
+computed from the first chunk of each sheet with vectorised string lengths,
+long response bodies are truncated with the full text moved to a side sheet,
+nested values (lists, dicts) are written as JSON text, and large runs roll
+over onto ``Responses_2``, ``Responses_3``... every ``rows_per_sheet`` rows.
+Every sheet has the same header: the union of the record keys, collected in a
+first pass (``record_columns``) since a streaming sheet cannot add columns
+later.
+
+Size distributions of the logged bodies (``Response_Bytes``) and, when the
+client reported them, the decoded and on-the-wire sizes (``Body_Bytes``,
+``Wire_Bytes``) are accumulated chunk by chunk into power-of-two buckets and
+written to the ``Sizes`` and ``Size_Histogram`` sheets.
+"""
+import math
+from collections import Counter
+from itertools import islice
+
+import pandas as pd
+
+from teh_ai import codec
+
+MAX_ROWS_PER_SHEET = 100_000     # Excel allows 1,048,576; keep sheets usable
+CHUNK_ROWS = 5_000               # Records held in memory at a time
+MAX_CELL_CHARS = 2_000           # Longer responses are truncated in the main sheet
+FULL_TEXT_PART_CHARS = 32_000    # Excel hard limit is 32,767 characters per cell
+MAX_COLUMN_WIDTH = 50            # Cap at 50 for readability
+TRUNCATED_COLUMN = "Response"
+OVERFLOW_SHEET = "Full_Responses"
+OVERFLOW_HEADERS = ["Sheet", "Row", "Query", "Part", "Text"]
+SIZE_COLUMNS = ("Response_Bytes", "Body_Bytes", "Wire_Bytes")
+SIZES_HEADERS = ["Column", "Count", "Total_Bytes", "Mean_Bytes", "Min_Bytes",
+                 "P50_Bytes_At_Most", "P95_Bytes_At_Most", "Max_Bytes", "Body_To_Wire_Ratio"]
+SIZE_HISTOGRAM_HEADERS = ["Column", "From_Bytes", "Below_Bytes", "Count", "Share"]
+
+
+class SizeDistribution:
+    """Power-of-two byte-size buckets per column, merged across chunks in constant memory."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.totals = {}
+
+    def add(self, column, sizes):
+        """Add a Series of sizes in bytes (missing values are skipped)."""
+        sizes = pd.to_numeric(sizes, errors="coerce").dropna().astype("int64")
+        if sizes.empty:
+            return
+        # bucket b holds sizes in [2**(b-1), 2**b); bucket 0 holds empty bodies
+        buckets = sizes.clip(lower=0).map(int.bit_length).value_counts()
+        self.buckets.setdefault(column, Counter()).update(buckets.to_dict())
+        n, total, low, high = self.totals.get(column, (0, 0, None, None))
+        self.totals[column] = (n + len(sizes), total + int(sizes.sum()),
+                               int(sizes.min()) if low is None else min(low, int(sizes.min())),
+                               int(sizes.max()) if high is None else max(high, int(sizes.max())))
+
+    def _at_most(self, column, pct):
+        buckets = self.buckets[column]
+        target = math.ceil(self.totals[column][0] * pct / 100)
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            if seen >= target:
+                return min((1 << bucket) - 1, self.totals[column][3])
+        return self.totals[column][3]
+
+    def summary_rows(self):
+        body = self.totals.get("Body_Bytes", (0, 0))[1]
+        wire = self.totals.get("Wire_Bytes", (0, 0))[1]
+        rows = []
+        for column in SIZE_COLUMNS:
+            if column not in self.totals:
+                continue
+            n, total, low, high = self.totals[column]
+            ratio = round(body / wire, 3) if column == "Wire_Bytes" and wire else None
+            rows.append([column, n, total, round(total / n, 1), low, self._at_most(column, 50),
+                         self._at_most(column, 95), high, ratio])
+        return rows
+
+    def histogram_rows(self):
+        rows = []
+        for column in SIZE_COLUMNS:
+            if column not in self.buckets:
+                continue
+            n = self.totals[column][0]
+            for bucket, hits in sorted(self.buckets[column].items()):
+                low = 0 if bucket == 0 else 1 << (bucket - 1)
+                rows.append([column, low, 1 << bucket, hits, round(hits / n, 4)])
+        return rows
+
+
+def record_columns(records):
+    """Ordered union of the keys of every record, in one pass keeping only the keys."""
+    columns = {}
+    for record in records:
+        columns.update(dict.fromkeys(record))
+    return list(columns)
+
+
+def _column_widths(df):
+    """Width per column from the longest header/value, in one vectorised pass per column."""
+    lengths = df.astype("string").apply(lambda col: col.str.len().max()).fillna(0)
+    headers = pd.Series([len(str(c)) for c in df.columns], index=df.columns)
+    return (lengths.combine(headers, max) + 2).clip(upper=MAX_COLUMN_WIDTH).astype(int).tolist()
+
+
+def _rows(df):
+    """Plain Python rows with missing values as blanks and nested values as JSON text."""
+    nested_candidates = df.columns[df.dtypes == object]
+    df = df.astype(object)
+    for column in nested_candidates:
+        nested = df[column].map(lambda value: isinstance(value, (list, dict, tuple)))
+        if nested.any():
+            df.loc[nested, column] = df.loc[nested, column].map(lambda value: codec.dumps(value, default=str))
+    return df.where(df.notna(), None).values.tolist()
+
+
+class _XlsxWriterBook:
+    def __init__(self, path):
+        import xlsxwriter
+        self.book = xlsxwriter.Workbook(str(path), {"constant_memory": True,
+                                                    "strings_to_urls": False})
+
+    def add_sheet(self, name, headers, widths):
+        sheet = self.book.add_worksheet(name)
+        for i, width in enumerate(widths):
+            sheet.set_column(i, i, width)
+        sheet.write_row(0, 0, headers)
+        return {"sheet": sheet, "row": 1}
+
+    def append(self, handle, row):
+        handle["sheet"].write_row(handle["row"], 0, row)
+        handle["row"] += 1
+
+    def close(self):
+        self.book.close()
+
+
+class _OpenpyxlBook:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.book = Workbook(write_only=True)
+
+    def add_sheet(self, name, headers, widths):
+        from openpyxl.utils import get_column_letter
+        sheet = self.book.create_sheet(name)
+        for i, width in enumerate(widths, start=1):
+            sheet.column_dimensions[get_column_letter(i)].width = width
+        sheet.append(headers)
+        return {"sheet": sheet, "row": 1}
+
+    def append(self, handle, row):
+        handle["sheet"].append(row)
+        handle["row"] += 1
+
+    def close(self):
+        self.book.save(self.path)
+
+
+def _open_book(path):
+    try:
+        return _XlsxWriterBook(path)
+    except ImportError:
+        return _OpenpyxlBook(path)
+
+
+def write_records(records, path, rows_per_sheet=MAX_ROWS_PER_SHEET, max_cell_chars=MAX_CELL_CHARS,
+                  chunk_rows=CHUNK_ROWS, columns=None):
+    """Stream an iterable of record dicts into an Excel workbook.
+
+    Args:
+        records: Iterable of dicts (e.g. ``sink.read_records(...)``)
+        path: Target ``.xlsx`` file
+        rows_per_sheet: Rows per ``Responses`` sheet before rolling over
+        max_cell_chars: Responses longer than this are truncated and copied in
+            full to the ``Full_Responses`` sheet
+        chunk_rows: Records read and converted at a time
+        columns: Header of every sheet, e.g. ``record_columns`` of the same
+            records. By default it is collected from ``records`` first when
+            they can be iterated twice; a one-shot iterator without it can only
+            learn columns as they come, and starts a new sheet for late ones.
+
+    Returns the number of rows written.
+    """
+    if columns is None and iter(records) is not records:
+        columns = record_columns(records)
+    columns = list(columns or [])
+    book = _open_book(path)
+    sizes = SizeDistribution()
+    overflow = None
+    overflow_count = 0
+    written = 0
+    sheet = None
+    sheet_no = 0
+    sheet_rows = 0
+    records = iter(records)
+    try:
+        while True:
+            if sheet is not None and sheet_rows >= rows_per_sheet:
+                sheet = None
+            room = rows_per_sheet - sheet_rows if sheet is not None else rows_per_sheet
+            chunk = list(islice(records, min(chunk_rows, room)))
+            if not chunk:
+                break
+            df = pd.DataFrame(chunk)
+            del chunk
+
+            long_rows = None
+            if TRUNCATED_COLUMN in df.columns:
+                text = df[TRUNCATED_COLUMN].astype("string")
+                sizes.add("Response_Bytes", text.str.encode("utf-8").str.len())
+                long_rows = (text.str.len() > max_cell_chars).fillna(False)
+                if not long_rows.any():
+                    long_rows = None
+            for column in SIZE_COLUMNS[1:]:
+                if column in df.columns:
+                    sizes.add(column, df[column])
+
+            # Headers cannot be rewritten in a streaming sheet: columns missing from
+            # ``columns`` and first seen in a later chunk start the next sheet
+            new_columns = [c for c in df.columns if c not in columns]
+            if sheet is None or new_columns:
+                columns = columns + new_columns
+                df = df.reindex(columns=columns)
+                sheet_no += 1
+                name = "Responses" if sheet_no == 1 else f"Responses_{sheet_no}"
+                sheet = book.add_sheet(name, [str(c) for c in columns], _column_widths(df))
+                sheet_rows = 0
+            else:
+                df = df.reindex(columns=columns)
+
+            if long_rows is not None:
+                first_row = sheet["row"] + 1    # Excel row number of this chunk's first record
+                queries = df["Query"] if "Query" in df.columns else pd.Series("", index=df.index)
+                if overflow is None:
+                    overflow = book.add_sheet(OVERFLOW_SHEET, OVERFLOW_HEADERS,
+                                              [12, 8, MAX_COLUMN_WIDTH, 6, 100])
+                for index, full in text[long_rows].items():
+                    for part, start in enumerate(range(0, len(full), FULL_TEXT_PART_CHARS), 1):
+                        book.append(overflow, [name, first_row + int(index), queries[index], part,
+                                               full[start:start + FULL_TEXT_PART_CHARS]])
+                        overflow_count += 1
+                df.loc[long_rows, TRUNCATED_COLUMN] = (
+                    text[long_rows].str.slice(0, max_cell_chars)
+                    + f" ... [truncated, full text in {OVERFLOW_SHEET}]"
+                )
+
+            for row in _rows(df):
+                book.append(sheet, row)
+            sheet_rows += len(df)
+            written += len(df)
+
+        if sizes.totals:
+            summary = book.add_sheet("Sizes", SIZES_HEADERS, [16] + [14] * (len(SIZES_HEADERS) - 1))
+            for row in sizes.summary_rows():
+                book.append(summary, row)
+            histogram = book.add_sheet("Size_Histogram", SIZE_HISTOGRAM_HEADERS, [16, 12, 12, 10, 8])
+            for row in sizes.histogram_rows():
+                book.append(histogram, row)
+    finally:
+        book.close()
+    if overflow_count:
+        print(f"{overflow_count} long response part(s) written to {OVERFLOW_SHEET}")
+    return written
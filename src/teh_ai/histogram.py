@@ -0,0 +1,100 @@
+"""
+HDR-style latency histogram with fixed relative precision and constant memory.
+
+Values are recorded in microseconds into log-linear buckets: every power-of-two
+range is split into ``2 ** sub_bucket_bits`` equal sub-buckets, so the error of
+any reported percentile is bounded by ``1 / 2 ** (sub_bucket_bits - 1)`` of the
+value, however many samples are recorded.
+"""
+import math
+import threading
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """Record latencies and report percentiles without keeping every sample.
+
+    Args:
+        sub_bucket_bits: Precision of each bucket (11 bits keeps ~3 significant digits)
+    """
+
+    def __init__(self, sub_bucket_bits=11):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+        self._lock = threading.Lock()
+
+    def _index(self, value_us):
+        shift = max(0, value_us.bit_length() - self.sub_bucket_bits)
+        return shift, value_us >> shift
+
+    @staticmethod
+    def _value(index):
+        """Representative (mid-point) value of a bucket in microseconds."""
+        shift, sub = index
+        low = sub << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        """Record one latency given in seconds."""
+        value_us = max(0, int(round(seconds * 1_000_000)))
+        index = self._index(value_us)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total_us += value_us
+            if self.min_us is None or value_us < self.min_us:
+                self.min_us = value_us
+            if self.max_us is None or value_us > self.max_us:
+                self.max_us = value_us
+
+    def merge(self, other):
+        """Add all samples of another histogram with the same precision."""
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        with self._lock:
+            for index, n in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + n
+            self.count += other.count
+            self.total_us += other.total_us
+            for value in (other.min_us, other.max_us):
+                if value is None:
+                    continue
+                if self.min_us is None or value < self.min_us:
+                    self.min_us = value
+                if self.max_us is None or value > self.max_us:
+                    self.max_us = value
+
+    def percentile(self, pct):
+        """Return the latency at ``pct`` (0-100) in seconds, or None if empty."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = max(1, math.ceil(self.count * pct / 100))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= target:
+                    value = min(max(self._value(index), self.min_us), self.max_us)
+                    return value / 1_000_000
+        return self.max_us / 1_000_000
+
+    def mean(self):
+        """Return the mean latency in seconds, or None if empty."""
+        return self.total_us / self.count / 1_000_000 if self.count else None
+
+    def summary(self, percentiles=PERCENTILES):
+        """Return count, min/mean/max and the requested percentiles in seconds."""
+        result = {
+            "count": self.count,
+            "min": self.min_us / 1_000_000 if self.min_us is not None else None,
+            "mean": self.mean(),
+            "max": self.max_us / 1_000_000 if self.max_us is not None else None,
+        }
+        for pct in percentiles:
+            result[f"p{pct:g}"] = self.percentile(pct)
+        return result
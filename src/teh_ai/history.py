@@ -0,0 +1,167 @@
+"""
+Run-over-run result history as a partitioned Parquet dataset.
+
+Each run appends one row per logged response under
+``test_results/history/env=<env>/date=<YYYY-MM-DD>/run_id=<run_id>/``. Queries
+only read the partitions they need (e.g. the two runs being compared), so the
+history can grow to thousands of runs without slowing comparisons down.
+
+Requires ``pyarrow``; pandas and pyarrow are only imported when the history
+is written or queried.
+"""
+import hashlib
+import json
+from itertools import count, islice
+from urllib.parse import urlparse
+
+from teh_ai.corpus import question_id
+from teh_ai.evaluation import answer_text
+
+HISTORY_DIR = "test_results/history"
+PARTITION_COLUMNS = ["env", "date", "run_id"]
+
+
+def answer_hash(text):
+    """Short content hash of a response body, used to detect answer changes."""
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()[:16]
+
+
+def response_answer_hash(response):
+    """``answer_hash`` of the answer text in a logged Response, ignoring ids such as ``conversationId``."""
+    try:
+        parsed = json.loads(response)
+    except (TypeError, ValueError):
+        parsed = response
+    return answer_hash(answer_text(parsed) or response)
+
+
+def environment_label(url):
+    """Label an environment from its URL: the API Gateway stage (``qa``/``dev``) or the host."""
+    parsed = urlparse(url)
+    stage = parsed.path.strip("/").split("/")[0]
+    return stage or parsed.hostname or "unknown"
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("question_id", pa.string()),
+        ("query", pa.string()),
+        ("latency_seconds", pa.float64()),
+        ("status", pa.int64()),
+        ("response_size", pa.int64()),
+        ("answer_hash", pa.string()),
+        ("timestamp", pa.string()),
+        ("env", pa.string()),
+        ("date", pa.string()),
+        ("run_id", pa.string()),
+    ])
+
+
+def _history_frame(df, run_id, environment, date):
+    """Turn a chunk of logger records into history rows (vectorised where possible)."""
+    import pandas as pd
+
+    response = df["Response"].astype("string").fillna("")
+    if "Elapsed_Seconds" in df.columns:
+        latency = df["Elapsed_Seconds"].fillna(df["Execution_Time_Seconds"])
+    else:
+        latency = df["Execution_Time_Seconds"]
+    env = df["Environment"].fillna(environment) if "Environment" in df.columns else environment
+    return pd.DataFrame({
+        "question_id": df["Query"].map(question_id),
+        "query": df["Query"].astype("string"),
+        "latency_seconds": latency.astype("float64"),
+        "status": df["Status_Code"].fillna(0).astype("int64"),
+        "response_size": response.str.encode("utf-8").str.len().astype("int64"),
+        "answer_hash": response.map(response_answer_hash),
+        "timestamp": df["Timestamp"].astype("string"),
+        "env": env,
+        "date": date,
+        "run_id": run_id,
+    })
+
+
+class ResultStore:
+    """Append runs to, and query, the partitioned Parquet history.
+
+    Args:
+        root: Dataset folder (default ``test_results/history``)
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+
+    def append_run(self, records, run_id, environment, date, chunk_rows=50_000):
+        """Write logger records for one run; returns the number of rows written."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        schema = _schema()
+        partitioning = ds.partitioning(pa.schema([schema.field(c) for c in PARTITION_COLUMNS]),
+                                       flavor="hive")
+        records = iter(records)
+        written = 0
+        for chunk_no in count():
+            chunk = list(islice(records, chunk_rows))
+            if not chunk:
+                break
+            frame = _history_frame(pd.DataFrame(chunk), run_id, environment, date)
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            ds.write_dataset(table, self.root, format="parquet", partitioning=partitioning,
+                             basename_template=f"part-{chunk_no}-{{i}}.parquet",
+                             existing_data_behavior="overwrite_or_ignore")
+            written += len(frame)
+        return written
+
+    def dataset(self):
+        import pyarrow.dataset as ds
+        return ds.dataset(self.root, format="parquet", partitioning="hive")
+
+    def load_runs(self, run_ids, columns=None):
+        """Load the rows of the given runs only (other partitions are never read)."""
+        import pyarrow.dataset as ds
+        table = self.dataset().to_table(columns=columns,
+                                        filter=ds.field("run_id").isin(list(run_ids)))
+        return table.to_pandas()
+
+    def list_runs(self):
+        """Return one row per run with its environment, date and row count."""
+        table = self.dataset().to_table(columns=PARTITION_COLUMNS)
+        df = table.to_pandas()
+        return (df.groupby(PARTITION_COLUMNS, observed=True).size()
+                .rename("rows").reset_index().sort_values(["date", "run_id"]))
+
+    def compare_runs(self, run_a, run_b):
+        """Per-question latency deltas and answer changes from ``run_a`` to ``run_b``.
+
+        Latency is the median per question within a run; ``answer_changed`` is
+        True when the text of the last answer differs between the runs (ids such
+        as ``conversationId`` in the body are ignored).
+        """
+        columns = ["run_id", "question_id", "query", "latency_seconds", "status", "answer_hash"]
+        df = self.load_runs([run_a, run_b], columns=columns)
+        df["run_id"] = df["run_id"].astype("string")
+        per_run = df.groupby(["run_id", "question_id"]).agg(
+            query=("query", "first"),
+            latency=("latency_seconds", "median"),
+            status=("status", "last"),
+            answer_hash=("answer_hash", "last"),
+        )
+        empty = per_run.iloc[0:0].droplevel(0)
+        a = per_run.loc[run_a] if run_a in per_run.index.levels[0] else empty
+        b = per_run.loc[run_b] if run_b in per_run.index.levels[0] else empty
+        out = a.join(b, how="outer", lsuffix="_a", rsuffix="_b")
+        out["query"] = out["query_a"].fillna(out["query_b"])
+        out["latency_delta"] = out["latency_b"] - out["latency_a"]
+        out["latency_ratio"] = out["latency_b"] / out["latency_a"]
+        out["answer_changed"] = out["answer_hash_a"].ne(out["answer_hash_b"])
+        columns = ["query", "latency_a", "latency_b", "latency_delta", "latency_ratio",
+                   "status_a", "status_b", "answer_changed"]
+        return out[columns].sort_values("latency_delta", ascending=False)
+
+
+def compare_runs(run_a, run_b, root=HISTORY_DIR):
+    """Compare two runs in the history at ``root``; see ``ResultStore.compare_runs``."""
+    return ResultStore(root).compare_runs(run_a, run_b)
@@ -0,0 +1,211 @@
+"""
+Load generator for the /ask API.
+
+Drives ``AskClient.ask`` (the call behind ``ask_api``) for a fixed duration and
+records every latency in a ``LatencyHistogram``. The calls bypass the response
+cache, so the numbers are the API's and not the cache's.
+
+Two models are supported:
+
+* ``closed`` - ``concurrency`` workers each send the next question as soon as
+  the previous answer arrives (throughput is whatever the API sustains).
+* ``open``   - requests are started at a fixed ``rps`` regardless of how fast
+  answers come back. Latency is measured from the *scheduled* start, so time
+  spent queued behind a slow API is counted (no coordinated omission).
+
+Usage::
+
+    python -m teh_ai.load --model closed --concurrency 4 --duration 60
+    python -m teh_ai.load --model open --rps 2 --duration 120 --csv tests/test_questions.csv
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from teh_ai.histogram import LatencyHistogram
+
+DEFAULT_QUESTIONS = ["What is RIM?"]
+
+
+class LoadReport:
+    """Latency histogram plus status-code counts for one load run."""
+
+    def __init__(self, model, duration):
+        self.model = model
+        self.duration = duration
+        self.histogram = LatencyHistogram()
+        self.status_counts = {}
+        self.elapsed = 0.0
+        self.resilience = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, status):
+        """Record one call; ``status`` is an HTTP status code or an exception name."""
+        self.histogram.record(latency)
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    @property
+    def requests(self):
+        return sum(self.status_counts.values())
+
+    @property
+    def errors(self):
+        return sum(n for status, n in self.status_counts.items()
+                   if not (isinstance(status, int) and status < 400))
+
+    def summary(self):
+        """Return throughput, error rates and latency percentiles (seconds)."""
+        total = self.requests
+        return {
+            "model": self.model,
+            "requests": total,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "throughput_rps": round(total / self.elapsed, 3) if self.elapsed else 0.0,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "error_rate_by_status": {
+                str(status): round(n / total, 4)
+                for status, n in sorted(self.status_counts.items(), key=lambda kv: str(kv[0]))
+                if not (isinstance(status, int) and status < 400)
+            },
+            "status_counts": {str(k): v for k, v in self.status_counts.items()},
+            "latency": self.histogram.summary(),
+            # Retries and throttle waits, counted apart from the latencies above
+            "resilience": self.resilience,
+        }
+
+    def assert_slo(self, p50=None, p90=None, p99=None, p999=None, max_error_rate=None):
+        """Raise AssertionError if any given percentile (seconds) or error rate is exceeded."""
+        failures = []
+        for name, pct, limit in (("p50", 50, p50), ("p90", 90, p90),
+                                 ("p99", 99, p99), ("p99.9", 99.9, p999)):
+            if limit is None:
+                continue
+            value = self.histogram.percentile(pct)
+            if value is None or value > limit:
+                failures.append(f"{name}={value} > {limit}s")
+        if max_error_rate is not None:
+            rate = self.errors / self.requests if self.requests else 1.0
+            if rate > max_error_rate:
+                failures.append(f"error_rate={rate:.4f} > {max_error_rate}")
+        assert not failures, "SLO violated: " + "; ".join(failures)
+
+
+def _call(client, question):
+    """Send one question and return its status code or exception name."""
+    try:
+        _, stats = client.ask(question, use_cache=False)
+        return stats["status_code"]
+    except Exception as e:
+        response = getattr(e, "response", None)
+        if response is not None:
+            return response.status_code
+        return type(e).__name__
+
+
+def run_load(questions=None, duration=10.0, model="closed", concurrency=4, rps=None,
+             client=None):
+    """Drive the API for ``duration`` seconds and return a ``LoadReport``.
+
+    Args:
+        questions: Questions to cycle through (defaults to "What is RIM?")
+        duration: How long to keep issuing requests, in seconds
+        model: ``"closed"`` (fixed concurrency) or ``"open"`` (fixed arrival rate)
+        concurrency: Workers for the closed model; max outstanding requests for the open model
+        rps: Target requests per second (required for the open model)
+        client: ``AskClient`` to use (defaults to ``playwrt2.get_client()``)
+    """
+    if model not in ("closed", "open"):
+        raise ValueError(f"Unknown load model {model!r}")
+    if model == "open" and not rps:
+        raise ValueError("The open model needs a target rps")
+    if client is None:
+        from teh_ai.playwrt2 import get_client
+        client = get_client()
+    questions = list(questions or DEFAULT_QUESTIONS)
+    report = LoadReport(model, duration)
+    resilience = getattr(client, "resilience", None)
+    before = resilience.summary() if resilience is not None else None
+
+    start = time.perf_counter()
+    if model == "closed":
+        _run_closed(client, questions, report, start + duration, concurrency)
+    else:
+        _run_open(client, questions, report, start, duration, concurrency, rps)
+    report.elapsed = time.perf_counter() - start
+    if resilience is not None:
+        after = resilience.summary()
+        report.resilience = {name: round(after[name] - before[name], 3)
+                             for name in after if name != "circuits"}
+        report.resilience["circuits"] = after["circuits"]
+    return report
+
+
+def _run_closed(client, questions, report, deadline, concurrency):
+    cycle = itertools.cycle(questions)
+    cycle_lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with cycle_lock:
+                question = next(cycle)
+            sent = time.perf_counter()
+            status = _call(client, question)
+            report.record(time.perf_counter() - sent, status)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def _run_open(client, questions, report, start, duration, concurrency, rps):
+    interval = 1.0 / rps
+
+    def fire(question, scheduled):
+        status = _call(client, question)
+        report.record(time.perf_counter() - scheduled, status)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, question in enumerate(itertools.cycle(questions)):
+            scheduled = start + i * interval
+            if scheduled >= start + duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, question, scheduled)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.load",
+                                     description="Load generator for the /ask API.")
+    parser.add_argument("--model", choices=("closed", "open"), default="closed")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rps", type=float, help="target arrival rate for --model open")
+    parser.add_argument("--question", action="append", help="question to send (repeatable)")
+    parser.add_argument("--csv", help="question corpus (CSV, JSONL or Parquet)")
+    parser.add_argument("--output", help="write the JSON summary to this file")
+    args = parser.parse_args(argv)
+
+    questions = list(args.question or [])
+    if args.csv:
+        from teh_ai.corpus import iter_corpus
+        questions.extend(item["question"] for item in iter_corpus(args.csv))
+
+    report = run_load(questions, duration=args.duration, model=args.model,
+                      concurrency=args.concurrency, rps=args.rps)
+    summary = report.summary()
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
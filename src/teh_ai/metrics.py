@@ -0,0 +1,209 @@
+"""
+Live run metrics while the suite is running.
+
+``ResponseLogger`` feeds every logged response into a ``LiveMetrics``:
+counts per status, the error rate and a constant-memory ``LatencyHistogram``
+for the whole run, plus a ring of per-second buckets for rolling throughput
+and latency percentiles over the last ``window`` seconds.
+
+The numbers are exposed in the Prometheus text format by ``serve_metrics``
+(``TEH_AI_METRICS_PORT``, e.g. ``curl http://127.0.0.1:9464/metrics``) and as a
+one-line terminal summary the conftest prints every ``TEH_AI_METRICS_INTERVAL``
+seconds, so a bad corpus run can be spotted and aborted early. Under
+pytest-xdist every worker serves its own port (``TEH_AI_METRICS_PORT`` + 1 + n
+for worker ``gw<n>``). Workers also forward what they record
+(``start_forwarding``/``take_forwarded``, carried on their test reports) to the
+controller, whose own metrics, summary line and port then cover every worker.
+"""
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from teh_ai.histogram import LatencyHistogram
+
+QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_WINDOW = 60
+
+
+class _Second:
+    __slots__ = ("second", "count", "errors", "histogram")
+
+    def __init__(self, second):
+        self.second = second
+        self.count = 0
+        self.errors = 0
+        self.histogram = LatencyHistogram(sub_bucket_bits=7)
+
+
+class LiveMetrics:
+    """Rolling in-memory aggregates of the responses logged so far.
+
+    Args:
+        window: Seconds covered by the rolling throughput and percentiles
+        clock: Monotonic clock in seconds (replaceable in tests)
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.started = clock()
+        self.histogram = LatencyHistogram()
+        self.statuses = Counter()
+        self.responses = 0
+        self.errors = 0
+        self._seconds = deque(maxlen=window)
+        self._forwarded = None
+        self._lock = threading.Lock()
+
+    def start_forwarding(self):
+        """Also keep every recorded ``(status_code, seconds)`` until ``take_forwarded``."""
+        with self._lock:
+            self._forwarded = []
+
+    def take_forwarded(self):
+        """The responses recorded since the last call (empty unless forwarding)."""
+        with self._lock:
+            taken, self._forwarded = self._forwarded, [] if self._forwarded is not None else None
+        return taken or []
+
+    def record(self, status_code, seconds):
+        """Count one response and its latency."""
+        error = self.record_total(status_code, seconds)
+        second = int(self.clock())
+        with self._lock:
+            if self._forwarded is not None:
+                self._forwarded.append((status_code, seconds))
+            if not self._seconds or self._seconds[-1].second != second:
+                self._seconds.append(_Second(second))
+            bucket = self._seconds[-1]
+            bucket.count += 1
+            bucket.errors += error
+            bucket.histogram.record(seconds)
+
+    def record_total(self, status_code, seconds):
+        """Count a response in the run totals only; returns whether it is an error."""
+        error = not status_code or status_code >= 400
+        with self._lock:
+            self.responses += 1
+            self.errors += error
+            self.statuses[str(status_code or 0)] += 1
+        self.histogram.record(seconds)
+        return error
+
+    def _recent(self):
+        """Count, errors and merged histogram of the last ``window`` seconds."""
+        now = int(self.clock())
+        histogram = LatencyHistogram(sub_bucket_bits=7)
+        count = errors = 0
+        with self._lock:
+            for bucket in self._seconds:
+                if bucket.second > now - self.window:
+                    count += bucket.count
+                    errors += bucket.errors
+                    histogram.merge(bucket.histogram)
+        return count, errors, histogram
+
+    def snapshot(self):
+        """Totals and rolling numbers as a dict (latencies in seconds)."""
+        elapsed = max(self.clock() - self.started, 1e-9)
+        count, errors, recent = self._recent()
+        span = min(self.window, elapsed)
+        with self._lock:
+            responses, total_errors, statuses = self.responses, self.errors, dict(self.statuses)
+        return {
+            "responses": responses,
+            "errors": total_errors,
+            "error_rate": total_errors / responses if responses else 0.0,
+            "statuses": statuses,
+            "elapsed_seconds": elapsed,
+            "throughput_rps": count / span,
+            "window_error_rate": errors / count if count else 0.0,
+            "latency": {f"p{q * 100:g}": self.histogram.percentile(q * 100) for q in QUANTILES},
+            "window_latency": {f"p{q * 100:g}": recent.percentile(q * 100) for q in QUANTILES},
+        }
+
+    def summary_line(self):
+        """One terminal line: responses, throughput, error rate and rolling p50/p95."""
+        s = self.snapshot()
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.2f}s"
+        return (f"[live {s['elapsed_seconds']:.0f}s] {s['responses']} responses, "
+                f"{s['throughput_rps']:.1f}/s, errors {s['error_rate']:.1%} "
+                f"(last {self.window}s {s['window_error_rate']:.1%}), "
+                f"p50 {fmt(s['window_latency']['p50'])} p95 {fmt(s['window_latency']['p95'])}")
+
+    def total_line(self):
+        """One end-of-run line: responses, average throughput, error rate and p50/p95 of the whole run."""
+        s = self.snapshot()
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.2f}s"
+        return (f"[run {s['elapsed_seconds']:.0f}s] {s['responses']} responses, "
+                f"{s['responses'] / s['elapsed_seconds']:.1f}/s, errors {s['error_rate']:.1%}, "
+                f"p50 {fmt(s['latency']['p50'])} p95 {fmt(s['latency']['p95'])}")
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        s = self.snapshot()
+        lines = [
+            "# HELP teh_ai_responses_total Responses logged, by HTTP status (0: no response).",
+            "# TYPE teh_ai_responses_total counter",
+        ]
+        lines += [f'teh_ai_responses_total{{status="{status}"}} {n}'
+                  for status, n in sorted(s["statuses"].items())]
+        lines += [
+            "# HELP teh_ai_errors_total Responses with an error status or no response.",
+            "# TYPE teh_ai_errors_total counter",
+            f"teh_ai_errors_total {s['errors']}",
+            "# HELP teh_ai_latency_seconds Response latency over the whole run.",
+            "# TYPE teh_ai_latency_seconds summary",
+        ]
+        for q in QUANTILES:
+            value = s["latency"][f"p{q * 100:g}"]
+            lines.append(f'teh_ai_latency_seconds{{quantile="{q:g}"}} '
+                         f'{"NaN" if value is None else value}')
+        lines += [
+            f"teh_ai_latency_seconds_sum {self.histogram.total_us / 1_000_000}",
+            f"teh_ai_latency_seconds_count {self.histogram.count}",
+            f"# HELP teh_ai_window_latency_seconds Response latency over the last {self.window}s.",
+            "# TYPE teh_ai_window_latency_seconds gauge",
+        ]
+        for q in QUANTILES:
+            value = s["window_latency"][f"p{q * 100:g}"]
+            lines.append(f'teh_ai_window_latency_seconds{{quantile="{q:g}"}} '
+                         f'{"NaN" if value is None else value}')
+        lines += [
+            f"# HELP teh_ai_throughput_rps Responses per second over the last {self.window}s.",
+            "# TYPE teh_ai_throughput_rps gauge",
+            f"teh_ai_throughput_rps {s['throughput_rps']}",
+            f"# HELP teh_ai_window_error_ratio Error share over the last {self.window}s.",
+            "# TYPE teh_ai_window_error_ratio gauge",
+            f"teh_ai_window_error_ratio {s['window_error_rate']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Serve ``metrics.prometheus()`` at ``/metrics`` on a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
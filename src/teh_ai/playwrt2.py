@@ -1,8 +1,14 @@
 import json
-import time
-import requests
+import math
 import urllib3
-from playwright.sync_api import sync_playwright
+
+from teh_ai.browser import get_browser_session
+from teh_ai.cache import ResponseCache
+from teh_ai.cassette import CassetteRecorder
+from teh_ai.client import AskClient
+from teh_ai.environments import Environment, get_environment
+from teh_ai.resilience import Resilience
+from teh_ai.token_provider import TokenProvider
 
 # Suppress InsecureRequestWarning globally for this module when verify=False is used.
 # NOTE: Best practice is to fix the server certificate or configure requests to use
@@ -10,107 +16,119 @@ from playwright.sync_api import sync_playwright
 # the risk of ignoring TLS verification.
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-TOKEN_FILE = "token_cache.json"
-# APP_URL = "https://dev.taskly.lilly.com/"  # Your web app URL
-APP_URL="https://qa.taskly.lilly.com/"
+# Active environment profile (TEH_AI_ENV, default qa); see teh_ai.environments
+ENVIRONMENT = get_environment()
+APP_URL = ENVIRONMENT.app_url
+TOKEN_FILE = ENVIRONMENT.token_file
 
 # Keys in localStorage
 TOKEN_KEY = "token"           # The key for access_token
 USERID_KEY = "userId"         # The key for userId
 CONVERSATION_KEY = "conversationId"  # The key for conversationId
 
-# API_BASE_URL = "https://3exg2qgqb3-vpce-069388414a9f87f40.execute-api.us-east-2.amazonaws.com/dev/v2/ask"
-API_BASE_URL = "https://k77ornbz5e-vpce-058757a9c034d181c.execute-api.us-east-2.amazonaws.com/qa/v2/ask"
-
-def fetch_from_localstorage():
-    edge_path = r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe"
-    user_data_dir = r"C:\Users\L118384\AppData\Local\Microsoft\Edge\User Data\Default"
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch_persistent_context(
-            user_data_dir=user_data_dir,
-            executable_path=edge_path,
-            headless=True,
-            ignore_https_errors=True,
-        )
-        page = browser.new_page()
-
-        # 🔹 Replace this with the EXACT domain from DevTools:
-        page.goto("https://dev.taskly.lilly.com")  
-
-        # Print all available keys and values
-        all_data = page.evaluate("Object.entries(localStorage)")
-        print("=== Raw localStorage ===")
-        for key, val in all_data:
-            print(f"{key}: {val}")
-
-        # Try to get specific items
-        token = page.evaluate("localStorage.getItem('token')")
-        user_id = page.evaluate("localStorage.getItem('userId')")
-        conversation_id = page.evaluate("localStorage.getItem('conversationId')")
-        print("\nToken:", token)
-        print("UserId:", user_id,'-----------',conversation_id)
-
-        browser.close()
-        return token,user_id,conversation_id
-
-def get_token():
-    """Check cached token, otherwise fetch from browser."""
-    try:
-        with open(TOKEN_FILE) as f:
-            data = json.load(f)
-        if time.time() < data["expires_at"]:
-            # print("Using cached token.")
-            return data
-    except FileNotFoundError:
-        pass
-
-    print("Fetching new token from browser...")
-    token, user_id, conversation_id = fetch_from_localstorage()
-    if not token or not user_id:
-        raise Exception("Token or userId not found in localStorage!")
-
-    # Cache with expiry
-    token_data = {
-        "access_token": token,
-        "user_id": user_id,
-        "conversation_id": conversation_id,
-        "expires_at": time.time() + 3500  # ~1 hour minus buffer
-    }
-
-    with open(TOKEN_FILE, "w") as f:
-        json.dump(token_data, f)
-
-    print("✅ Token cached.")
-    return token_data
+API_BASE_URL = ENVIRONMENT.api_base_url
+
+EDGE_PATH = r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe"
+EDGE_USER_DATA_DIR = r"C:\Users\L118384\AppData\Local\Microsoft\Edge\User Data\Default"
+
+
+def fetch_from_localstorage(environment=None):
+    """Read token, userId and conversationId from the app's localStorage.
+
+    Uses the process-wide browser session, so only the first call pays for
+    launching Edge (or attaching to it over CDP, see ``teh_ai.browser``).
+
+    Args:
+        environment: ``Environment`` whose app holds the token (default: the active one)
+    """
+    environment = environment or ENVIRONMENT
+    session = get_browser_session(EDGE_PATH, EDGE_USER_DATA_DIR)
+    values = session.read_local_storage(environment.app_origin,
+                                        [TOKEN_KEY, USERID_KEY, CONVERSATION_KEY])
+    return values[TOKEN_KEY], values[USERID_KEY], values[CONVERSATION_KEY]
+
+
+# environment name -> TokenProvider / AskClient
+_token_providers = {}
+_clients = {}
+_shared = {}
+
+
+def _environment(env):
+    if env is None:
+        return ENVIRONMENT
+    return env if isinstance(env, Environment) else get_environment(env)
+
+
+def get_token_provider(env=None):
+    """Get or create the token provider of an environment (default: the active one).
+
+    Every environment caches its token in its own file.
+    """
+    environment = _environment(env)
+    provider = _token_providers.get(environment.name)
+    if provider is None:
+        provider = _token_providers[environment.name] = TokenProvider(
+            environment.token_file, lambda: fetch_from_localstorage(environment))
+    return provider
+
+
+def get_token(env=None):
+    """Check cached token, otherwise fetch from browser.
+
+    Environments with the ``static`` token source (``TEH_AI_TOKEN``, and
+    optionally ``TEH_AI_USER_ID``) bypass the browser, e.g. when running
+    against the local stub server.
+    """
+    environment = _environment(env)
+    if environment.token_source == "static":
+        static_token, user_id = environment.static_token()
+        if not static_token:
+            raise RuntimeError(f"No static token set for environment {environment.name!r}")
+        return {
+            "access_token": static_token,
+            "user_id": user_id,
+            "conversation_id": None,
+            "expires_at": math.inf,
+        }
+    return get_token_provider(environment).get()
+
+_client = None
+
+
+def get_client(env=None):
+    """Get or create the shared pooled client of an environment (default: the active one)."""
+    global _client
+    environment = _environment(env)
+    client = _clients.get(environment.name)
+    if client is None:
+        if not _shared:
+            # One cache, cassette file and retry/rate-limit policy for every environment
+            _shared.update(cache=ResponseCache.from_env(), recorder=CassetteRecorder.from_env(),
+                           resilience=Resilience.from_env())
+        client = _clients[environment.name] = AskClient(
+            environment.api_base_url, lambda: get_token(environment), **_shared)
+        if environment.name == ENVIRONMENT.name:
+            _client = client
+    return client
+
 
 def ask_api(question):
+    """Call /ask API using dynamic values from localStorage."""
+    client = get_client()
     try:
-        """Call /ask API using dynamic values from localStorage."""
-        token_data = get_token()
-        token = token_data["access_token"]
-        user_id = token_data["user_id"]
-        conversation_id = token_data.get("conversation_id")  # Can be None if new
-
-        params = {
-            "userId": user_id,
-            "status": "true",
-            "message": question,
-            "isAgenticApproach": "false"
-        }
-        if conversation_id:
-            params["conversationId"] = conversation_id
-
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(API_BASE_URL, headers=headers, params=params, verify=False)
-        print("status code -----> ",response.status_code)
-        
-        response.raise_for_status()
-        return response.json()
+        response, stats = client.ask(question)
+        print("status code -----> ", stats["status_code"])
+        return response
     except Exception as e:
         print("Error calling ask_api:", str(e))
         return {"error": str(e)}
 
+
+def ask_api_stream(question, **kwargs):
+    """Stream the /ask answer for a question; see ``AskClient.ask_stream``."""
+    return get_client().ask_stream(question, **kwargs)
+
 if __name__ == "__main__":
     question = "How to create a binder with template?"
     result = ask_api(question)
@@ -0,0 +1,356 @@
+"""
+Resilience layer for calls to the /ask API.
+
+``Resilience`` bundles the pieces that keep a concurrent suite from turning
+gateway throttling into a thundering herd:
+
+* a token-bucket rate limiter shared by every caller (``rate`` requests/s)
+* retries with capped exponential backoff and full jitter, honouring
+  ``Retry-After`` on 429/503 responses
+* a circuit breaker per endpoint that fails fast after repeated failures
+* a retry budget, so retries can never exceed a fraction of the traffic
+
+It only computes waits and keeps the counters; the caller does the sleeping.
+``Resilience.call`` (threads) and ``Resilience.acall`` (asyncio) drive the same
+attempt loop, so the threaded client and the asyncio runner retry, throttle and
+trip the breaker alike.
+
+Environment variables (read by ``Resilience.from_env``):
+
+* ``TEH_AI_MAX_RETRIES``   - retries per call (default 3, 0 disables retrying)
+* ``TEH_AI_RATE_LIMIT``    - requests per second across all callers (default off)
+* ``TEH_AI_RATE_BURST``    - bucket size (defaults to the rate, at least 1)
+* ``TEH_AI_RETRY_BUDGET``  - retries allowed per request sent (default 0.2)
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``reserve`` returns how long to wait for a token.
+
+    Args:
+        rate: Tokens added per second
+        burst: Bucket capacity (defaults to ``rate``, at least 1)
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take ``tokens`` now (possibly on credit) and return the seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures -> half-open.
+
+    While open every call is rejected; after ``reset_timeout`` seconds one
+    probe call is let through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if now - self.opened_at >= self.reset_timeout else "open"
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` if the call must not be made."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError(f"Circuit open after {self.failures} consecutive failure(s)")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class RetryBudget:
+    """Allow at most ``ratio`` retries per request sent, plus a small reserve.
+
+    Every first attempt deposits ``ratio`` tokens (up to ``reserve``) and every
+    retry withdraws one, so a failing backend sees at most ``(1 + ratio)``
+    times the normal traffic once the reserve is spent.
+    """
+
+    def __init__(self, ratio=0.2, reserve=10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def withdraw(self):
+        """Take one retry from the budget; False when it is exhausted."""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class Resilience:
+    """Rate limiting, retries, circuit breaking and a retry budget for one suite.
+
+    Args:
+        max_retries: Retries per call after the first attempt
+        backoff_base: First backoff ceiling in seconds (doubles every retry)
+        backoff_cap: Largest backoff in seconds (also caps ``Retry-After``)
+        retry_statuses: HTTP statuses worth retrying
+        rate: Requests per second across all callers (None disables the limiter)
+        burst: Token bucket size
+        budget_ratio, budget_reserve: See ``RetryBudget``
+        failure_threshold, reset_timeout: See ``CircuitBreaker``
+        seed: Seed for the backoff jitter
+    """
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_cap=30.0,
+                 retry_statuses=RETRY_STATUSES, rate=None, burst=None, budget_ratio=0.2,
+                 budget_reserve=10, failure_threshold=5, reset_timeout=30.0, seed=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_statuses = frozenset(retry_statuses)
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.budget = RetryBudget(budget_ratio, budget_reserve)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._breakers = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {"attempts": 0, "retries": 0, "retry_wait_seconds": 0.0,
+                         "throttled": 0, "throttle_wait_seconds": 0.0,
+                         "budget_exhausted": 0, "circuit_rejections": 0}
+
+    @classmethod
+    def from_env(cls):
+        rate = os.environ.get("TEH_AI_RATE_LIMIT")
+        burst = os.environ.get("TEH_AI_RATE_BURST")
+        return cls(
+            max_retries=int(os.environ.get("TEH_AI_MAX_RETRIES", 3)),
+            rate=float(rate) if rate else None,
+            burst=float(burst) if burst else None,
+            budget_ratio=float(os.environ.get("TEH_AI_RETRY_BUDGET", 0.2)),
+        )
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def breaker(self, endpoint):
+        """The circuit breaker for one endpoint URL."""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold,
+                                                                    self.reset_timeout)
+            return breaker
+
+    def before_attempt(self, endpoint, retry):
+        """Check the breaker and take a rate-limit token; returns the seconds to wait.
+
+        Raises ``CircuitOpenError`` when the endpoint's circuit is open.
+        """
+        try:
+            self.breaker(endpoint).before_call()
+        except CircuitOpenError:
+            self._count("circuit_rejections")
+            raise
+        self._count("attempts")
+        if not retry:
+            self.budget.deposit()
+        wait = self.limiter.reserve() if self.limiter is not None else 0.0
+        if wait > 0:
+            self._count("throttled")
+            self._count("throttle_wait_seconds", wait)
+        return wait
+
+    def retry_delay(self, retry, retry_after=None):
+        """Seconds to wait before retry number ``retry`` (0-based), or None to give up.
+
+        Args:
+            retry: How many retries were already made for this call
+            retry_after: ``Retry-After`` header value of the failed response
+        """
+        if retry >= self.max_retries:
+            return None
+        if not self.budget.withdraw():
+            self._count("budget_exhausted")
+            return None
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            # Full jitter: uniform in [0, min(cap, base * 2**retry)]
+            with self._lock:
+                delay = self._random.uniform(0, min(self.backoff_cap,
+                                                    self.backoff_base * 2 ** retry))
+        delay = min(delay, self.backoff_cap)
+        self._count("retries")
+        self._count("retry_wait_seconds", delay)
+        return delay
+
+    def _attempts(self, endpoint, transient_errors):
+        """The attempt loop of one call, independent of how the caller sleeps and sends.
+
+        Yields ``("sleep", seconds)``, ``("send", None)`` (the caller sends
+        back ``(response, error)``) and ``("discard", response)`` for a
+        response about to be retried. Returns ``(response, waits)``; raises the
+        error of the last attempt when it is not retried.
+        """
+        breaker = self.breaker(endpoint)
+        retries, retry_wait, throttle_wait = 0, 0.0, 0.0
+        while True:
+            wait = self.before_attempt(endpoint, retry=retries > 0)
+            if wait:
+                yield "sleep", wait
+                throttle_wait += wait
+            response, error = yield "send", None
+            if error is not None:
+                # any failure, also before the request went out, releases a half-open probe
+                breaker.record_failure()
+                delay = self.retry_delay(retries) if isinstance(error, transient_errors) else None
+                if delay is None:
+                    raise error
+            else:
+                if response.status_code not in self.retry_statuses:
+                    breaker.record_success()
+                    delay = None
+                else:
+                    breaker.record_failure()
+                    delay = self.retry_delay(retries, response.headers.get("Retry-After"))
+                if delay is None:
+                    return response, {"retries": retries,
+                                      "retry_wait_ms": round(retry_wait * 1000, 3),
+                                      "throttle_wait_ms": round(throttle_wait * 1000, 3)}
+                yield "discard", response
+            retries += 1
+            yield "sleep", delay
+            retry_wait += delay
+
+    def call(self, endpoint, send, transient_errors=()):
+        """Call ``send()`` with rate limiting, retries and the endpoint's circuit breaker.
+
+        Returns ``(response, waits)`` with ``retries``, ``retry_wait_ms`` and
+        ``throttle_wait_ms``. A retryable status that runs out of retries is
+        returned as is.
+
+        Args:
+            endpoint: URL the breaker is kept for
+            send: Makes one attempt and returns the response
+            transient_errors: Exception types worth retrying (others are raised at once)
+        """
+        attempts = self._attempts(endpoint, transient_errors)
+        outcome = None
+        while True:
+            try:
+                action, value = attempts.send(outcome)
+            except StopIteration as done:
+                return done.value
+            outcome = None
+            if action == "sleep":
+                time.sleep(value)
+            elif action == "discard":
+                value.close()
+            else:
+                try:
+                    outcome = send(), None
+                except Exception as e:
+                    outcome = None, e
+
+    async def acall(self, endpoint, send, transient_errors=()):
+        """``call`` for asyncio: ``send`` is a coroutine function."""
+        import asyncio
+
+        attempts = self._attempts(endpoint, transient_errors)
+        outcome = None
+        while True:
+            try:
+                action, value = attempts.send(outcome)
+            except StopIteration as done:
+                return done.value
+            outcome = None
+            if action == "sleep":
+                await asyncio.sleep(value)
+            elif action == "discard":
+                await value.aclose()
+            else:
+                try:
+                    outcome = await send(), None
+                except Exception as e:
+                    outcome = None, e
+
+    def summary(self):
+        """Counters so far plus the state of every endpoint's breaker."""
+        with self._lock:
+            counters = dict(self.counters)
+            breakers = dict(self._breakers)
+        counters["retry_wait_seconds"] = round(counters["retry_wait_seconds"], 3)
+        counters["throttle_wait_seconds"] = round(counters["throttle_wait_seconds"], 3)
+        counters["circuits"] = {endpoint: b.state for endpoint, b in breakers.items()}
+        return counters
@@ -1,12 +1,23 @@
 """
 Module to log API responses to Excel file with metadata.
+
+Responses are streamed to an append-only JSONL file as they are logged; the
+Excel and Parquet reports are derived from that file at the end of the run.
+The file is only created by the first logged response, so a session that logs
+nothing leaves nothing behind.
+pandas and the Excel writers are only imported when a report is built.
 """
 import json
 import time
 from pathlib import Path
 from datetime import datetime
-import pandas as pd 
 import os
+import threading
+import uuid
+
+from teh_ai import codec
+from teh_ai.metrics import LiveMetrics
+from teh_ai.sink import COMPRESSION_SUFFIXES, JsonlSink, read_records
 
 # class ResponseLogger:
 #     """Log API responses to Excel with query, response, status_code, and execution time."""
@@ -21,17 +32,56 @@ import os
 class ResponseLogger:
     """Log API responses to Excel with query, response, status_code, and execution time."""
 
-    def __init__(self, output_dir="test_results"):
-        """Initialize logger with output directory."""
+    def __init__(self, output_dir="test_results", compression=None, run_id=None, shard=None,
+                 evaluator=None, drift_index=None):
+        """Initialize logger with output directory.
+
+        Args:
+            output_dir: Folder for the JSONL stream and the Excel/Parquet reports
+            compression: ``None``, ``"gzip"`` or ``"zstd"`` for the JSONL stream
+            run_id: Id shared by every process of one run (a new one by default)
+            shard: Worker name (e.g. ``gw0``) when logging from a pytest-xdist
+                worker; the worker writes its own shard file and never deletes
+                anything, and the controller merges the shards at the end
+            evaluator: Optional ``teh_ai.evaluation.Evaluator``; every logged
+                response is queued for scoring and the scores are written to
+                a ``api_scores_<run_id>.jsonl`` stream as they finish
+            drift_index: Optional ``teh_ai.drift.DriftIndex``; every answer is
+                compared with its golden answer as it is logged
+        """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-        # Delete old Excel files before starting new logging
-        self.cleanup_old_excels()
+        # Delete old Excel files before starting new logging (controller only)
+        if shard is None:
+            self.cleanup_old_excels()
+
+        # Create new Excel filename and the JSONL stream it is built from
+        self.started = datetime.now()
+        self.run_id = run_id or new_run_id()
+        self.shard = shard
+        stem = f"api_responses_{self.run_id}"
+        self.responses_file = self.output_dir / f"{stem}.xlsx"
+        sink_name = f"{stem}_{shard}.jsonl" if shard else f"{stem}.jsonl"
+        self.stream_file = self.output_dir / (sink_name + COMPRESSION_SUFFIXES.get(compression, ""))
+        self.compression = compression
+        self._sink = None
+        self._sink_lock = threading.Lock()
+        scores_name = f"api_scores_{self.run_id}_{shard}.jsonl" if shard \
+            else f"api_scores_{self.run_id}.jsonl"
+        self.scores_file = self.output_dir / scores_name
+        self._scores_sink = None
+        self._scores_lock = threading.Lock()
+        self.evaluator = evaluator
+        self.drift_index = drift_index
+        self.metrics = LiveMetrics()
+        if evaluator is not None:
+            evaluator.on_scores = self.log_scores
 
-        # Create new Excel filename
-        self.responses_file = self.output_dir / f"api_responses_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        self.data = []
+    @property
+    def count(self):
+        """Number of responses logged so far."""
+        return self._sink.count if self._sink is not None else 0
 
     def cleanup_old_excels(self):
         """Delete old Excel files from previous runs."""
@@ -42,62 +92,220 @@ class ResponseLogger:
             except Exception as e:
                 print(f"Could not delete file {file}: {e}")
     
-    def log_response(self, query, response, status_code=200, execution_time=0):
-        """Log a single API response to the list (will be written to Excel later).
+    def log_response(self, query, response, status_code=200, execution_time=0, stats=None,
+                     raw=None):
+        """Append a single API response to the JSONL stream (Excel is built later).
         
         Args:
             query: The question/query sent to the API
             response: The response from the API (dict or str)
             status_code: HTTP status code (default 200)
             execution_time: Time taken to execute the request in seconds
+            stats: Optional per-request stats from ``AskClient`` (e.g. connection
+                reuse), each key written as its own column
+            raw: Optional body exactly as received (``AskClient.last_body``);
+                stored as is instead of re-encoding ``response``
         """
-        # Convert response to JSON string if it's a dict
-        response_str = json.dumps(response, indent=2) if isinstance(response, dict) else str(response)
+        # Keep the body as received, else a compact JSON string of the parsed answer
+        if raw is not None:
+            response_str = raw.decode("utf-8", "replace") if isinstance(raw, bytes) else str(raw)
+        elif isinstance(response, (dict, list)):
+            response_str = codec.dumps(response, default=str)
+        else:
+            response_str = str(response)
         
-        self.data.append({
+        record = {
+            'Record_Id': uuid.uuid4().hex[:16],
             'Query': query,
             'Response': response_str,
             'Status_Code': status_code,
             'Execution_Time_Seconds': round(execution_time, 2),
             'Timestamp': datetime.now().isoformat()
-        })
+        }
+        for key, value in (stats or {}).items():
+            record.setdefault(_column_name(key), value)
+        if self.drift_index is not None and status_code < 400:
+            for key, value in self.drift_index.check(query, response).items():
+                record[_column_name(key)] = value
+        self._stream().write(record)
+        self.metrics.record(status_code, execution_time)
+        if self.evaluator is not None:
+            self.evaluator.submit(record['Record_Id'], query, response, status_code)
+        return record['Record_Id']
+
+    def _stream(self):
+        """The responses sink, created on first use like the scores sink."""
+        with self._sink_lock:
+            if self._sink is None:
+                self._sink = JsonlSink(self.stream_file, compression=self.compression)
+        return self._sink
+
+    def log_scores(self, scores):
+        """Append evaluator scores (dicts with a ``record_id``); called off the request path."""
+        with self._scores_lock:
+            if self._scores_sink is None:
+                self._scores_sink = JsonlSink(self.scores_file)
+        self._scores_sink.write_many(scores)
+
+    def iter_scores(self):
+        """Yield the score dicts written so far for this run."""
+        if self._scores_sink is not None:
+            self._scores_sink.flush()
+        if not self.scores_file.exists():
+            return iter(())
+        return read_records(self.scores_file)
     
+    def log_results(self, results):
+        """Log a batch of results returned by ``teh_ai.runner.ask_many``."""
+        for result in results:
+            default_status = 200 if result["error"] is None else 0
+            self.log_response(
+                query=result["question"],
+                response=result["response"],
+                status_code=result["stats"].get("status_code", default_status),
+                execution_time=result["execution_time"],
+                stats=result["stats"]
+            )
+
+    def shard_files(self):
+        """JSONL shard files written by pytest-xdist workers for this run."""
+        return sorted(self.output_dir.glob(f"api_responses_{self.run_id}_*.jsonl*"))
+
+    def merge_shards(self):
+        """Fold every worker shard into this logger's stream, then delete the shards.
+
+        Worker score shards are folded into this run's scores the same way.
+        Returns the number of merged records.
+        """
+        merged = 0
+        for path in self.shard_files():
+            sink = self._stream()
+            before = sink.count
+            sink.write_many(read_records(path))
+            merged += sink.count - before
+            path.unlink()
+        for path in sorted(self.output_dir.glob(f"api_scores_{self.run_id}_*.jsonl")):
+            self.log_scores(list(read_records(path)))
+            path.unlink()
+        return merged
+
     def save_to_excel(self):
         """Save all logged responses to Excel file."""
-        if not self.data:
+        if not self.count:
             print("No responses to log.")
             return None
         
-        df = pd.DataFrame(self.data)
-        
-        # Create Excel writer with formatting
-        with pd.ExcelWriter(self.responses_file, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Responses')
-            
-            # Auto-adjust column widths
-            worksheet = writer.sheets['Responses']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)  # Cap at 50 for readability
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
+        # Stream the JSONL records into the workbook chunk by chunk
+        from teh_ai import excel_export
+        # Cheap first pass for the header shared by every sheet, then the rows
+        columns = excel_export.record_columns(self.iter_records())
+        excel_export.write_records(self.iter_records(), self.responses_file, columns=columns)
+
         print(f"Responses logged to: {self.responses_file}")
         return self.responses_file
     
+    def save_to_parquet(self):
+        """Save all logged responses to a Parquet file next to the Excel report."""
+        if not self.count:
+            print("No responses to log.")
+            return None
+
+        parquet_file = self.responses_file.with_suffix(".parquet")
+        try:
+            self.get_dataframe().to_parquet(parquet_file, index=False)
+        except ImportError as e:
+            print(f"Skipping Parquet export: {e}")
+            return None
+        print(f"Responses logged to: {parquet_file}")
+        return parquet_file
+
+    def save_to_history(self, environment, root=None):
+        """Append this run to the partitioned Parquet history (see ``teh_ai.history``).
+
+        Args:
+            environment: Environment label, e.g. ``history.environment_label(API_BASE_URL)``
+            root: History dataset folder (default ``<output_dir>/history``)
+        """
+        if not self.count:
+            return 0
+        from teh_ai.history import ResultStore
+
+        store = ResultStore(root or self.output_dir / "history")
+        try:
+            rows = store.append_run(self.iter_records(), self.run_id, environment,
+                                    self.started.strftime('%Y-%m-%d'))
+        except ImportError as e:
+            print(f"Skipping history export: {e}")
+            return 0
+        print(f"Run {self.run_id} added to history: {store.root}")
+        return rows
+
+    def update_drift_index(self, rebase=False):
+        """Add this run's answers to the golden-answer index; returns the drifted records.
+
+        Args:
+            rebase: Make this run's answers the new golden answers
+        """
+        if self.drift_index is None or not self.count:
+            return []
+        added = self.drift_index.update(self.iter_records(), self.run_id, rebase=rebase)
+        print(f"Golden answers added: {added}; drift:", self.drift_index.summary())
+        return [record for record in self.iter_records() if record.get("Drifted")]
+
+    def iter_records(self):
+        """Yield logged records one at a time from the JSONL stream.
+
+        Scores written by the evaluator are joined in as ``Score_*`` columns.
+        """
+        if self._sink is None:
+            return iter(())
+        self._sink.flush()
+        scores = {}
+        for entry in self.iter_scores():
+            entry = dict(entry)
+            scores[entry.pop("record_id")] = {f"Score_{_column_name(k)}": v for k, v in entry.items()}
+        records = read_records(self._sink.path)
+        if not scores:
+            return records
+        return ({**record, **scores.get(record.get("Record_Id"), {})} for record in records)
+
     def get_dataframe(self):
         """Get logged responses as a pandas DataFrame."""
-        return pd.DataFrame(self.data)
+        import pandas as pd
+
+        return pd.DataFrame(list(self.iter_records()))
     
+    def finish_scoring(self):
+        """Wait until every response queued for the evaluator has been scored."""
+        evaluator, self.evaluator = self.evaluator, None
+        if evaluator is not None:
+            evaluator.close()
+            print("Scoring:", evaluator.summary())
+
     def clear(self):
         """Clear logged responses."""
-        self.data = []
+        if self._sink is not None:
+            self._sink.truncate()
+        if self._scores_sink is not None:
+            self._scores_sink.truncate()
+
+    def close(self):
+        """Finish pending scoring, then flush and close the JSONL streams."""
+        self.finish_scoring()
+        if self._sink is not None:
+            self._sink.close()
+        if self._scores_sink is not None:
+            self._scores_sink.close()
+
+
+def new_run_id():
+    """Timestamped, collision-free id for one test run."""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def _column_name(key):
+    """Turn a stats key such as ``connection_reused`` into ``Connection_Reused``."""
+    return "_".join(part.capitalize() for part in key.split("_"))
 
 
 # Global logger instance (optional, for convenience)
@@ -111,6 +319,15 @@ def get_logger():
     return _global_logger
 
 
+def configure_logger(**kwargs):
+    """Replace the global logger, e.g. with a worker shard under pytest-xdist."""
+    global _global_logger
+    if _global_logger is not None:
+        _global_logger.close()
+    _global_logger = ResponseLogger(**kwargs)
+    return _global_logger
+
+
 # def cleanup_old_excels(self):
 #     """Delete old Excel files."""
 #     for file in self.output_dir.glob("api_responses_*.xlsx"):
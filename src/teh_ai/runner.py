@@ -0,0 +1,141 @@
+"""
+Run many questions against the /ask API concurrently.
+
+``ask_many`` fans a list of questions out over either a thread pool sharing the
+pooled ``AskClient`` session, or an asyncio event loop driving ``httpx``.
+Results always come back in the same order as the input questions. Both
+backends go through the client's response cache and cassette recorder.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from teh_ai import codec
+
+BACKENDS = ("thread", "asyncio")
+
+
+def _result(question, response=None, stats=None, error=None, execution_time=0.0):
+    """Build one result entry; failed calls mirror ``ask_api``'s error dict."""
+    if error is not None:
+        response = {"error": error}
+    return {
+        "question": question,
+        "response": response,
+        "stats": stats or {},
+        "error": error,
+        "execution_time": execution_time,
+    }
+
+
+def ask_many(questions, concurrency=4, backend="thread", timeout=None, max_in_flight=None,
+             client=None):
+    """Ask every question and return one result dict per question, in input order.
+
+    Args:
+        questions: Iterable of question strings
+        concurrency: Number of worker threads (or asyncio tasks)
+        backend: ``"thread"`` (pooled requests session) or ``"asyncio"`` (httpx)
+        timeout: Per-question timeout in seconds (None waits forever)
+        max_in_flight: Cap on simultaneous outstanding requests, to stay under
+            gateway throttling limits (defaults to ``concurrency``)
+        client: ``AskClient`` to use (defaults to ``playwrt2.get_client()``)
+
+    Each result has ``question``, ``response``, ``stats``, ``error`` and
+    ``execution_time`` keys. Failures never raise; they are reported in
+    ``error`` and ``response`` is ``{"error": ...}`` like ``ask_api``.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    questions = list(questions)
+    if client is None:
+        from teh_ai.playwrt2 import get_client
+        client = get_client()
+    limit = min(concurrency, max_in_flight or concurrency)
+
+    if backend == "asyncio":
+        return asyncio.run(_ask_many_async(client, questions, concurrency, timeout, limit))
+    return _ask_many_threaded(client, questions, concurrency, timeout, limit)
+
+
+def _ask_many_threaded(client, questions, concurrency, timeout, limit):
+    if concurrency > client.pool_maxsize:
+        print(f"concurrency={concurrency} exceeds pool_maxsize={client.pool_maxsize}; "
+              "extra connections will not be reused")
+    in_flight = threading.BoundedSemaphore(limit)
+
+    def run_one(question):
+        with in_flight:
+            start = time.perf_counter()
+            try:
+                response, stats = client.ask(question, timeout=timeout)
+                return _result(question, response, stats,
+                               execution_time=time.perf_counter() - start)
+            except Exception as e:
+                return _result(question, stats=client.last_stats, error=str(e),
+                               execution_time=time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # map() yields in submission order, whatever order calls finish in
+        return list(pool.map(run_one, questions))
+
+
+async def _ask_many_async(client, questions, concurrency, timeout, limit):
+    try:
+        import httpx
+    except ImportError as e:
+        raise ImportError("The asyncio backend requires httpx: pip install httpx") from e
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    in_flight = asyncio.Semaphore(limit)
+
+    async with httpx.AsyncClient(verify=client.verify, limits=limits, timeout=None) as http:
+
+        async def get(params, headers):
+            """GET with the client's rate limiter, retries and circuit breaker, if any."""
+            resilience = client.resilience
+            if resilience is None:
+                return await http.get(client.base_url, params=params, headers=headers), {}
+            return await resilience.acall(
+                client.base_url,
+                lambda: http.get(client.base_url, params=params, headers=headers),
+                httpx.TransportError)
+
+        async def run_one(question):
+            async with in_flight:
+                start = time.perf_counter()
+                stats = None
+                try:
+                    key, hit = client.cache_lookup(question)
+                    if hit is not None:
+                        return _result(question, *hit, execution_time=time.perf_counter() - start)
+                    # the token is only needed once a question misses the cache
+                    token_data = client.token_provider()
+                    headers = {"Authorization": f"Bearer {token_data['access_token']}"}
+                    params = client.build_params(token_data, question)
+                    response, waits = await asyncio.wait_for(get(params, headers), timeout)
+                    elapsed = time.perf_counter() - start
+                    stats = {
+                        "status_code": response.status_code,
+                        "elapsed_seconds": round(elapsed, 4),
+                        "content_encoding": response.headers.get("Content-Encoding", "identity"),
+                        "wire_bytes": response.num_bytes_downloaded,
+                        "body_bytes": len(response.content),
+                        **waits,
+                    }
+                    if client.recorder is not None:
+                        client.recorder.record(response, elapsed)
+                    response.raise_for_status()
+                    payload = codec.loads(response.content)
+                    client.cache_store(key, payload, response.status_code, stats)
+                    return _result(question, payload, stats, execution_time=elapsed)
+                except asyncio.TimeoutError:
+                    return _result(question, stats=stats, error=f"Timed out after {timeout}s",
+                                   execution_time=time.perf_counter() - start)
+                except Exception as e:
+                    return _result(question, stats=stats, error=str(e),
+                                   execution_time=time.perf_counter() - start)
+
+        # gather() keeps results in the order the coroutines were passed in
+        return await asyncio.gather(*(run_one(q) for q in questions))
@@ -0,0 +1,78 @@
+"""
+Split the question corpus into latency-balanced shards for pytest-xdist.
+
+Each question is assigned to one of ``n`` shards so that the expected time of
+every shard (the sum of its questions' historical median latencies) is as
+even as possible (longest-processing-time-first greedy). Shards map onto
+``xdist_group`` marks, so ``pytest -n N --dist loadgroup`` runs one shard per
+worker.
+"""
+import heapq
+
+from teh_ai.corpus import question_id
+from teh_ai.history import HISTORY_DIR
+
+
+def historical_latencies(root=HISTORY_DIR):
+    """Median latency per question id over the stored history, or ``{}`` without one."""
+    try:
+        from teh_ai.history import ResultStore
+        table = ResultStore(root).dataset().to_table(columns=["question_id", "latency_seconds"])
+    except Exception:
+        # No history yet (or pyarrow missing): every question gets the default weight
+        return {}
+    df = table.to_pandas()
+    return df.groupby("question_id")["latency_seconds"].median().to_dict()
+
+
+def plan_shards(questions, n_shards, latencies=None, default=None):
+    """Return the shard index for each question, balancing expected latency.
+
+    Args:
+        questions: Question strings, in corpus order
+        n_shards: Number of shards (workers)
+        latencies: ``{question_id: seconds}`` from ``historical_latencies``
+        default: Weight for questions without history (defaults to the median
+            of the known latencies, or 1 second)
+    """
+    latencies = latencies or {}
+    if default is None:
+        known = sorted(latencies.values())
+        default = known[len(known) // 2] if known else 1.0
+    weights = [latencies.get(question_id(q), default) for q in questions]
+
+    shards = [0] * len(questions)
+    if n_shards <= 1:
+        return shards
+    load = [(0.0, shard) for shard in range(n_shards)]
+    heapq.heapify(load)
+    for i in sorted(range(len(questions)), key=lambda i: weights[i], reverse=True):
+        total, shard = heapq.heappop(load)
+        shards[i] = shard
+        heapq.heappush(load, (total + weights[i], shard))
+    return shards
+
+
+def worker_count(config):
+    """Number of pytest-xdist workers for this session (1 without xdist)."""
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is not None:
+        return workerinput.get("workercount", 1)
+    n = getattr(config.option, "numprocesses", None)
+    return n if isinstance(n, int) and n > 0 else 1
+
+
+def session_latencies(config):
+    """Historical latencies for planning, identical on the controller and every worker.
+
+    Workers receive the controller's copy through ``workerinput`` so that they
+    all compute the same shard plan during collection.
+    """
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is not None:
+        return workerinput.get("teh_ai_latencies", {})
+    if worker_count(config) <= 1:
+        return {}
+    if not hasattr(config, "_teh_ai_latencies"):
+        config._teh_ai_latencies = historical_latencies()
+    return config._teh_ai_latencies
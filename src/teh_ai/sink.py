@@ -0,0 +1,166 @@
+"""
+Append-only JSONL result sink.
+
+Every record is written to disk as soon as it is logged, one JSON object per
+line, so memory stays flat however many questions run and a crash loses at
+most the records since the last flush. The file can optionally be gzip or
+zstd compressed (zstd needs the ``zstandard`` package).
+"""
+import gzip
+import io
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from teh_ai import codec
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class JsonlSink:
+    """Thread-safe, append-only JSONL writer with periodic fsync.
+
+    Args:
+        path: Target file; the compression suffix is appended if missing
+        compression: ``None``, ``"gzip"`` or ``"zstd"``
+        fsync_every: fsync after this many records (0 disables the count trigger)
+        fsync_interval: fsync when this many seconds passed since the last one
+    """
+
+    def __init__(self, path, compression=None, fsync_every=50, fsync_interval=5.0):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unsupported compression {compression!r}")
+        suffix = COMPRESSION_SUFFIXES[compression]
+        path = Path(path)
+        if suffix and not path.name.endswith(suffix):
+            path = path.with_name(path.name + suffix)
+        self.path = path
+        self.compression = compression
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.count = 0
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._open("ab")
+
+    def _open(self, mode):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._raw = open(self.path, mode)
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        elif self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                self._raw.close()
+                raise ImportError("zstd compression requires zstandard: pip install zstandard") from e
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    @staticmethod
+    def _encode(record):
+        return codec.dumps_line(record)
+
+    def write_many(self, records):
+        """Append many records with a single flush + fsync at the end."""
+        with self._lock:
+            for record in records:
+                self._stream.write(self._encode(record))
+                self.count += 1
+            self._sync()
+
+    def write(self, record):
+        """Append one record (a JSON-serialisable dict)."""
+        data = self._encode(record)
+        with self._lock:
+            self._stream.write(data)
+            self.count += 1
+            self._pending += 1
+            if self.compression is None:
+                self._raw.flush()
+            due = (self.fsync_every and self._pending >= self.fsync_every) or \
+                time.monotonic() - self._last_sync >= self.fsync_interval
+            if due:
+                self._sync()
+
+    def _sync(self):
+        if self.compression == "gzip":
+            self._stream.flush(zlib.Z_SYNC_FLUSH)
+        elif self.compression == "zstd":
+            import zstandard
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """Push every written record to disk (flush + fsync)."""
+        with self._lock:
+            if not self._raw.closed:
+                self._sync()
+
+    def truncate(self):
+        """Drop every record written so far and start an empty file."""
+        with self._lock:
+            self._close()
+            self._open("wb")
+            self.count = 0
+            self._pending = 0
+
+    def _close(self):
+        if self._raw.closed:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def close(self):
+        """Flush and close the file; further writes raise ``ValueError``."""
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_text(path):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        import zstandard
+        raw = open(path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                                encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_records(path):
+    """Yield records from a (possibly compressed) JSONL sink file one at a time.
+
+    A torn last line or a truncated or corrupt compressed tail, as left by a
+    crash, ends the iteration instead of raising.
+    """
+    torn_tail = (EOFError, UnicodeDecodeError, zlib.error)
+    if Path(path).suffix == ".zst":
+        import zstandard
+        torn_tail += (zstandard.ZstdError,)
+    with _open_text(path) as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                yield codec.loads(line)
+        except torn_tail:
+            return
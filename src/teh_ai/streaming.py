@@ -0,0 +1,337 @@
+"""
+Incremental reading of /ask answers.
+
+``AskClient.ask_stream`` returns an ``AnswerStream``: iterate it to receive the
+answer text as it arrives instead of waiting for the whole body. Two body
+formats are understood:
+
+* ``text/event-stream`` (SSE) - every ``data:`` event is one chunk; JSON events
+  contribute their ``answer``/``message``/``delta``/``text``/``content`` string
+* anything else is treated as a (possibly chunked) JSON body, and the
+  ``answer`` (or ``message``) string is decoded incrementally as its bytes arrive
+
+The stream records time to first byte, time to first token (TTFT) and the
+gaps between chunks. Only the first ``max_buffer`` characters of the answer
+are kept in memory; the rest is handed to the caller and dropped.
+"""
+import codecs
+import json
+import re
+import time
+
+from teh_ai.histogram import LatencyHistogram
+
+DEFAULT_CHUNK_SIZE = 1024
+DEFAULT_MAX_BUFFER = 1024 * 1024
+ANSWER_KEYS = ("answer", "message")
+SSE_TEXT_KEYS = ("answer", "message", "delta", "text", "content", "token")
+
+
+def _ms(ns):
+    return round(ns / 1_000_000, 3)
+
+
+class JsonStringExtractor:
+    """Decode the value of the first ``"<key>": "..."`` string in a JSON text fed piecewise.
+
+    Args:
+        keys: Keys whose string value is the answer, first match wins
+        window: Characters kept while still searching for the key
+    """
+
+    def __init__(self, keys=ANSWER_KEYS, window=256):
+        names = "|".join(re.escape(k) for k in keys)
+        self._pattern = re.compile(r'"(?:%s)"\s*:\s*"' % names)
+        self._window = window
+        self._pending = ""
+        self.state = "search"    # -> "value" -> "done"
+
+    def feed(self, text):
+        """Return the newly decoded part of the answer string ('' if none yet)."""
+        if self.state == "done":
+            return ""
+        buf = self._pending + text
+        if self.state == "search":
+            match = self._pattern.search(buf)
+            if match is None:
+                # Keep a tail in case the key is split across two pieces
+                self._pending = buf[-self._window:]
+                return ""
+            self.state = "value"
+            buf = buf[match.end():]
+
+        end, i, n = None, 0, len(buf)
+        while i < n:
+            c = buf[i]
+            if c == '"':
+                end = i
+                break
+            if c != "\\":
+                i += 1
+                continue
+            if i + 1 >= n:
+                break
+            if buf[i + 1] != "u":
+                i += 2
+                continue
+            if i + 6 > n:
+                break
+            if 0xD800 <= int(buf[i + 2:i + 6], 16) < 0xDC00:
+                # High surrogate: decode it together with the low one that follows
+                if i + 8 > n:
+                    break
+                if buf[i + 6:i + 8] == "\\u":
+                    if i + 12 > n:
+                        break
+                    i += 12
+                    continue
+            i += 6
+
+        if end is not None:
+            self.state = "done"
+            self._pending = ""
+            return json.loads('"' + buf[:end] + '"')
+        self._pending = buf[i:]
+        return json.loads('"' + buf[:i] + '"') if i else ""
+
+
+class SseParser:
+    """Split a ``text/event-stream`` fed piecewise into the data of each event."""
+
+    def __init__(self):
+        self._line = ""
+        self._data = []
+        self.done = False
+
+    def feed(self, text):
+        """Return the data strings of the events completed by this piece."""
+        events = []
+        lines = (self._line + text).split("\n")
+        self._line = lines.pop()
+        for line in lines:
+            line = line.rstrip("\r")
+            if not line:
+                if self._data:
+                    events.append("\n".join(self._data))
+                    self._data = []
+            elif line.startswith("data:"):
+                value = line[5:]
+                self._data.append(value[1:] if value.startswith(" ") else value)
+        return events
+
+    def close(self):
+        """Return the data of a final event not followed by a blank line."""
+        if self._line.startswith("data:"):
+            value = self._line[5:]
+            self._data.append(value[1:] if value.startswith(" ") else value)
+        self._line = ""
+        events, self._data = (["\n".join(self._data)] if self._data else []), []
+        return events
+
+
+def sse_text(data):
+    """Answer text carried by one SSE event, and its JSON payload (or None)."""
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return data, None
+    if not isinstance(event, dict):
+        return (event if isinstance(event, str) else ""), None
+    for key in SSE_TEXT_KEYS:
+        value = event.get(key)
+        if isinstance(value, dict):
+            value = value.get("content") or value.get("text")
+        if isinstance(value, str):
+            return value, event
+    return "", event
+
+
+class AnswerStream:
+    """Iterate over the answer text of one /ask response as it arrives.
+
+    Iterating yields non-empty text chunks. Breaking out early, ``abort()`` or
+    leaving a ``with`` block closes the connection without reading the rest.
+    After the stream is exhausted ``payload`` holds the decoded JSON body (or
+    the last JSON SSE event) when it fit into ``max_buffer``.
+
+    Args:
+        response: A ``requests.Response`` opened with ``stream=True``
+        sent_ns: ``perf_counter_ns()`` taken when the request was sent
+        stats: Stats dict of the call, extended with the ``stream_*`` keys
+        chunk_size: Largest piece read from the socket at a time
+        max_buffer: Characters of answer (and bytes of raw JSON body) kept in memory
+    """
+
+    def __init__(self, response, sent_ns, stats=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_buffer=DEFAULT_MAX_BUFFER):
+        self.response = response
+        self.chunk_size = chunk_size
+        self.max_buffer = max_buffer
+        self.stats = stats if stats is not None else {}
+        self.payload = None
+        self.truncated = False
+        self.aborted = False
+        self.closed = False
+
+        self._sent = sent_ns
+        self._parts = []
+        self._chars = 0
+        self._raw = bytearray()
+        self._raw_kept = True
+        self._gaps = LatencyHistogram()
+        self._iterator = None
+        self._is_sse = "text/event-stream" in response.headers.get("Content-Type", "")
+        self.stats.update({"stream_format": "sse" if self._is_sse else "json",
+                           "stream_chunks": 0, "stream_bytes": 0, "stream_chars": 0,
+                           "stream_ttfb_ms": None, "stream_ttft_ms": None})
+
+    @property
+    def text(self):
+        """The answer received so far (at most ``max_buffer`` characters)."""
+        if len(self._parts) > 1:
+            self._parts[:] = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def _reads(self):
+        raw = self.response.raw
+        if hasattr(raw, "read1"):
+            # read1 returns whatever has arrived instead of waiting for a full chunk
+            while True:
+                data = raw.read1(self.chunk_size, decode_content=True)
+                if not data:
+                    return
+                yield data
+        else:
+            yield from self.response.iter_content(self.chunk_size)
+
+    def _keep(self, chunk):
+        room = self.max_buffer - self._chars
+        if len(chunk) > room:
+            self.truncated = True
+            chunk = chunk[:max(0, room)]
+        if chunk:
+            self._parts.append(chunk)
+            self._chars += len(chunk)
+
+    def _emit(self, chunk, last):
+        now = time.perf_counter_ns()
+        if self.stats["stream_ttft_ms"] is None:
+            self.stats["stream_ttft_ms"] = _ms(now - self._sent)
+        else:
+            self._gaps.record((now - last) / 1e9)
+        self.stats["stream_chunks"] += 1
+        self.stats["stream_chars"] += len(chunk)
+        self._keep(chunk)
+        return now
+
+    def _generate(self):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parser = SseParser() if self._is_sse else JsonStringExtractor()
+        last = None
+        try:
+            for data in self._reads():
+                if self.stats["stream_ttfb_ms"] is None:
+                    self.stats["stream_ttfb_ms"] = _ms(time.perf_counter_ns() - self._sent)
+                self.stats["stream_bytes"] += len(data)
+                if self._raw_kept and not self._is_sse:
+                    if len(self._raw) + len(data) > self.max_buffer:
+                        self._raw_kept = False
+                        self._raw = bytearray()
+                    else:
+                        self._raw += data
+                for chunk in self._chunks(parser, decoder.decode(data)):
+                    last = self._emit(chunk, last)
+                    yield chunk
+                if self._is_sse and parser.done:
+                    break
+            if self._is_sse:
+                for chunk in self._sse_chunks(parser, parser.close()):
+                    last = self._emit(chunk, last)
+                    yield chunk
+            elif self._raw_kept and self._raw:
+                try:
+                    self.payload = json.loads(bytes(self._raw))
+                except ValueError:
+                    self.payload = None
+            self._finish()
+        finally:
+            self.close()
+
+    def _chunks(self, parser, text):
+        if self._is_sse:
+            return self._sse_chunks(parser, parser.feed(text))
+        chunk = parser.feed(text)
+        return [chunk] if chunk else []
+
+    def _sse_chunks(self, parser, events):
+        chunks = []
+        for data in events:
+            if data.strip() == "[DONE]":
+                parser.done = True
+                break
+            chunk, event = sse_text(data)
+            if event is not None:
+                self.payload = event
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def _finish(self):
+        self.stats["stream_total_ms"] = _ms(time.perf_counter_ns() - self._sent)
+        if self._gaps.count:
+            self.stats["stream_gap_p50_ms"] = round(self._gaps.percentile(50) * 1000, 3)
+            self.stats["stream_gap_p99_ms"] = round(self._gaps.percentile(99) * 1000, 3)
+            self.stats["stream_gap_max_ms"] = round(self._gaps.max_us / 1000, 3)
+
+    def __iter__(self):
+        if self._iterator is None:
+            self._iterator = self._generate()
+        return self._iterator
+
+    def read(self):
+        """Consume the rest of the stream and return the kept answer text."""
+        for _ in self:
+            pass
+        return self.text
+
+    def expect(self, predicate, within_chars=None, message=None):
+        """Read until ``predicate(text)`` holds, failing early if it cannot.
+
+        Raises ``AssertionError`` (and aborts the stream) when the answer ends,
+        or grows past ``within_chars`` characters, without satisfying the
+        predicate. The stream stays open on success so the caller can keep
+        reading or ``abort()``.
+        """
+        if predicate(self.text):
+            return self
+        for _ in self:
+            if predicate(self.text):
+                return self
+            if within_chars is not None and self._chars >= within_chars:
+                break
+        self.abort()
+        raise AssertionError(message or f"Answer did not match after {self._chars} characters: "
+                                        f"{self.text[:200]!r}")
+
+    def abort(self):
+        """Stop reading and drop the connection (it is not returned to the pool)."""
+        if not self.closed:
+            self.aborted = True
+            self.stats["stream_aborted"] = True
+            self._finish()
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stats["stream_truncated"] = self.truncated
+        self.stats.setdefault("stream_aborted", False)
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.closed:
+            self.abort()
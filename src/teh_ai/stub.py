@@ -0,0 +1,178 @@
+"""
+Local stub of the /ask API that replays recorded cassettes.
+
+Usage::
+
+    python -m teh_ai.stub cassettes/qa.jsonl --port 8080 --latency recorded
+
+then point the suite at it (any token is accepted)::
+
+    $env:TEH_AI_API_BASE_URL = "http://127.0.0.1:8080/qa/v2/ask"
+    $env:TEH_AI_TOKEN = "stub"
+
+Latency modes:
+
+* ``none``      - answer as fast as possible
+* ``recorded``  - sleep for the latency recorded with each interaction
+* ``empirical`` - sleep for a latency drawn from all recorded latencies
+* ``lognormal`` - sleep for a latency drawn from a lognormal distribution
+  with ``--median`` seconds and shape ``--sigma``
+
+``--compress-min-bytes N`` gzips bodies of at least N bytes for clients that
+accept gzip, like API Gateway's minimum compression size.
+"""
+import argparse
+import gzip
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from teh_ai.cassette import interaction_key, load_cassette
+
+LATENCY_MODES = ("none", "recorded", "empirical", "lognormal")
+# Hop-by-hop or encoding headers that no longer describe the stored (decoded) body,
+# and the Date/Server headers the stub's own HTTP server always sends
+DROPPED_HEADERS = {"connection", "content-encoding", "content-length", "keep-alive",
+                   "transfer-encoding", "date", "server"}
+
+
+class StubServer:
+    """Replay cassette interactions over HTTP.
+
+    Args:
+        interactions: Mapping from ``load_cassette``
+        latency: One of ``LATENCY_MODES``
+        median, sigma: Parameters of the lognormal latency mode
+        seed: Seed for the synthetic latency modes, for repeatable benchmarks
+        compress_min_bytes: Gzip bodies of at least this size when the client
+            accepts gzip (None never compresses)
+    """
+
+    def __init__(self, interactions, latency="none", median=1.0, sigma=0.5, seed=None,
+                 compress_min_bytes=None):
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Unknown latency mode {latency!r}")
+        self.interactions = interactions
+        self.latency = latency
+        self.median = median
+        self.sigma = sigma
+        self.compress_min_bytes = compress_min_bytes
+        self.recorded_latencies = [i["latency"] for group in interactions.values() for i in group]
+        self.served = 0
+
+        self._random = random.Random(seed)
+        self._cycles = {key: itertools.cycle(group) for key, group in interactions.items()}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _delay(self, interaction):
+        if self.latency == "recorded":
+            return interaction["latency"]
+        with self._lock:
+            if self.latency == "empirical" and self.recorded_latencies:
+                return self._random.choice(self.recorded_latencies)
+            if self.latency == "lognormal":
+                return self._random.lognormvariate(math.log(self.median), self.sigma)
+        return 0.0
+
+    def lookup(self, params):
+        """Next recorded interaction for these query parameters, or None."""
+        key = interaction_key(params)
+        cycle = self._cycles.get(key) or self._cycles.get((key[0], None, key[2]))
+        if cycle is None:
+            return None
+        with self._lock:
+            self.served += 1
+            return next(cycle)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"    # keep-alive, like the real gateway
+            # Send headers and body in one buffered write, without Nagle: two small
+            # writes on a reused connection otherwise wait ~40 ms for a delayed ACK
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                params = dict(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+                interaction = stub.lookup(params)
+                if interaction is None:
+                    body = json.dumps({"message": "No recorded interaction",
+                                       "params": params}).encode("utf-8")
+                    status, headers = 404, {"Content-Type": "application/json"}
+                else:
+                    time.sleep(stub._delay(interaction))
+                    response = interaction["response"]
+                    body = response["body"].encode("utf-8")
+                    status = response["status"]
+                    headers = {k: v for k, v in response["headers"].items()
+                               if k.lower() not in DROPPED_HEADERS}
+                if stub.compress_min_bytes is not None and len(body) >= stub.compress_min_bytes \
+                        and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=6)
+                    headers["Content-Encoding"] = "gzip"
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a background thread; returns the base URL (port 0 picks a free port)."""
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True).start()
+        return f"http://{host}:{self._server.server_port}"
+
+    def serve_forever(self, host="127.0.0.1", port=8080):
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        print(f"Replaying {sum(len(g) for g in self.interactions.values())} interaction(s) "
+              f"on http://{host}:{port} (latency={self.latency})")
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m teh_ai.stub",
+                                     description="Replay recorded /ask cassettes over HTTP.")
+    parser.add_argument("cassettes", nargs="+", help="cassette JSONL file(s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", choices=LATENCY_MODES, default="none")
+    parser.add_argument("--median", type=float, default=1.0, help="lognormal median seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal shape")
+    parser.add_argument("--seed", type=int, help="seed for synthetic latencies")
+    parser.add_argument("--compress-min-bytes", type=int,
+                        help="gzip bodies of at least this many bytes when the client accepts gzip")
+    args = parser.parse_args(argv)
+
+    stub = StubServer(load_cassette(*args.cassettes), latency=args.latency,
+                      median=args.median, sigma=args.sigma, seed=args.seed,
+                      compress_min_bytes=args.compress_min_bytes)
+    try:
+        stub.serve_forever(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+One asynchronous logging pipeline for every test in the process.
+
+All test logging goes through a single ``teh_ai.tests`` logger whose
+``QueueHandler`` hands records to one ``QueueListener`` thread, so logging
+never does I/O on the test thread and no logger or file handle is created per
+test. The listener formats each record into a bounded in-memory buffer of the
+test it belongs to: the ``test_id`` of a ``for_test`` adapter, or else the
+test currently running in this process (which also catches ``teh_ai.*``
+library logging such as the browser session). Unless the application set a
+level on the ``teh_ai`` logger, the capture sets it to ``library_level`` so
+library INFO records are kept instead of falling back to the root logger's
+WARNING.
+
+Buffers only reach the disk when asked: ``flush`` writes one test's lines to
+``<log_dir>/<test>.log`` (the conftest does this for failed tests, or for
+every test with ``TEH_AI_TEST_LOGS=all``); ``discard`` drops them.
+"""
+import logging
+import queue
+import re
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+LOGGER_NAME = "teh_ai.tests"
+DEFAULT_LOG_DIR = "test_results/test_logs"
+DEFAULT_MAX_LINES = 10_000
+FORMAT = "%(asctime)s [%(levelname)s] %(test_name)s: %(message)s"
+
+
+class _RoutingHandler(logging.Handler):
+    """Runs on the listener thread: formats each record into its test's buffer."""
+
+    def __init__(self, capture):
+        super().__init__(logging.DEBUG)
+        self.capture = capture
+        self.setFormatter(logging.Formatter(FORMAT))
+
+    def emit(self, record):
+        test_id = getattr(record, "test_id", None)
+        if test_id is None:
+            return
+        if not hasattr(record, "test_name"):
+            record.test_name = record.name
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.capture._append(test_id, line)
+
+
+class _TestQueueHandler(QueueHandler):
+    """Queues a copy of each record, tagged with the running test when it carries no test id."""
+
+    def __init__(self, log_queue, capture):
+        super().__init__(log_queue)
+        self.capture = capture
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        if getattr(record, "test_id", None) is None:
+            record.test_id = self.capture.current
+        return record
+
+
+class TestLogCapture:
+    """Per-test log buffers fed by one ``QueueHandler``/``QueueListener`` pair.
+
+    Args:
+        log_dir: Folder ``flush`` writes ``<test>.log`` files to
+        max_lines: Lines kept per test (the oldest are dropped beyond it)
+        level: Level of the ``teh_ai.tests`` logger
+        library_level: Level set on the ``teh_ai`` package logger while it has
+            none of its own (an explicitly configured level is left alone)
+    """
+
+    __test__ = False    # not a pytest test class despite the name
+
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, max_lines=DEFAULT_MAX_LINES, level=logging.DEBUG,
+                 library_level=logging.INFO):
+        self.log_dir = Path(log_dir)
+        self.max_lines = max_lines
+        self.current = None
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._handler = _TestQueueHandler(self._queue, self)
+        self._listener = QueueListener(self._queue, _RoutingHandler(self),
+                                       respect_handler_level=True)
+        self._listener.start()
+
+        # Records of teh_ai.tests and every teh_ai.* library logger pass through here
+        self._package_logger = logging.getLogger("teh_ai")
+        self._package_logger.addHandler(self._handler)
+        self._package_level = self._package_logger.level
+        if self._package_level == logging.NOTSET:
+            self._package_logger.setLevel(library_level)
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(level)
+
+    def _append(self, test_id, line):
+        with self._lock:
+            buffer = self._buffers.get(test_id)
+            if buffer is None:
+                buffer = self._buffers[test_id] = deque(maxlen=self.max_lines)
+            buffer.append(line)
+
+    def start(self, test_id):
+        """Mark ``test_id`` as the test running in this process."""
+        self.current = test_id
+
+    def for_test(self, test_id, name=None):
+        """A logger for one test; its records are routed to that test's buffer."""
+        return logging.LoggerAdapter(self.logger, {"test_id": test_id,
+                                                   "test_name": name or test_id})
+
+    def drain(self):
+        """Wait until the listener has buffered every record logged so far."""
+        self._queue.join()
+
+    def lines(self, test_id):
+        """The buffered log lines of a test."""
+        self.drain()
+        with self._lock:
+            return list(self._buffers.get(test_id, ()))
+
+    def flush(self, test_id, name=None):
+        """Append a test's buffered lines to ``<log_dir>/<name>.log``; returns the path or None."""
+        self.drain()
+        with self._lock:
+            lines = self._buffers.pop(test_id, None)
+        if not lines:
+            return None
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        path = self.log_dir / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name or test_id)}.log"
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def discard(self, test_id):
+        """Drop a test's buffered lines."""
+        self.drain()
+        with self._lock:
+            self._buffers.pop(test_id, None)
+        if self.current == test_id:
+            self.current = None
+
+    def buffered_tests(self):
+        with self._lock:
+            return len(self._buffers)
+
+    def close(self):
+        """Stop the listener and detach from the ``teh_ai`` logger, restoring its level."""
+        self._package_logger.removeHandler(self._handler)
+        self._package_logger.setLevel(self._package_level)
+        self._listener.stop()
+
+
+_capture = None
+
+
+def get_test_log_capture():
+    """Get or create the process-wide capture."""
+    global _capture
+    if _capture is None:
+        _capture = TestLogCapture()
+    return _capture
+
+
+def configure_test_log_capture(**kwargs):
+    """Replace the process-wide capture, e.g. with another ``log_dir``."""
+    global _capture
+    if _capture is not None:
+        _capture.close()
+    _capture = TestLogCapture(**kwargs)
+    return _capture
@@ -0,0 +1,252 @@
+"""
+Token provider that keeps the request path off the browser.
+
+* The token lives in memory; the token cache file is only re-read when its
+  mtime changes (e.g. another worker refreshed it).
+* Expiry comes from the JWT ``exp`` claim instead of a fixed 3500s guess.
+* A cross-process lock file makes sure only one worker launches the browser;
+  the others wait and pick up the refreshed file.
+* A background thread renews the token ``refresh_margin`` seconds before it
+  expires, so questions only wait on a browser launch when no valid token
+  exists at all (first run). The margin is capped at half the token's
+  lifetime, and the browser is never asked again within
+  ``MIN_REFRESH_INTERVAL`` seconds, so short-lived tokens cannot cause a
+  refresh loop.
+"""
+import base64
+import json
+import os
+import threading
+import time
+
+DEFAULT_TTL = 3500          # Used when the token is not a JWT with an exp claim
+EXPIRY_SKEW = 60            # Treat tokens as expired this many seconds early
+MAX_MARGIN_FRACTION = 0.5   # Never renew earlier than this share of the token lifetime
+MIN_REFRESH_INTERVAL = 5    # Seconds between two browser fetches at the least
+
+
+def jwt_expiry(token):
+    """Return the ``exp`` claim of a JWT as a UNIX timestamp, or None."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class FileLock:
+    """Cross-process lock based on exclusively creating ``path``.
+
+    Works the same on Windows and POSIX. A lock file older than
+    ``stale_after`` seconds is assumed to belong to a crashed process and is
+    taken over (see ``_take_over_stale``).
+    """
+
+    def __init__(self, path, timeout=180, stale_after=300, poll=0.2):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll = poll
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return
+            except FileExistsError:
+                if self._take_over_stale():
+                    continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for lock {self.path}")
+            time.sleep(self.poll)
+
+    def _take_over_stale(self):
+        """Move a stale lock file out of the way; True when the lock is worth trying again.
+
+        Checking the age and then deleting would let two waiters that both saw
+        the stale file delete it one after the other, the second one removing
+        the fresh lock the first had just created. The file is renamed away
+        instead, so only one waiter gets it, and a waiter whose rename caught
+        a lock file that is not stale (a newer one) links it back.
+        """
+        if not self._is_stale(self.path):
+            return not os.path.exists(self.path)
+        grave = f"{self.path}.{os.getpid()}.{threading.get_ident()}.stale"
+        try:
+            os.rename(self.path, grave)
+        except FileNotFoundError:
+            return True         # another waiter took it over first
+        except OSError:
+            return False
+        try:
+            if not self._is_stale(grave):
+                os.link(grave, self.path)   # not the stale file: give the fresh lock back
+        except OSError:
+            pass
+        os.remove(grave)
+        return True
+
+    def _is_stale(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.stale_after
+        except FileNotFoundError:
+            return False
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class TokenProvider:
+    """Cached, lock-protected, proactively renewed access token.
+
+    Args:
+        token_file: JSON cache shared by all workers
+        fetch: Callable returning ``(token, user_id, conversation_id)`` from the browser
+        refresh_margin: Renew this many seconds before expiry
+        lock_timeout: Max seconds to wait for another worker's refresh
+    """
+
+    def __init__(self, token_file, fetch, refresh_margin=300, lock_timeout=180):
+        self.token_file = token_file
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.lock = FileLock(f"{token_file}.lock", timeout=lock_timeout)
+
+        self._data = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._wake = threading.Event()
+        self._scheduler = None
+
+    def _load(self):
+        """Return cached data, re-reading the file only if its mtime changed."""
+        try:
+            mtime = os.stat(self.token_file).st_mtime_ns
+        except FileNotFoundError:
+            return self._data
+        if mtime != self._mtime:
+            try:
+                with open(self.token_file) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return self._data
+            with self._lock:
+                self._data, self._mtime = data, mtime
+        return self._data
+
+    @staticmethod
+    def _valid(data, margin=0):
+        return bool(data) and time.time() < data["expires_at"] - margin
+
+    def _margin(self, data):
+        """``refresh_margin``, capped at ``MAX_MARGIN_FRACTION`` of the token lifetime."""
+        if not data or "fetched_at" not in data:
+            return self.refresh_margin
+        lifetime = max(data["expires_at"] - data["fetched_at"], 0)
+        return min(self.refresh_margin, lifetime * MAX_MARGIN_FRACTION)
+
+    def get(self):
+        """Return token data, blocking on the browser only if no valid token exists."""
+        data = self._load()
+        if not self._valid(data):
+            data = self.refresh()
+        elif not self._valid(data, self._margin(data)):
+            self._refresh_in_background()
+        self._ensure_scheduler()
+        return data
+
+    def refresh(self):
+        """Fetch a new token under the cross-process lock and cache it."""
+        with self._refreshing, self.lock:
+            # Another worker may have refreshed while we waited for the lock
+            data = self._load()
+            if self._valid(data, self._margin(data)):
+                return data
+            if data and time.time() - data.get("fetched_at", 0) < MIN_REFRESH_INTERVAL:
+                return data     # fetched moment ago; asking the browser again gives the same token
+
+            started = time.perf_counter()
+            print("Fetching new token from browser...")
+            token, user_id, conversation_id = self.fetch()
+            if not token or not user_id:
+                raise Exception("Token or userId not found in localStorage!")
+
+            exp = jwt_expiry(token)
+            data = {
+                "access_token": token,
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "expires_at": exp - EXPIRY_SKEW if exp else time.time() + DEFAULT_TTL,
+                "fetched_at": time.time(),
+            }
+            tmp = f"{self.token_file}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.token_file)   # readers never see a half-written file
+
+            with self._lock:
+                self._data, self._mtime = data, os.stat(self.token_file).st_mtime_ns
+            self._wake.set()
+            print(f"✅ Token cached ({time.perf_counter() - started:.1f}s).")
+            return data
+
+    def _refresh_in_background(self):
+        if self._refreshing.locked():
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Background token refresh failed:", str(e))
+
+        threading.Thread(target=run, name="token-refresh", daemon=True).start()
+
+    def _ensure_scheduler(self):
+        if self._scheduler is not None:
+            return
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._schedule, name="token-scheduler",
+                                                   daemon=True)
+                self._scheduler.start()
+
+    def _schedule(self):
+        """Renew the token shortly before it expires, for as long as the process lives."""
+        while True:
+            data = self._load()
+            if data:
+                delay = data["expires_at"] - self._margin(data) - time.time()
+            else:
+                delay = 60
+            self._wake.clear()
+            if delay > 0 and self._wake.wait(delay):
+                continue    # token was refreshed elsewhere; recompute the delay
+            data = self._load()
+            if self._valid(data, self._margin(data)):
+                continue
+            try:
+                data = self.refresh()
+            except Exception as e:
+                print("Scheduled token refresh failed:", str(e))
+                time.sleep(30)
+                continue
+            if not self._valid(data, self._margin(data)):
+                # The new token does not outlive the margin either: wait for it to expire
+                self._wake.clear()
+                self._wake.wait(max(data["expires_at"] - time.time(), MIN_REFRESH_INTERVAL))
@@ -1,42 +1,50 @@
 import logging
+import time
 import pathlib
 import glob
 import allure
 import pytest
-from teh_ai.response_logger import get_logger     # <-- import your logger
+from teh_ai.artifacts import configure_attachments, get_attachment_manager
+from teh_ai.testlog import DEFAULT_LOG_DIR, configure_test_log_capture, get_test_log_capture
+from teh_ai.metrics import serve_metrics
+from teh_ai.response_logger import configure_logger, get_logger, new_run_id     # <-- import your logger
+from teh_ai.evaluation import Evaluator
+from teh_ai.drift import DriftIndex
+from teh_ai.sharding import session_latencies
+from teh_ai.history import environment_label
+from teh_ai import playwrt2
+from teh_ai.playwrt2 import API_BASE_URL
 import allure
 
 @pytest.fixture(autouse=True)
-def test_logger(request, tmp_path):
-    """Create a per-test log file and attach it to the test node for later use.
+def test_logger(request):
+    """Logger for the running test, backed by one shared asynchronous pipeline.
 
-    The fixture yields a logger instance. After the test finishes, the
-    `pytest_runtest_makereport` hook will attach the log file to the Allure
-    result.
+    Records are buffered in memory per test (see ``teh_ai.testlog``); the
+    `pytest_runtest_makereport` hook writes the buffer to disk and attaches it
+    to the Allure result only when the test fails, or for every test with
+    ``TEH_AI_TEST_LOGS=all``.
     """
-    # sanitize test name to form a safe filename on Windows
-    import re
-    test_name = request.node.name
-    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', test_name)
-    log_file = tmp_path / f"{safe_name}.log"
+    capture = get_test_log_capture()
+    capture.start(request.node.nodeid)
+    try:
+        yield capture.for_test(request.node.nodeid, request.node.name)
+    finally:
+        capture.discard(request.node.nodeid)
 
-    logger = logging.getLogger(test_name)
-    logger.setLevel(logging.DEBUG)
 
-    handler = logging.FileHandler(log_file, encoding="utf-8")
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+@pytest.fixture
+def artifacts(request):
+    """Register files the test writes: ``artifacts(path, name=None, attachment_type=None)``.
 
-    # Make log path available on the node
-    request.node._test_log_path = str(log_file)
+    They are attached to this test's Allure result once its call finishes.
+    """
+    manager = get_attachment_manager()
 
-    try:
-        yield logger
-    finally:
-        # remove handler to flush
-        logger.removeHandler(handler)
-        handler.close()
+    def track(path, name=None, attachment_type=None):
+        manager.track(request.node.nodeid, path, name, attachment_type)
+        return path
+    return track
 
 
 @pytest.hookimpl(hookwrapper=True)
@@ -45,15 +53,27 @@ def pytest_runtest_makereport(item, call):
     outcome = yield
     rep = outcome.get_result()
 
+    # xdist worker: carry the responses logged since the last report to the controller's metrics
+    if hasattr(item.config, "workerinput"):
+        rep.teh_ai_responses = get_logger().metrics.take_forwarded()
+
+    # The buffered test log reaches the disk only for failures (or with TEH_AI_TEST_LOGS=all)
+    if rep.failed or (rep.when == "call" and os.environ.get("TEH_AI_TEST_LOGS") == "all"):
+        try:
+            log_path = get_test_log_capture().flush(item.nodeid, item.name)
+            if log_path:
+                get_attachment_manager().attach(log_path, name="test-log",
+                                                attachment_type=allure.attachment_type.TEXT)
+        except Exception:
+            pass
+
     # Only attach for the call phase (when the test actually ran)
     if rep.when == "call":
-        # Attach the per-test log file if present
-        log_path = getattr(item, "_test_log_path", None)
-        if log_path and pathlib.Path(log_path).exists():
-            try:
-                allure.attach.file(log_path, name="test-log", attachment_type=allure.attachment_type.TEXT)
-            except Exception:
-                pass
+        # Attach the files this test tracked with the artifacts fixture, each exactly once
+        try:
+            get_attachment_manager().attach_tracked(item.nodeid)
+        except Exception:
+            pass
 
         # Attach captured stdout/stderr if available
         try:
@@ -64,12 +84,6 @@ def pytest_runtest_makereport(item, call):
         except Exception:
             pass
 
-        # Attach any test response JSON files created by tests
-        for fname in glob.glob("test_response_*.json"):
-            try:
-                allure.attach.file(fname, name=pathlib.Path(fname).name, attachment_type=allure.attachment_type.JSON)
-            except Exception:
-                pass
 
 
 # import allure
@@ -102,49 +116,124 @@ import json
 # from response_logger import get_logger
 
 
-def pytest_sessionfinish(session, exitstatus):
-    logger = get_logger()
-    excel_path = logger.save_to_excel()
+def pytest_configure(config):
+    """One logger per process: the controller owns the run, xdist workers write shards."""
+    configure_attachments(getattr(config.option, "allure_report_dir", None),
+                          gzip_bytes=int(os.environ.get("TEH_AI_ATTACH_GZIP_BYTES", 1024 * 1024)))
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        shutil.rmtree(DEFAULT_LOG_DIR, ignore_errors=True)    # failed-test logs of the last run
+    configure_test_log_capture(max_lines=int(os.environ.get("TEH_AI_TEST_LOG_LINES", 10_000)))
+    if workerinput is None:
+        configure_logger(run_id=new_run_id(), evaluator=Evaluator.from_env(),
+                         drift_index=DriftIndex.from_env(environment_label(API_BASE_URL)))
+    else:
+        configure_logger(run_id=workerinput["teh_ai_run_id"], shard=workerinput["workerid"],
+                         evaluator=Evaluator.from_env(),
+                         drift_index=DriftIndex.from_env(environment_label(API_BASE_URL)))
+        get_logger().metrics.start_forwarding()
+
+    # Live metrics: Prometheus endpoint (one port per xdist worker) and a periodic summary line
+    global _config, _metrics_server, _next_summary
+    _config = config
+    port = os.environ.get("TEH_AI_METRICS_PORT")
+    if port:
+        offset = 0 if workerinput is None else int(workerinput["workerid"].lstrip("gw")) + 1
+        _metrics_server = serve_metrics(get_logger().metrics, int(port) + offset)
+        print(f"Live metrics: http://127.0.0.1:{_metrics_server.server_port}/metrics")
+    _next_summary = time.monotonic() + METRICS_INTERVAL
+
+
+_config = None
+_metrics_server = None
+_next_summary = None
+METRICS_INTERVAL = float(os.environ.get("TEH_AI_METRICS_INTERVAL", 30))
+
+
+def pytest_runtest_logfinish(nodeid, location):
+    """Print the live metrics line every ``TEH_AI_METRICS_INTERVAL`` seconds."""
+    global _next_summary
+    if METRICS_INTERVAL <= 0 or _next_summary is None or time.monotonic() < _next_summary:
+        return
+    _next_summary = time.monotonic() + METRICS_INTERVAL
+    metrics = get_logger().metrics
+    reporter = _config.pluginmanager.get_plugin("terminalreporter")
+    if metrics.responses and reporter is not None:
+        reporter.write_line(metrics.summary_line())
 
-    print("\n pytest_sessionfinish CALLED")
-    print("Collected responses:", len(logger.data))
-    print("Excel Path:", excel_path)
 
-    if not excel_path:
-        return
+def pytest_runtest_logreport(report):
+    """xdist controller: count the responses a worker logged into the live metrics."""
+    if hasattr(_config, "workerinput"):
+        return    # the worker's report still has to be sent with its responses
+    responses = report.__dict__.pop("teh_ai_responses", None)
+    if responses:
+        metrics = get_logger().metrics
+        for status_code, seconds in responses:
+            metrics.record(status_code, seconds)
 
-    # Find the Allure results directory
-    results_dir = (
-        session.config.option.allure_report_dir 
-        or session.config.option.allure_results_dir
-    )
 
-    if not results_dir:
-        print(" Allure is not enabled. Run pytest with --alluredir=allure-results")
-        return
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """Hand the run id and shard-planning latencies to every xdist worker."""
+    node.workerinput["teh_ai_run_id"] = get_logger().run_id
+    node.workerinput["teh_ai_latencies"] = session_latencies(node.config)
 
-    os.makedirs(results_dir, exist_ok=True)
 
-    # Unique ID for the attachment
-    attachment_uuid = str(uuid.uuid4())
-    attachment_filename = f"{attachment_uuid}-attachment.xlsx"
-    attachment_file_path = os.path.join(results_dir, attachment_filename)
+def pytest_sessionfinish(session, exitstatus):
+    logger = get_logger()
+    if hasattr(session.config, "workerinput"):
+        # Worker: make the shard durable; the controller merges and reports
+        logger.close()
+        get_attachment_manager().close()
+        get_test_log_capture().close()
+        if _metrics_server is not None:
+            _metrics_server.shutdown()
+        return
 
-    # Copy Excel file into allure-results
-    shutil.copyfile(str(excel_path), attachment_file_path)
+    logger.finish_scoring()
+    merged = logger.merge_shards()
+    if merged:
+        print(f"Merged {merged} responses from xdist worker shards")
+    excel_path = logger.save_to_excel()
+    logger.save_to_parquet()
+    logger.save_to_history(environment_label(API_BASE_URL))
+    drifted = logger.update_drift_index(rebase=os.environ.get("TEH_AI_DRIFT_REBASE") == "1")
+    for record in drifted:
+        print(f"DRIFT {record['Drift_Similarity']:.2f} vs run {record['Golden_Run_Id']}: {record['Query']}")
 
-    # Create the JSON metadata for Allure
-    attachment_json = {
-        "name": "API Responses Excel Report",
-        "source": attachment_filename,
-        "type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    }
+    print("\n pytest_sessionfinish CALLED")
+    print("Collected responses:", logger.count)
+    if playwrt2._client is not None and playwrt2._client.resilience is not None:
+        print("Retries / throttling:", playwrt2._client.resilience.summary())
+    print("Excel Path:", excel_path)
+    print(logger.metrics.total_line())
+    get_test_log_capture().close()
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
 
-    # Save JSON into allure-results
-    with open(os.path.join(results_dir, f"{attachment_uuid}-attachment.json"), "w") as f:
-        json.dump(attachment_json, f)
+    attachments = get_attachment_manager()
+    if attachments.results_dir is None:
+        print(" Allure is not enabled. Run pytest with --alluredir=allure-results")
+        return
 
-    print("Excel attached to Allure successfully.")
+    if excel_path:
+        attachments.attach_global(excel_path, name="API Responses Excel Report",
+                                  attachment_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    if drifted:
+        drift_path = excel_path.with_name(f"drifted_answers_{logger.run_id}.json") if excel_path \
+            else pathlib.Path("test_results") / f"drifted_answers_{logger.run_id}.json"
+        with open(drift_path, "w", encoding="utf-8") as f:
+            json.dump([{key: record.get(key) for key in
+                        ("Query", "Drift_Similarity", "Golden_Run_Id", "Response")}
+                       for record in drifted], f, indent=2)
+        attachments.attach_global(drift_path, name=f"Drifted answers ({len(drifted)})",
+                                  attachment_type=allure.attachment_type.JSON)
+    # Response files written outside the artifacts fixture, picked up once per run
+    for fname in glob.glob("test_response_*.json"):
+        attachments.attach_global(fname, attachment_type=allure.attachment_type.JSON)
+    attachments.close()
+    print("Allure attachments:", attachments.summary())
 
 
 
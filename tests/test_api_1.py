@@ -1,4 +1,5 @@
 
+import allure
 import pytest
 import json
 import re
@@ -7,10 +8,107 @@ import pandas as pd
 import os
 import time
 from pathlib import Path
-from teh_ai.playwrt2 import ask_api, get_token
+from teh_ai.playwrt2 import API_BASE_URL, ask_api, ask_api_stream, get_client, get_token
 from teh_ai.response_logger import get_logger     # <-- import your logger
+from teh_ai.conversation import Conversation, depth_report, load_dialogues, run_dialogues
+from teh_ai.corpus import Corpus
+from teh_ai.environments import compare_environments, save_report
+from teh_ai.cache import CacheMiss
+from teh_ai.benchmark import (DEFAULT_MIN_SAMPLES, baseline_path, collect_latencies, compare,
+                              load_baseline, save_baseline)
+from teh_ai.history import environment_label
+from teh_ai.load import run_load
+from teh_ai.runner import ask_many
+from teh_ai.sharding import plan_shards, session_latencies, worker_count
 import shutil
 
+# Number of questions sent to the API at the same time in the CSV suite
+CSV_CONCURRENCY = int(os.environ.get("TEH_AI_CONCURRENCY", "4"))
+
+# Load profile and latency SLOs (seconds) for test_api_performance (skipped without a duration)
+LOAD_DURATION = float(os.environ.get("TEH_AI_LOAD_DURATION", "0"))
+LOAD_CONCURRENCY = int(os.environ.get("TEH_AI_LOAD_CONCURRENCY", "2"))
+SLO_P50_SECONDS = float(os.environ.get("TEH_AI_SLO_P50", "15"))
+SLO_P99_SECONDS = float(os.environ.get("TEH_AI_SLO_P99", "30"))
+# Latency regression gate (test_latency_regression): calls per corpus question,
+# baseline file, significance level and the smallest median slowdown that fails
+BENCH_REPEATS = int(os.environ.get("TEH_AI_BENCH_REPEATS", "0"))
+BENCH_BASELINE = os.environ.get("TEH_AI_BENCH_BASELINE") or baseline_path(environment_label(API_BASE_URL))
+BENCH_ALPHA = float(os.environ.get("TEH_AI_BENCH_ALPHA", "0.01"))
+BENCH_MIN_SLOWDOWN = float(os.environ.get("TEH_AI_BENCH_MIN_SLOWDOWN", "1.1"))
+BENCH_UPDATE = os.environ.get("TEH_AI_BENCH_UPDATE") == "1"
+# Time-to-first-token SLO (seconds) for the streamed long answer
+SLO_TTFT_SECONDS = float(os.environ.get("TEH_AI_SLO_TTFT", "10"))
+LONG_QUESTION = ("Need to Upload Core Documents and Send for Authoring, "
+                 "give me the process or steps i need to follow")
+
+CSV_PATH = Path(__file__).parent / "test_questions.csv"
+# Question corpus (CSV, JSONL or Parquet) and how much of it to run
+CORPUS_PATH = Path(os.environ.get("TEH_AI_CORPUS", CSV_PATH))
+CORPUS_DOC_TYPES = [t for t in os.environ.get("TEH_AI_DOC_TYPES", "").split(",") if t] or None
+CORPUS_SAMPLE = int(os.environ["TEH_AI_SAMPLE"]) if os.environ.get("TEH_AI_SAMPLE") else None
+CORPUS_SEED = int(os.environ.get("TEH_AI_SAMPLE_SEED", "0"))
+# Item key to draw TEH_AI_SAMPLE questions per value of, e.g. "doc_type" (default: N in total)
+CORPUS_STRATIFY = os.environ.get("TEH_AI_SAMPLE_STRATIFY") or None
+DIALOGUES_PATH = Path(__file__).parent / "dialogues.json"
+# Environments compared side by side by test_environment_comparison, e.g. "qa,dev"
+COMPARE_ENVS = [env for env in os.environ.get("TEH_AI_COMPARE_ENVS", "").split(",") if env]
+# Parallel conversations per scripted dialogue in test_multi_turn_dialogues
+DIALOGUE_SESSIONS = int(os.environ.get("TEH_AI_DIALOGUE_SESSIONS", "2"))
+
+# question -> shard, filled in during collection by pytest_generate_tests
+_csv_shards = {}
+
+
+def load_csv_rows():
+    """``(id, question)`` of every corpus question selected for this run."""
+    corpus = Corpus(CORPUS_PATH, doc_types=CORPUS_DOC_TYPES, limit=CORPUS_SAMPLE,
+                    stratify=CORPUS_STRATIFY, seed=CORPUS_SEED)
+    return [(item["id"], item["question"]) for item in corpus]
+
+
+def pytest_generate_tests(metafunc):
+    """Give every CSV question its own test item, in latency-balanced xdist groups.
+
+    Run with ``pytest -n N --dist loadgroup`` to give each worker one shard.
+    """
+    if "csv_question" not in metafunc.fixturenames:
+        return
+    rows = load_csv_rows()
+    questions = [question for _, question in rows]
+    shards = plan_shards(questions, worker_count(metafunc.config),
+                         session_latencies(metafunc.config))
+    _csv_shards.update(zip(questions, shards))
+    metafunc.parametrize("csv_question", [
+        pytest.param(question, marks=pytest.mark.xdist_group(f"csv-shard-{shard}"),
+                     id=f"id{row_id}")
+        for (row_id, question), shard in zip(rows, shards)
+    ])
+
+
+class CsvBatches:
+    """Fetch a shard's answers together through ask_many when the first one is needed.
+
+    With ``--dist load`` the items of one shard may land on different
+    workers, so each item then fetches only its own question.
+    """
+
+    def __init__(self, shards, batch):
+        self.shards = shards
+        self.batch = batch
+        self.results = {}
+
+    def result(self, question):
+        if question not in self.results:
+            pending = [question]
+            if self.batch:
+                shard = self.shards[question]
+                pending = [q for q, s in self.shards.items()
+                           if s == shard and q not in self.results]
+            for result in ask_many(pending, concurrency=CSV_CONCURRENCY):
+                self.results[result["question"]] = result
+        return self.results.pop(question)
+
 
 @pytest.fixture(scope="session")
 def logger():
@@ -32,11 +130,22 @@ def api_client(token_data):
 
 
 
+def attach_timings(stats):
+    """Show the request id, per-phase and streaming timings of one call as Allure parameters."""
+    for name, value in (stats or {}).items():
+        if name == "request_id" or name.startswith(("phase_", "stream_")):
+            allure.dynamic.parameter(name, value, excluded=True)
+
+
 @pytest.fixture
 def test_questions():
-    csv_path = Path(__file__).parent / "test_questions.csv"
-    df = pd.read_csv(csv_path,encoding="latin1")
-    return df["question"].tolist()
+    return [question for _, question in load_csv_rows()]
+
+
+@pytest.fixture(scope="session")
+def csv_batches(request):
+    dist = request.config.getoption("dist", default="no")
+    return CsvBatches(_csv_shards, batch=dist in ("no", "loadgroup"))
 
 
 def test_token_retrieval(token_data, logger):
@@ -58,9 +167,11 @@ def test_token_retrieval(token_data, logger):
     "What is a binder template?"
 ])
 def test_ask_api_with_different_questions(question, logger):
-    start = time.time()
+    start = time.perf_counter()
     response = ask_api(question)
-    end = time.time()
+    end = time.perf_counter()
+    stats = get_client().last_stats
+    attach_timings(stats)
 
     assert isinstance(response, dict)
     assert "answer" in response or "message" in response
@@ -69,7 +180,9 @@ def test_ask_api_with_different_questions(question, logger):
         query=question,
         response=response,
         status_code=200,
-        execution_time=end - start
+        execution_time=end - start,
+        stats=stats,
+        raw=get_client().last_body
     )
 
 
@@ -96,28 +209,14 @@ def test_ask_api_with_different_questions(question, logger):
 
 
 
-def test_ask_api_with_questions_from_csv(test_questions, logger):
-    for question in test_questions:
-        start = time.time()
-        response = ask_api(question)
-        end = time.time()
-
-        assert isinstance(response, dict)
-        assert "answer" in response or "message" in response
+def test_ask_api_with_questions_from_csv(csv_question, csv_batches, logger):
+    result = csv_batches.result(csv_question)
+    attach_timings(result["stats"])
+    logger.log_results([result])
 
-        logger.log_response(
-            query=question,
-            response=response,
-            status_code=200,
-            execution_time=end - start
-        )
-
-        clean_filename = re.sub(r"[^\w\s-]", "", question)
-        clean_filename = re.sub(r"[-\s]+", "_", clean_filename)
-
-        # filepath = f"test_responses/test_response_{clean_filename}.json"
-        # with open(filepath, "w") as f:
-        #     json.dump(response, f, indent=2)
+    response = result["response"]
+    assert isinstance(response, dict)
+    assert "answer" in response or "message" in response
 
 
 # def test_ask_api_with_questions_from_csv(test_questions):
@@ -149,36 +248,108 @@ def test_ask_api_error_handling(logger):
 
 
 def test_conversation_context(api_client, logger):
-    start = time.time()
-    response1 = ask_api("What is RIM?")
-    mid = time.time()
-    response2 = ask_api("Tell me more about it")
-    end = time.time()
+    conversation = Conversation(get_client())
+    start = time.perf_counter()
+    response1, stats1 = conversation.ask("What is RIM?")
+    mid = time.perf_counter()
+    response2, stats2 = conversation.ask("Tell me more about it")
+    end = time.perf_counter()
+    attach_timings(stats2)
 
     assert response1 is not None
     assert response2 is not None
     assert response1 != response2
+    assert stats2["conversation_id"] == stats1["conversation_id"]
+
+    logger.log_response("What is RIM?", response1, 200, mid - start, stats=stats1)
+    logger.log_response("Tell me more about it", response2, 200, end - mid, stats=stats2)
+
 
-    logger.log_response("What is RIM?", response1, 200, mid - start)
-    logger.log_response("Tell me more about it", response2, 200, end - mid)
+def test_multi_turn_dialogues(logger):
+    records = run_dialogues(load_dialogues(DIALOGUES_PATH), sessions=DIALOGUE_SESSIONS)
+    logger.log_results(records)
+    report = depth_report(records)
+    print("conversation depth report -------", json.dumps(report))
 
+    conversation_ids = {r["conversation_id"] for r in records if r["turn"] == 1}
+    assert None not in conversation_ids
+    assert len(conversation_ids) == len({(r["dialogue"], r["session"]) for r in records})
+    assert not [r["error"] for r in records if r["error"]]
 
+
+def test_streamed_long_answer(logger):
+    start = time.perf_counter()
+    try:
+        stream = ask_api_stream(LONG_QUESTION)
+    except CacheMiss:
+        pytest.skip("streamed answers are not cached (TEH_AI_CACHE_MODE=replay-only)")
+    with stream:
+        # Fail as soon as the answer visibly goes wrong instead of waiting for all of it
+        stream.expect(lambda text: "document" in text.lower(), within_chars=2000,
+                      message="Answer does not talk about documents")
+        answer = stream.read()
+    end = time.perf_counter()
+    attach_timings(stream.stats)
+
+    logger.log_response(LONG_QUESTION + " (streamed)", stream.payload or {"answer": answer},
+                        stream.stats["status_code"], end - start, stats=stream.stats)
+
+    assert answer
+    assert stream.stats["stream_ttft_ms"] / 1000 <= SLO_TTFT_SECONDS
+
+
+@pytest.mark.skipif(len(COMPARE_ENVS) < 2, reason="set TEH_AI_COMPARE_ENVS to two or more environments")
+def test_environment_comparison(test_questions, artifacts):
+    rows, summary = compare_environments(test_questions, COMPARE_ENVS, concurrency=CSV_CONCURRENCY)
+    path = save_report(rows, summary, Path("test_results") / f"env_diff_{'_vs_'.join(COMPARE_ENVS)}.xlsx")
+    artifacts(path, name=path.name,
+              attachment_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    print("environment comparison -------", json.dumps(summary))
+
+    for name, env_summary in summary.items():
+        assert env_summary["errors"] == 0, f"{name} had errors"
+
+
+@pytest.mark.skipif(LOAD_DURATION <= 0, reason="set TEH_AI_LOAD_DURATION to run the load test")
 def test_api_performance(logger):
-    start = time.time()
-    response = ask_api("What is RIM?")
-    end = time.time()
-    print("status code-------")
+    report = run_load(["What is RIM?"], duration=LOAD_DURATION, model="closed",
+                      concurrency=LOAD_CONCURRENCY)
+    summary = report.summary()
+    print("load summary -------", summary)
+
+    logger.log_response("What is RIM? (performance)", summary, 200,
+                        summary["latency"]["p50"] or 0)
+
+    report.assert_slo(p50=SLO_P50_SECONDS, p99=SLO_P99_SECONDS, max_error_rate=0)
+
+
+@pytest.mark.skipif(BENCH_REPEATS < 2, reason="set TEH_AI_BENCH_REPEATS to time each question repeatedly")
+def test_latency_regression(logger, artifacts):
+    questions = [question for _, question in load_csv_rows()]
+    samples = collect_latencies(questions, BENCH_REPEATS)
+    environment = environment_label(API_BASE_URL)
+    save_baseline(Path("test_results") / f"latency_samples_{logger.run_id}.json", samples,
+                  environment, run_id=logger.run_id)
+
+    baseline = load_baseline(BENCH_BASELINE)
+    if baseline is None or BENCH_UPDATE:
+        save_baseline(BENCH_BASELINE, samples, environment, run_id=logger.run_id)
+    if baseline is None:
+        pytest.skip(f"No latency baseline yet; this run was saved as {BENCH_BASELINE}")
 
-    response_time = end - start
-    assert response_time < 30
+    report = compare(baseline, samples, alpha=BENCH_ALPHA, min_slowdown=BENCH_MIN_SLOWDOWN)
+    print("latency regression -------\n" + report.format())
+    print(json.dumps(report.summary()))
+    artifacts(report.save(Path("test_results") / f"latency_regression_{logger.run_id}.json"),
+              name="Latency regression report", attachment_type=allure.attachment_type.JSON)
 
-    logger.log_response("What is RIM? (performance)", response, 200, response_time)
+    if not report.tested:
+        pytest.fail(f"No question has {DEFAULT_MIN_SAMPLES} successful calls in both the baseline "
+                    "and this run; nothing was compared")
+    report.assert_no_regressions()
 
 
-# SAVE EXCEL AT THE END OF TEST SESSION
-def pytest_sessionfinish(session, exitstatus):
-    logger = get_logger()
-    logger.save_to_excel()
+# SAVE EXCEL AT THE END OF TEST SESSION: done once by pytest_sessionfinish in conftest.py
 # def pytest_sessionfinish(session, exitstatus):
 #     logger = get_logger()
 #     excel_path = logger.save_to_excel()   # Save Excel
@@ -0,0 +1,72 @@
+import gzip
+import json
+
+import pytest
+
+from teh_ai import artifacts as artifacts_module
+from teh_ai.artifacts import AttachmentManager
+
+
+class FakeReporter:
+    """Stands in for allure's reporter, so these tests don't attach to their own results."""
+
+    def __init__(self):
+        self.attachments = []
+
+    def _attach(self, uuid, name=None, attachment_type=None, extension=None):
+        self.attachments.append((name, attachment_type))
+        return f"{uuid}-attachment.{extension}"
+
+
+@pytest.fixture
+def reporter(monkeypatch):
+    fake = FakeReporter()
+    monkeypatch.setattr(artifacts_module, "_allure_reporter", lambda: fake)
+    return fake
+
+
+def test_each_artifact_is_attached_once_and_linked(tmp_path, reporter):
+    results = tmp_path / "allure-results"
+    manager = AttachmentManager(results)
+    log = tmp_path / "run.log"
+    log.write_text("hello\n")
+
+    manager.track("test_a", log, name="log")
+    manager.track("test_b", log, name="log")
+    assert manager.attach_tracked("test_a") == 1
+    assert manager.attach_tracked("test_b") == 0
+    assert manager.attach_tracked("test_c") == 0
+    manager.close()
+
+    [written] = results.glob("*-attachment.log")
+    assert written.read_text() == "hello\n"
+    assert manager.summary()["attached"] == 1
+    assert reporter.attachments == [("log", None)]
+    assert manager.summary()["linked"] + manager.summary()["copied"] == 1
+
+
+def test_large_json_is_attached_gzip_compressed(tmp_path, reporter):
+    results = tmp_path / "allure-results"
+    manager = AttachmentManager(results, gzip_bytes=100)
+    payload = tmp_path / "test_response_big.json"
+    payload.write_text(json.dumps({"answer": "x" * 1000}))
+
+    assert manager.attach(payload) is True
+    manager.close()
+
+    [written] = results.glob("*-attachment.json.gz")
+    assert json.loads(gzip.decompress(written.read_bytes())) == {"answer": "x" * 1000}
+    assert manager.summary()["compressed"] == 1
+    assert reporter.attachments == [("test_response_big.json", "application/gzip")]
+
+
+def test_without_results_dir_nothing_is_written(tmp_path, reporter):
+    manager = AttachmentManager(None)
+    path = tmp_path / "a.json"
+    path.write_text("{}")
+
+    manager.track("test_a", path)
+    assert manager.attach_tracked("test_a") == 0
+    assert manager.attach(tmp_path / "missing.json") is False
+    manager.close()
+    assert reporter.attachments == []
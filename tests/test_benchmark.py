@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from teh_ai.benchmark import (collect_latencies, compare, holm, load_baseline,
+                              mann_whitney_greater, save_baseline)
+from teh_ai.corpus import question_id
+
+
+def samples(latencies_by_query):
+    return {question_id(q): {"query": q, "latencies": list(map(float, latencies)), "errors": 0}
+            for q, latencies in latencies_by_query.items()}
+
+
+def test_mann_whitney_u_and_normal_approximation():
+    x = [1.83, 0.50, 1.62, 2.48, 1.68, 1.88, 1.55, 3.06, 1.30]
+    y = [0.878, 0.647, 0.598, 2.05, 1.06, 1.29, 1.06, 3.14, 1.29]
+    u, p = mann_whitney_greater(x, y)
+    assert u == 58.0
+    # z = (58 - 81/2 - 1/2) / sqrt(81 * 19 / 12), continuity-corrected
+    assert p == pytest.approx(0.06646, abs=1e-4)
+    assert mann_whitney_greater([1, 1, 1], [1, 1, 1]) == (4.5, 1.0)
+
+
+def test_holm_adjusts_in_input_order():
+    assert holm([0.04, 0.01, 0.03]).tolist() == pytest.approx([0.06, 0.03, 0.06])
+
+
+def test_only_significant_slowdowns_regress():
+    rng = np.random.default_rng(1)
+    base = {q: rng.lognormal(0, 0.2, 20) for q in ("same", "slower", "noisy", "faster")}
+    now = {"same": rng.lognormal(0, 0.2, 20), "slower": rng.lognormal(0.5, 0.2, 20),
+           "noisy": np.append(rng.lognormal(0, 0.2, 19), 30.0),
+           "faster": rng.lognormal(-0.5, 0.2, 20), "brand new": [1.0] * 20}
+    report = compare({"run_id": "base", "questions": samples(base)}, samples(now))
+
+    verdicts = {row["query"]: row["verdict"] for row in report.rows}
+    assert verdicts == {"same": "unchanged", "slower": "regressed", "noisy": "unchanged",
+                        "faster": "faster", "brand new": "new"}
+    slower = report.regressions[0]
+    assert slower["rank_biserial"] > 0.8
+    assert slower["ratio_ci_low"] > 1.2
+    assert "slower" in report.format().splitlines()[1]
+    with pytest.raises(AssertionError, match="'slower'"):
+        report.assert_no_regressions()
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def ask(self, question, timeout=None, use_cache=True):
+        assert not use_cache, "benchmark calls must bypass the response cache"
+        self.calls.append(question)
+        if question == "broken":
+            return {}, {"status_code": 500}
+        return {"answer": question}, {"status_code": 200}
+
+
+def test_collect_interleaves_questions_and_round_trips(tmp_path):
+    client = FakeClient()
+    collected = collect_latencies(["a", "broken"], repeats=3, client=client)
+
+    assert client.calls == ["a", "broken"] * 3
+    assert len(collected[question_id("a")]["latencies"]) == 3
+    assert collected[question_id("broken")] == {"query": "broken", "latencies": [], "errors": 3}
+
+    path = save_baseline(tmp_path / "baseline.json", collected, "qa", run_id="r1")
+    assert load_baseline(path)["questions"] == collected
+    assert load_baseline(tmp_path / "missing.json") is None
+    report = compare(load_baseline(path), collected)
+    assert {row["query"]: row["verdict"] for row in report.rows} == {"a": "too few", "broken": "too few"}
+    assert report.tested == []
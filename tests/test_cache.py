@@ -0,0 +1,141 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from teh_ai.cache import CacheMiss, ResponseCache
+from teh_ai.cassette import CassetteRecorder, load_cassette
+from teh_ai.client import NEW_CONVERSATION, AskClient
+from teh_ai.conversation import Conversation
+from teh_ai.runner import ask_many
+
+
+@pytest.fixture
+def conversations():
+    """Server that opens a new conversation id whenever none is sent."""
+    ids = itertools.count(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            conversation = params.get("conversationId") or f"c{next(ids)}"
+            body = json.dumps({"answer": f"re: {params['message']}",
+                               "conversationId": conversation}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def client(mode, recorder=None):
+        return AskClient(f"http://127.0.0.1:{server.server_address[1]}/qa/v2/ask",
+                         lambda: {"access_token": "t", "user_id": "u"},
+                         cache=ResponseCache(path=None, mode=mode), recorder=recorder)
+    yield client
+    server.shutdown()
+
+
+def test_new_conversations_bypass_the_cache(conversations):
+    client = conversations("read-through")
+    first, second = Conversation(client), Conversation(client)
+    _, stats_1 = first.ask("What is RIM?")
+    _, stats_2 = second.ask("What is RIM?")
+
+    assert stats_1["conversation_id"] != stats_2["conversation_id"]
+    assert "cache" not in stats_1 and "cache" not in stats_2
+
+    _, follow_up = first.ask("Tell me more")
+    _, again = Conversation(client, first.conversation_id).ask("Tell me more")
+    assert (follow_up["cache"], again["cache"]) == ("stored", "hit-memory")
+
+
+def test_replay_only_cannot_start_conversations(conversations):
+    with pytest.raises(CacheMiss):
+        conversations("replay-only").ask("What is RIM?", conversation_id=NEW_CONVERSATION)
+
+
+def test_use_cache_false_always_reaches_the_api(conversations):
+    client = conversations("read-through")
+    client.ask("What is RIM?", conversation_id="c1")
+    _, stats = client.ask("What is RIM?", conversation_id="c1", use_cache=False)
+    assert "cache" not in stats and stats["status_code"] == 200
+
+    with pytest.raises(CacheMiss):
+        conversations("replay-only").ask("What is RIM?", conversation_id="c1", use_cache=False)
+
+
+@pytest.mark.parametrize("backend", ["thread", "asyncio"])
+def test_ask_many_backends_share_cache_and_recorder(conversations, tmp_path, backend):
+    if backend == "asyncio":
+        pytest.importorskip("httpx")
+    recorder = CassetteRecorder(str(tmp_path / "cassette.jsonl"))
+    client = conversations("read-through", recorder)
+    questions = ["What is RIM?", "What is ROM?"]
+
+    first = ask_many(questions, concurrency=2, backend=backend, client=client)
+    second = ask_many(questions, concurrency=2, backend=backend, client=client)
+    recorder.close()
+
+    assert [r["stats"]["cache"] for r in first] == ["stored", "stored"]
+    assert [r["stats"]["cache"] for r in second] == ["hit-memory", "hit-memory"]
+    assert [r["response"] for r in second] == [r["response"] for r in first]
+    recorded = load_cassette(str(tmp_path / "cassette.jsonl"))
+    assert sorted(key[0] for key in recorded) == questions
+
+
+def test_memory_layer_evicts_least_recently_used():
+    cache = ResponseCache(path=None, max_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (1, "memory")
+    cache.put("c", 3)
+
+    assert cache.get("b") == (None, None)
+    assert cache.get("a") == (1, "memory") and cache.get("c") == (3, "memory")
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_entries_expire_in_both_layers(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(path=path, ttl=0.2)
+    cache.put("a", {"answer": "x"})
+    assert ResponseCache(path=path, ttl=0.2).get("a") == ({"answer": "x"}, "disk")
+
+    time.sleep(0.25)
+    assert cache.get("a") == (None, None)
+    cache.put("b", 1)     # writing evicts expired rows from disk
+    assert cache._db.execute("SELECT key FROM responses").fetchall() == [("b",)]
+
+
+def test_disk_layer_evicts_oldest_entries_beyond_max_bytes(tmp_path):
+    cache = ResponseCache(path=tmp_path / "cache.sqlite", max_items=1, max_bytes=250)
+    for key in "abcd":
+        cache.put(key, "x" * 100)     # 102 bytes each
+        time.sleep(0.01)
+
+    assert [row[0] for row in cache._db.execute("SELECT key FROM responses ORDER BY created")] \
+        == ["c", "d"]
+    assert cache.get("a") == (None, None)
+    assert cache.get("c") == ("x" * 100, "disk")
+
+
+def test_modes():
+    with pytest.raises(ValueError):
+        ResponseCache(path=None, mode="sometimes")
+    flags = {mode: (ResponseCache(path=None, mode=mode).reads, ResponseCache(path=None, mode=mode).writes)
+             for mode in ("read-through", "record", "replay-only")}
+    assert flags == {"read-through": (True, True), "record": (False, True),
+                     "replay-only": (True, False)}
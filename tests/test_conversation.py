@@ -0,0 +1,75 @@
+import itertools
+import json
+import threading
+import time
+
+from teh_ai.client import NEW_CONVERSATION
+from teh_ai.conversation import Conversation, depth_report, load_dialogues, run_dialogues
+
+
+class FakeClient:
+    """Stand-in for AskClient that hands out a new conversationId per new conversation."""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.calls = []
+        self.last_stats = None
+        self._lock = threading.Lock()
+
+    def ask(self, question, timeout=None, conversation_id=None):
+        with self._lock:
+            self.calls.append(conversation_id)
+            if conversation_id == NEW_CONVERSATION:
+                conversation_id = f"c{next(self.ids)}"
+        return {"answer": f"about {question}", "conversationId": conversation_id}, \
+            {"status_code": 200}
+
+
+def test_conversation_tracks_its_own_id():
+    client = FakeClient()
+    conversation = Conversation(client)
+
+    _, first = conversation.ask("What is RIM?")
+    _, second = conversation.ask("Tell me more about it")
+
+    assert client.calls == [NEW_CONVERSATION, "c1"]
+    assert (first["turn"], first["context_chars"]) == (1, 0)
+    assert second["turn"] == 2
+    assert second["context_chars"] == len("What is RIM?") + len("about What is RIM?")
+
+
+def test_dialogues_run_in_independent_conversations(tmp_path):
+    path = tmp_path / "dialogues.json"
+    path.write_text(json.dumps([{"name": "a", "turns": ["q1", "q2", "q3"]},
+                                {"turns": ["x1", "x2"]}]))
+    records = run_dialogues(load_dialogues(path), sessions=3, client=FakeClient(), concurrency=6)
+
+    assert len(records) == 3 * 3 + 3 * 2
+    assert len({r["conversation_id"] for r in records}) == 6
+    report = depth_report(records)
+    assert report[6]["conversations"] == 6
+    assert report[6]["turns"][3]["requests"] == 3
+    assert report[6]["seconds_per_turn"] is not None
+
+
+def test_dialogues_run_at_most_concurrency_at_once():
+    client = FakeClient()
+    active, peak = [0], [0]
+    ask = client.ask
+
+    def slow_ask(*args, **kwargs):
+        with client._lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with client._lock:
+            active[0] -= 1
+        return ask(*args, **kwargs)
+
+    client.ask = slow_ask
+    records = run_dialogues([{"name": "a", "turns": ["q1", "q2"]}], sessions=10, client=client,
+                            concurrency=3)
+
+    assert peak[0] == 3
+    assert len({r["conversation_id"] for r in records}) == 10
+    assert {r["concurrent_conversations"] for r in records} == {3}
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from teh_ai.corpus import Corpus, iter_corpus, question_id, sample, shard
+
+CSV_PATH = Path(__file__).parent / "test_questions.csv"
+
+
+@pytest.fixture
+def jsonl_corpus(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    rows = [{"question": f"Question {i}", "doc_type": "sharepoint" if i % 3 else "veeva",
+             "tags": ["binder"] if i % 2 else "upload; core"} for i in range(300)]
+    rows.append({"question": "  QUESTION   0 "})    # duplicate of "Question 0" once normalised
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return path
+
+
+def test_csv_items_keep_id_and_doc_type():
+    items = list(iter_corpus(CSV_PATH))
+
+    assert items[0]["id"] == "1"
+    assert items[0]["question"] == "What is RIM?"
+    assert items[0]["doc_type"] == "sharepoint"
+    assert items[0]["question_id"] == question_id("  what is   rim? ")
+
+
+def test_jsonl_filters_and_dedupe(jsonl_corpus):
+    assert len(list(iter_corpus(jsonl_corpus))) == 300
+    assert len(list(iter_corpus(jsonl_corpus, dedupe=False))) == 301
+    assert len(list(iter_corpus(jsonl_corpus, doc_types=["VEEVA"]))) == 100
+    assert len(list(iter_corpus(jsonl_corpus, tags=["core"]))) == 150
+
+
+def test_shards_partition_the_corpus(jsonl_corpus):
+    shards = [{item["question_id"] for item in shard(iter_corpus(jsonl_corpus), i, 4)}
+              for i in range(4)]
+
+    assert sum(map(len, shards)) == 300
+    assert set().union(*shards) == {item["question_id"] for item in iter_corpus(jsonl_corpus)}
+
+
+def test_sampling_is_seeded_and_stratified(jsonl_corpus):
+    first = sample(iter_corpus(jsonl_corpus), 10, seed=7, stratify="doc_type")
+    again = Corpus(jsonl_corpus, limit=10, stratify="doc_type", seed=7).head(100)
+    other = sample(iter_corpus(jsonl_corpus), 10, seed=8, stratify="doc_type")
+
+    assert first == again
+    assert first != other
+    assert sorted(item["doc_type"] for item in first) == ["sharepoint"] * 10 + ["veeva"] * 10
+    assert len(list(Corpus(jsonl_corpus, fraction=0.5, seed=1))) == pytest.approx(150, abs=30)
@@ -0,0 +1,55 @@
+import json
+
+from teh_ai.drift import DriftIndex, main, signature, similarity
+from teh_ai.response_logger import ResponseLogger
+
+ANSWER = ("A binder template predefines the sections, placeholders and documents of a "
+          "binder so that every new binder created from it starts with the same structure.")
+
+
+def test_signatures_estimate_jaccard_similarity():
+    reworded = ANSWER.replace("every new binder", "each binder")
+
+    assert similarity(signature(ANSWER), signature(ANSWER)) == 1.0
+    assert 0.3 < similarity(signature(ANSWER), signature(reworded)) < 1.0
+    assert similarity(signature(ANSWER), signature("Upload documents to Veeva Vault.")) < 0.1
+    assert signature("   ") is None
+
+
+def test_runs_build_the_index_incrementally_and_flag_drift(tmp_path):
+    path = str(tmp_path / "golden.sqlite")
+    first = ResponseLogger(output_dir=tmp_path, run_id="run1", drift_index=DriftIndex(path, "qa"))
+    first.log_response("What is a binder template?", {"answer": ANSWER}, 200, 1.0)
+    first.log_response("What is RIM?", {"error": "boom"}, 503, 1.0)
+    assert first.update_drift_index() == []
+    first.close()
+
+    index = DriftIndex(path, "qa")
+    assert len(index) == 1
+    assert len(DriftIndex(path, "dev")) == 0
+    second = ResponseLogger(output_dir=tmp_path, run_id="run2", drift_index=index)
+    second.log_response("what is a  binder template?", {"answer": ANSWER}, 200, 1.0)
+    second.log_response("What is a binder template?", {"answer": "Ask your administrator."}, 200, 1.0)
+    second.log_response("What is RIM?", {"answer": "Regulatory Information Management."}, 200, 1.0)
+
+    drifted = second.update_drift_index()
+    records = list(second.iter_records())
+    second.close()
+    assert records[0]["Drift_Similarity"] == 1.0 and records[0]["Drifted"] is False
+    assert records[0]["Golden_Run_Id"] == "run1"
+    assert [r["Query"] for r in drifted] == ["What is a binder template?"]
+    assert "Drifted" not in records[2]
+    assert index.summary()["golden_answers"] == 2
+
+
+def test_cli_seeds_the_index_from_logged_streams(tmp_path, capsys):
+    stream = tmp_path / "api_responses_20260101_000000_abc123.jsonl"
+    stream.write_text(json.dumps({"Query": "What is RIM?", "Status_Code": 200,
+                                  "Response": json.dumps({"answer": ANSWER})}) + "\n")
+    index_path = str(tmp_path / "golden.sqlite")
+
+    main([str(stream), "--env", "qa", "--index", index_path])
+
+    assert "1 golden answers" in capsys.readouterr().out
+    assert DriftIndex(index_path, "qa").check("What is RIM?", {"answer": ANSWER})["golden_run_id"] \
+        == "20260101_000000_abc123"
@@ -0,0 +1,89 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from teh_ai.environments import compare_environments, get_environment, load_profiles
+
+
+def _answering(prefix):
+    """Local /ask server answering ``<prefix> <message>``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            body = json.dumps({"answer": f"{prefix} {params['message']}"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_builtin_profiles_use_their_own_app_and_token_file(monkeypatch):
+    monkeypatch.delenv("TEH_AI_ENV", raising=False)
+    monkeypatch.delenv("TEH_AI_TOKEN", raising=False)
+    monkeypatch.delenv("TEH_AI_API_BASE_URL", raising=False)
+
+    dev, qa = get_environment("dev"), get_environment()
+
+    assert qa.name == "qa"
+    assert dev.app_origin == "https://dev.taskly.lilly.com"
+    assert qa.app_origin == "https://qa.taskly.lilly.com"
+    assert "/dev/" in dev.api_base_url and "/qa/" in qa.api_base_url
+    assert (dev.token_file, qa.token_file) == ("token_cache_dev.json", "token_cache.json")
+    assert dev.token_source == qa.token_source == "browser"
+
+
+def test_overrides_apply_to_the_active_profile_only(monkeypatch):
+    monkeypatch.setenv("TEH_AI_ENV", "qa")
+    monkeypatch.setenv("TEH_AI_API_BASE_URL", "http://127.0.0.1:8080/qa/v2/ask")
+    monkeypatch.setenv("TEH_AI_TOKEN", "stub")
+
+    assert get_environment("qa").api_base_url == "http://127.0.0.1:8080/qa/v2/ask"
+    assert get_environment("qa").token_source == "static"
+    assert get_environment("dev").token_source == "browser"
+    with pytest.raises(KeyError):
+        get_environment("prod")
+
+
+def test_fan_out_reports_latency_and_answer_diff(monkeypatch, tmp_path):
+    servers = {"old": _answering("Answer:"), "new": _answering("New answer:")}
+    profiles = {name: {"api_base_url": f"http://127.0.0.1:{server.server_port}/{name}/v2/ask",
+                       "app_url": f"https://{name}.example/"}
+                for name, server in servers.items()}
+    env_file = tmp_path / "envs.json"
+    env_file.write_text(json.dumps(profiles))
+    monkeypatch.setenv("TEH_AI_ENV_FILE", str(env_file))
+    monkeypatch.setenv("TEH_AI_TOKEN_OLD", "t1")
+    monkeypatch.setenv("TEH_AI_TOKEN_NEW", "t2")
+    assert set(profiles) <= set(load_profiles())
+
+    try:
+        rows, summary = compare_environments(["What is RIM?", "What is a binder?"],
+                                             ["old", "new"], concurrency=2)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+
+    assert [row["Question"] for row in rows] == ["What is RIM?", "What is a binder?"]
+    assert rows[0]["old_Answer"] == "Answer: What is RIM?"
+    assert rows[0]["new_Answer"] == "New answer: What is RIM?"
+    assert rows[0]["new_Same_Answer"] is False
+    assert 0 < rows[0]["new_Similarity"] < 1
+    assert "new_Latency_Delta_Seconds" in rows[0]
+    assert summary["new"]["changed_answers"] == 2
+    assert summary["old"]["errors"] == summary["new"]["errors"] == 0
@@ -0,0 +1,75 @@
+import json
+
+from teh_ai.evaluation import (Evaluator, FormatScorer, GoldenSet, SimilarityScorer, score_batch,
+                               _init_worker)
+from teh_ai.response_logger import ResponseLogger
+
+GOLDEN = [
+    {"question": "What is RIM?",
+     "answer": "RIM is Regulatory Information Management for submissions and registrations.",
+     "keywords": "regulatory, submissions"},
+    {"question": "What is a binder template?",
+     "answer": "A binder template predefines the sections and documents of a binder.",
+     "keywords": ["binder", "sections"]},
+]
+
+
+def _item(question, answer, record_id="r1"):
+    return {"record_id": record_id, "question": question, "answer": answer, "status_code": 200}
+
+
+def test_similarity_ranks_close_answers_higher():
+    golden = GoldenSet(GOLDEN)
+    items = [_item("What is RIM?", GOLDEN[0]["answer"]),
+             _item("what is  rim?", "RIM manages regulatory submissions."),
+             _item("What is RIM?", "Sunny weather tomorrow."),
+             _item("Unknown question", "anything")]
+
+    scores = [s["golden_similarity"] for s in SimilarityScorer().score_batch(items, golden)]
+
+    assert scores[0] == 1.0
+    assert 0 < scores[1] < 1
+    assert scores[2] == 0
+    assert scores[3] is None
+
+
+def test_builtin_scorers_in_one_batch(tmp_path):
+    path = tmp_path / "golden.jsonl"
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in GOLDEN))
+    _init_worker(str(path), ("format", "keywords", "similarity"))
+
+    [scores] = score_batch([_item("What is a binder template?",
+                                  "1. Open the binder\n2. Pick a template")])
+
+    assert scores["record_id"] == "r1"
+    assert scores["numbered_steps"] == 2
+    assert scores["keyword_coverage"] == 0.5
+    assert scores["missing_keywords"] == "sections"
+    assert scores["golden_similarity"] > 0
+
+
+def test_failed_calls_are_error_answers():
+    items = [_item("q", "fine"), dict(_item("q", ""), status_code=0),
+             dict(_item("q", "busy"), status_code=503), dict(_item("q", ""), error="timeout")]
+
+    flags = [s["error_answer"] for s in FormatScorer().score_batch(items, GoldenSet())]
+
+    assert flags == [False, True, True, True]
+
+
+def test_logger_joins_scores_written_asynchronously(tmp_path):
+    golden = tmp_path / "golden.jsonl"
+    golden.write_text("".join(json.dumps(entry) + "\n" for entry in GOLDEN))
+    evaluator = Evaluator(golden_path=str(golden), workers=1, batch_size=2, max_wait=0.05)
+    logger = ResponseLogger(output_dir=tmp_path, evaluator=evaluator)
+
+    for entry in GOLDEN:
+        logger.log_response(entry["question"], {"answer": entry["answer"]}, 200, 0.1)
+    logger.log_response("What is RIM?", {"error": "boom"}, 503, 0.1)
+    logger.finish_scoring()
+
+    records = list(logger.iter_records())
+    logger.close()
+    assert evaluator.summary()["scored"] == 3
+    assert [r["Score_Golden_Similarity"] for r in records[:2]] == [1.0, 1.0]
+    assert records[2]["Score_Error_Answer"] is True
@@ -0,0 +1,68 @@
+import json
+
+import pandas as pd
+import pytest
+
+from teh_ai import excel_export
+
+
+@pytest.fixture(params=["xlsxwriter", "openpyxl"])
+def backend(request, monkeypatch):
+    if request.param == "openpyxl":
+        monkeypatch.setattr(excel_export, "_open_book", excel_export._OpenpyxlBook)
+    return request.param
+
+
+def test_sheets_roll_over_across_chunks(tmp_path, backend):
+    records = ({"Query": f"q{i}", "Response": "x" * (30 if i in (3, 7) else 5), "Status_Code": 200}
+               for i in range(12))
+    path = tmp_path / "out.xlsx"
+
+    written = excel_export.write_records(records, path, rows_per_sheet=5, max_cell_chars=10,
+                                         chunk_rows=2)
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert written == 12
+    assert [len(sheets[name]) for name in ("Responses", "Responses_2", "Responses_3")] == [5, 5, 2]
+    assert sheets["Responses_2"]["Query"].tolist() == ["q5", "q6", "q7", "q8", "q9"]
+
+    overflow = sheets[excel_export.OVERFLOW_SHEET]
+    assert overflow[["Sheet", "Row", "Query"]].values.tolist() == [["Responses", 5, "q3"],
+                                                                   ["Responses_2", 4, "q7"]]
+    assert overflow["Text"].tolist() == ["x" * 30] * 2
+    assert sheets["Responses"]["Response"][3].startswith("x" * 10 + " ... [truncated")
+
+
+def test_nested_values_and_late_columns(tmp_path, backend):
+    records = [{"Query": "a", "Sources": ["Vault Help", "RIM Guide"]},
+               {"Query": "b", "Sources": []},
+               {"Query": "c", "Meta": {"turn": 2}}]
+    path = tmp_path / "out.xlsx"
+
+    excel_export.write_records(records, path, chunk_rows=2)
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    # "Meta" first shows up in the second chunk; the first pass put it in the only sheet
+    assert list(sheets) == ["Responses"]
+    assert sheets["Responses"].columns.tolist() == ["Query", "Sources", "Meta"]
+    assert sheets["Responses"]["Sources"].tolist()[:2] == ['["Vault Help","RIM Guide"]', "[]"]
+    assert json.loads(sheets["Responses"]["Meta"][2]) == {"turn": 2}
+
+
+def test_varying_keys_share_one_sheet_per_row_limit(tmp_path, backend):
+    def records():
+        for i in range(9):
+            record = {"Query": f"q{i}", "Status_Code": 200}
+            record[["Retries", "Cache", "Score_Relevance"][i % 3]] = i
+            yield record
+    path = tmp_path / "out.xlsx"
+
+    columns = excel_export.record_columns(records())
+    excel_export.write_records(records(), path, rows_per_sheet=6, chunk_rows=2, columns=columns)
+
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["Responses", "Responses_2"]
+    for sheet in sheets.values():
+        assert sheet.columns.tolist() == ["Query", "Status_Code", "Retries", "Cache", "Score_Relevance"]
+    assert sheets["Responses_2"]["Query"].tolist() == ["q6", "q7", "q8"]
+    assert sheets["Responses"]["Score_Relevance"].tolist()[2] == 2
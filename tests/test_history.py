@@ -0,0 +1,25 @@
+import json
+
+from teh_ai.history import ResultStore
+
+
+def records(answers, conversation):
+    return [{"Query": query, "Timestamp": "2026-01-01 10:00:00", "Status_Code": 200,
+             "Execution_Time_Seconds": 1.0,
+             "Response": json.dumps({"answer": answer, "conversationId": conversation,
+                                     "requestId": f"{conversation}-{i}"})}
+            for i, (query, answer) in enumerate(answers.items())]
+
+
+def test_compare_runs_ignores_conversation_and_request_ids(tmp_path):
+    store = ResultStore(tmp_path / "history")
+    store.append_run(records({"What is RIM?": "RIM is Regulatory Information Management.",
+                              "What is a binder?": "A set of documents."}, "c-1"),
+                     "run_a", "qa", "2026-01-01")
+    store.append_run(records({"What is RIM?": "RIM is Regulatory Information Management.",
+                              "What is a binder?": "A folder of documents."}, "c-2"),
+                     "run_b", "qa", "2026-01-02")
+
+    diff = store.compare_runs("run_a", "run_b").set_index("query")
+    assert diff["answer_changed"].to_dict() == {"What is RIM?": False, "What is a binder?": True}
+    assert store.list_runs()["run_id"].astype(str).tolist() == ["run_a", "run_b"]
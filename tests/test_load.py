@@ -0,0 +1,70 @@
+import math
+import random
+
+import pytest
+
+from teh_ai.histogram import LatencyHistogram
+from teh_ai.load import run_load
+
+
+class FakeClient:
+    """Stand-in for AskClient that answers instantly."""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+    def ask(self, question, timeout=None, use_cache=True):
+        assert not use_cache, "load calls must bypass the response cache"
+        return {"answer": question}, {"status_code": self.status_code}
+
+
+def test_histogram_percentiles_within_precision():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    assert histogram.count == 1000
+    assert histogram.percentile(50) == pytest.approx(0.5, rel=0.002)
+    assert histogram.percentile(99) == pytest.approx(0.99, rel=0.002)
+    assert histogram.percentile(99.9) == pytest.approx(0.999, rel=0.002)
+
+
+def test_histogram_precision_over_a_wide_range_and_merge():
+    rng = random.Random(7)
+    samples = [rng.lognormvariate(0, 1.5) for _ in range(20_000)]     # ~10 ms .. minutes
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for i, seconds in enumerate(samples):
+        (first if i % 2 else second).record(seconds)
+    first.merge(second)
+
+    ordered = sorted(samples)
+    assert first.count == len(samples)
+    for pct in (50, 90, 99, 99.9):
+        exact = ordered[max(1, math.ceil(len(samples) * pct / 100)) - 1]
+        assert first.percentile(pct) == pytest.approx(exact, rel=1 / 2 ** 10)
+    assert first.summary()["max"] == pytest.approx(ordered[-1], abs=1e-6)
+    assert first.mean() == pytest.approx(sum(samples) / len(samples), rel=1e-5)
+
+
+def test_empty_histogram_and_precision_mismatch():
+    assert LatencyHistogram().percentile(50) is None
+    assert LatencyHistogram().summary()["p99"] is None
+    with pytest.raises(ValueError):
+        LatencyHistogram().merge(LatencyHistogram(sub_bucket_bits=7))
+
+
+def test_closed_loop_report_and_slo():
+    report = run_load(["What is RIM?"], duration=0.2, concurrency=2, client=FakeClient())
+    summary = report.summary()
+
+    assert summary["requests"] > 0
+    assert summary["error_rate"] == 0
+    report.assert_slo(p99=1, max_error_rate=0)
+
+
+def test_slo_fails_on_errors():
+    report = run_load(duration=0.1, concurrency=1, client=FakeClient(status_code=503))
+
+    assert report.summary()["error_rate_by_status"] == {"503": 1.0}
+    with pytest.raises(AssertionError):
+        report.assert_slo(max_error_rate=0)
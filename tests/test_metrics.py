@@ -0,0 +1,73 @@
+import urllib.request
+
+import pytest
+
+from teh_ai.metrics import LiveMetrics, serve_metrics
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rolling_window_forgets_old_seconds():
+    clock = Clock()
+    metrics = LiveMetrics(window=10, clock=clock)
+    for _ in range(20):
+        metrics.record(503, 5.0)
+    clock.now += 30
+    for i in range(10):
+        metrics.record(200, 0.1 * (i + 1))
+        clock.now += 1
+
+    s = metrics.snapshot()
+    assert s["responses"] == 30 and s["errors"] == 20
+    assert s["statuses"] == {"503": 20, "200": 10}
+    assert s["window_error_rate"] == 0.0
+    assert s["throughput_rps"] == 0.9    # 9 of the 10 responses are inside the last 10 seconds
+    assert 0.85 <= s["window_latency"]["p95"] <= 1.05
+    assert s["latency"]["p95"] == pytest.approx(5.0, rel=1e-3)
+    assert len(metrics._seconds) <= 10
+    assert "30 responses, 0.9/s, errors 66.7% (last 10s 0.0%)" in metrics.summary_line()
+
+
+def test_worker_responses_are_forwarded_to_the_controller():
+    worker, controller = LiveMetrics(), LiveMetrics()
+    worker.record(200, 0.5)
+    assert worker.take_forwarded() == []    # not forwarding yet
+
+    worker.start_forwarding()
+    for status in (200, 500, 200):
+        worker.record(status, 0.5)
+    for status_code, seconds in worker.take_forwarded():
+        controller.record(status_code, seconds)
+
+    assert worker.take_forwarded() == []
+    s = controller.snapshot()
+    assert (s["responses"], s["errors"], s["statuses"]) == (3, 1, {"200": 2, "500": 1})
+    assert "3 responses" in controller.summary_line()
+    assert "errors 33.3%" in controller.total_line()
+
+
+def test_prometheus_endpoint_serves_the_metrics():
+    metrics = LiveMetrics()
+    metrics.record(200, 0.25)
+    metrics.record(0, 1.0)
+    server = serve_metrics(metrics, 0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert 'teh_ai_responses_total{status="200"} 1' in body
+    assert 'teh_ai_responses_total{status="0"} 1' in body
+    assert "teh_ai_errors_total 1" in body
+    assert "teh_ai_latency_seconds_count 2" in body
+    assert 'teh_ai_window_latency_seconds{quantile="0.5"}' in body
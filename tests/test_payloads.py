@@ -0,0 +1,62 @@
+import json
+
+import pandas as pd
+import pytest
+
+from teh_ai import codec
+from teh_ai.cassette import interaction_key
+from teh_ai.client import AskClient
+from teh_ai.response_logger import ResponseLogger
+from teh_ai.stub import StubServer
+
+ANSWER = {"answer": "Open the binder, pick a template and add the sections. " * 40,
+          "sources": ["Vault Help", "RIM Guide"]}
+
+
+@pytest.fixture
+def gzip_stub():
+    body = json.dumps(ANSWER)
+    interaction = {"request": {"params": {"message": "q"}}, "latency": 0,
+                   "response": {"status": 200, "headers": {"Content-Type": "application/json"},
+                                "body": body}}
+    stub = StubServer({interaction_key({"message": "q"}): [interaction]}, compress_min_bytes=100)
+    base_url = stub.start()
+    yield AskClient(f"{base_url}/qa/v2/ask", lambda: {"access_token": "t", "user_id": "u"})
+    stub.stop()
+
+
+def test_compressed_answers_report_wire_and_decoded_bytes(gzip_stub):
+    payload, stats = gzip_stub.ask("q")
+
+    assert payload == ANSWER
+    assert stats["content_encoding"] == "gzip"
+    assert stats["body_bytes"] == len(json.dumps(ANSWER).encode())
+    assert 0 < stats["wire_bytes"] < stats["body_bytes"] / 5
+    assert gzip_stub.last_body == json.dumps(ANSWER).encode()
+
+
+def test_logger_keeps_the_raw_body_and_reports_sizes(gzip_stub, tmp_path):
+    logger = ResponseLogger(output_dir=tmp_path)
+    payload, stats = gzip_stub.ask("q")
+    logger.log_response("q", payload, 200, 0.1, stats=stats, raw=gzip_stub.last_body)
+    logger.log_response("small", {"answer": "é"}, 200, 0.1)
+
+    path = logger.save_to_excel()
+    records = list(logger.iter_records())
+    logger.close()
+
+    assert records[0]["Response"] == json.dumps(ANSWER)
+    assert records[1]["Response"] == '{"answer":"é"}'
+    sizes = pd.read_excel(path, sheet_name="Sizes").set_index("Column")
+    assert sizes.loc["Response_Bytes", "Count"] == 2
+    assert sizes.loc["Wire_Bytes", "Body_To_Wire_Ratio"] > 5
+    histogram = pd.read_excel(path, sheet_name="Size_Histogram")
+    assert histogram.groupby("Column")["Count"].sum().to_dict() == \
+        {"Body_Bytes": 1, "Response_Bytes": 2, "Wire_Bytes": 1}
+
+
+def test_codec_round_trips_and_falls_back():
+    assert codec.loads(codec.dumps({"a": [1, "ü"]}).encode()) == {"a": [1, "ü"]}
+    assert codec.dumps({1: 2 ** 70}) == '{"1":1180591620717411303424}'
+    assert codec.loads("NaN") != codec.loads("NaN")    # the standard library reads NaN literals
+    assert codec.dumps_line({"a": 1}) == b'{"a":1}\n'
@@ -0,0 +1,154 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from teh_ai.client import AskClient
+from teh_ai.runner import ask_many
+from teh_ai.resilience import (CircuitBreaker, CircuitOpenError, Resilience, TokenBucket,
+                               parse_retry_after)
+
+
+@pytest.fixture
+def flaky():
+    """Server answering with the queued statuses, then 200."""
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            status = statuses.pop(0) if statuses else 200
+            body = json.dumps({"answer": "ok"} if status == 200 else {"message": "busy"}).encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0.05")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def client(resilience, *queued):
+        statuses[:] = queued
+        return AskClient(f"http://127.0.0.1:{server.server_port}/ask",
+                         lambda: {"access_token": "t", "user_id": "u"}, resilience=resilience)
+
+    yield client
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_honour_retry_after_and_are_reported(flaky):
+    resilience = Resilience(backoff_base=0.01, seed=1)
+    client = flaky(resilience, 429, 503)
+
+    payload, stats = client.ask("q")
+
+    assert payload == {"answer": "ok"}
+    assert stats["retries"] == 2
+    assert stats["retry_wait_ms"] >= 50
+    assert stats["end_to_end_ms"] > stats["phase_total_ms"]
+    assert resilience.summary()["retries"] == 2
+
+
+@pytest.mark.parametrize("backend", ["thread", "asyncio"])
+def test_both_backends_share_the_attempt_loop(flaky, backend):
+    if backend == "asyncio":
+        pytest.importorskip("httpx")
+    resilience = Resilience(max_retries=1, failure_threshold=2, reset_timeout=60,
+                            backoff_base=0.01, seed=1)
+    client = flaky(resilience, 429, 200, 503, 503)
+
+    first, second, rejected = (ask_many([q], concurrency=1, backend=backend, client=client)[0]
+                               for q in ("a", "b", "c"))
+
+    assert first["error"] is None and first["stats"]["retries"] == 1
+    assert first["stats"]["retry_wait_ms"] >= 50
+    assert second["stats"]["status_code"] == 503 and second["stats"]["retries"] == 1
+    assert "Circuit open" in rejected["error"]
+    assert resilience.summary()["circuits"] == {client.base_url: "open"}
+
+
+def test_gives_up_after_max_retries(flaky):
+    client = flaky(Resilience(max_retries=1, backoff_base=0.01), 503, 503, 503)
+
+    with pytest.raises(requests.HTTPError):
+        client.ask("q")
+    assert client.last_stats["status_code"] == 503
+    assert client.last_stats["retries"] == 1
+
+
+def test_retry_budget_caps_retries(flaky):
+    resilience = Resilience(max_retries=5, backoff_base=0.001, budget_ratio=0, budget_reserve=1)
+    client = flaky(resilience, 503, 503, 503)
+
+    with pytest.raises(requests.HTTPError):
+        client.ask("q")
+    assert client.last_stats["retries"] == 1
+    assert resilience.summary()["budget_exhausted"] == 1
+
+
+def test_circuit_opens_and_fails_fast(flaky):
+    resilience = Resilience(max_retries=0, failure_threshold=2, reset_timeout=60)
+    client = flaky(resilience, 503, 503)
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.ask("q")
+    with pytest.raises(CircuitOpenError):
+        client.ask("q")
+    assert resilience.summary()["circuits"] == {client.base_url: "open"}
+
+
+def test_half_open_probe_closes_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    breaker.before_call()    # the single probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_before_the_request_releases_the_circuit(flaky):
+    resilience = Resilience(max_retries=0, failure_threshold=1, reset_timeout=0)
+    client = flaky(resilience, 503)
+    with pytest.raises(requests.HTTPError):
+        client.ask("q")
+
+    def token_endpoint_down():
+        raise RuntimeError("token endpoint down")
+
+    token_provider, client.token_provider = client.token_provider, token_endpoint_down
+    with pytest.raises(RuntimeError):
+        client.ask("q")    # the half-open probe fails before sending anything
+    client.token_provider = token_provider
+
+    client.ask("q")    # a new probe is let through and closes the circuit
+    assert resilience.summary()["circuits"] == {client.base_url: "closed"}
+
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
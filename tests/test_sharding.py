@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from teh_ai.corpus import question_id
+from teh_ai.sharding import historical_latencies, plan_shards, session_latencies, worker_count
+
+
+def config(numprocesses=None, workerinput=None):
+    cfg = SimpleNamespace(option=SimpleNamespace(numprocesses=numprocesses))
+    if workerinput is not None:
+        cfg.workerinput = workerinput
+    return cfg
+
+
+def test_plan_balances_expected_latency():
+    questions = [f"q{i}" for i in range(6)]
+    latencies = {question_id(q): seconds for q, seconds in zip(questions, [8, 7, 6, 5, 3, 3])}
+
+    shards = plan_shards(questions, 2, latencies)
+
+    totals = [sum(latencies[question_id(q)] for q, s in zip(questions, shards) if s == shard)
+              for shard in (0, 1)]
+    assert sorted(totals) == [16, 16]
+    assert plan_shards(questions, 2, latencies) == shards     # the same plan on every worker
+
+
+def test_plan_without_history_spreads_questions_evenly():
+    shards = plan_shards([f"q{i}" for i in range(7)], 3)
+    assert sorted(shards.count(shard) for shard in range(3)) == [2, 2, 3]
+    assert plan_shards(["a", "b"], 1) == [0, 0]
+    # unknown questions weigh the median of the known latencies
+    known = {question_id("slow"): 10.0, question_id("a"): 1.0, question_id("b"): 1.0}
+    shards = plan_shards(["slow", "a", "b", "new"], 2, known)
+    assert shards.count(shards[0]) == 1
+
+
+def test_worker_count_and_latencies_per_process(tmp_path):
+    assert worker_count(config()) == 1
+    assert worker_count(config(numprocesses=4)) == 4
+    assert worker_count(config(numprocesses="auto")) == 1
+    assert worker_count(config(workerinput={"workercount": 3})) == 3
+
+    assert session_latencies(config()) == {}
+    assert session_latencies(config(workerinput={"teh_ai_latencies": {"x": 1.0}})) == {"x": 1.0}
+    assert historical_latencies(tmp_path / "missing") == {}
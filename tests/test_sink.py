@@ -0,0 +1,69 @@
+import pytest
+
+from teh_ai.response_logger import ResponseLogger
+from teh_ai.sink import JsonlSink, read_records
+
+RECORDS = [{"Query": f"q{i}", "Response": "é" * 50 + str(i), "Status_Code": 200} for i in range(4)]
+
+
+def test_sink_appends_and_truncates(tmp_path):
+    with JsonlSink(tmp_path / "run.jsonl", fsync_every=2) as sink:
+        sink.write(RECORDS[0])
+        sink.write_many(RECORDS[1:3])
+        assert sink.count == 3
+        assert list(read_records(sink.path)) == RECORDS[:3]
+        sink.truncate()
+        sink.write(RECORDS[3])
+    assert list(read_records(tmp_path / "run.jsonl")) == RECORDS[3:]
+    with pytest.raises(ValueError):
+        sink.write(RECORDS[0])
+
+    with JsonlSink(tmp_path / "run.jsonl") as sink:   # reopening appends
+        sink.write(RECORDS[0])
+    assert list(read_records(sink.path)) == [RECORDS[3], RECORDS[0]]
+
+
+def test_torn_plain_line_is_skipped(tmp_path):
+    path = tmp_path / "run.jsonl"
+    with JsonlSink(path) as sink:
+        sink.write_many(RECORDS)
+    path.write_bytes(path.read_bytes()[:-7])
+
+    assert list(read_records(path)) == RECORDS[:3]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_torn_compressed_tail_is_tolerated(tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    sink = JsonlSink(tmp_path / "run.jsonl", compression=compression)
+    sink.write_many(RECORDS[:3])    # flushed: a crash after this keeps the three records
+    synced = sink.path.stat().st_size
+    sink.write_many(RECORDS[3:])
+    size = sink.path.stat().st_size
+    data = sink.path.read_bytes()    # the "crash": the stream is never closed
+
+    torn = tmp_path / f"torn{sink.path.suffix}"
+    for cut in range(synced, size):
+        torn.write_bytes(data[:cut])
+        assert list(read_records(torn))[:3] == RECORDS[:3]
+        torn.write_bytes(data[:cut] + bytes(64))    # blocks allocated but never written
+        records = list(read_records(torn))
+        assert records == RECORDS[:len(records)]
+    sink.close()
+    assert list(read_records(sink.path)) == RECORDS
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_logger_creates_its_stream_on_the_first_response(tmp_path, compression):
+    logger = ResponseLogger(output_dir=tmp_path, run_id="r1", compression=compression)
+    assert logger.count == 0 and list(logger.iter_records()) == []
+    assert logger.merge_shards() == 0
+    logger.close()
+    assert list(tmp_path.glob("api_responses_*")) == []
+
+    logger = ResponseLogger(output_dir=tmp_path, run_id="r2", compression=compression)
+    logger.log_response("q", {"answer": "a"})
+    logger.close()
+    assert [path.name for path in tmp_path.glob("api_responses_*")] == [logger.stream_file.name]
+    assert [record["Query"] for record in read_records(logger.stream_file)] == ["q"]
@@ -0,0 +1,46 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+# What a cached-token API run, every xdist worker and every CLI import up front
+STARTUP_MODULES = ["teh_ai.playwrt2", "teh_ai.response_logger", "teh_ai.evaluation",
+                   "teh_ai.drift", "teh_ai.sharding", "teh_ai.history", "teh_ai.load"]
+HEAVY_MODULES = {"pandas", "numpy", "pyarrow", "playwright", "openpyxl", "xlsxwriter"}
+BUDGET_MS = float(os.environ.get("TEH_AI_IMPORT_BUDGET_MS", 1000))
+
+
+def _importtime(modules):
+    """``{module: cumulative microseconds}`` of every module ``python -X importtime`` reports,
+    plus the total of the top-level imports under ``"<total>"``."""
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                            env=env, capture_output=True, text=True, check=True)
+    times = {"<total>": 0}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            times[match.group(3)] = int(match.group(1))
+            if len(match.group(2)) == 1:
+                times["<total>"] += int(match.group(1))
+    return times
+
+
+def test_startup_does_not_import_heavy_dependencies():
+    times = _importtime(STARTUP_MODULES)
+
+    assert "teh_ai.playwrt2" in times
+    loaded = {name.split(".")[0] for name in times}
+    assert not loaded & HEAVY_MODULES, f"imported at startup: {sorted(loaded & HEAVY_MODULES)}"
+
+
+@pytest.mark.skipif(os.environ.get("TEH_AI_IMPORT_BUDGET_MS") == "0", reason="import budget disabled")
+def test_startup_import_time_budget():
+    # Best of three cold starts, so a busy machine does not fail the check
+    total_ms = min(_importtime(STARTUP_MODULES)["<total>"] for _ in range(3)) / 1000
+
+    assert total_ms <= BUDGET_MS, f"teh_ai cold import took {total_ms:.0f} ms (budget {BUDGET_MS:.0f} ms)"
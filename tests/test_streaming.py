@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from teh_ai.cache import CacheMiss, ResponseCache
+from teh_ai.client import AskClient
+from teh_ai.streaming import JsonStringExtractor
+
+ANSWER = 'Step 1: open the "binder"\nStep 2: upload core documents – done \U0001F600'
+
+
+def _chunked_server(content_type, pieces, delay=0.01):
+    """Local server answering every GET with ``pieces`` as separate HTTP chunks."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for piece in pieces:
+                data = piece.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                time.sleep(delay)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(content_type, pieces, delay=0.01):
+        server = _chunked_server(content_type, pieces, delay)
+        servers.append(server)
+        return AskClient(f"http://127.0.0.1:{server.server_port}/ask",
+                         lambda: {"access_token": "t", "user_id": "u"})
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_extractor_handles_escapes_split_anywhere():
+    body = json.dumps({"status": "ok", "answer": ANSWER, "sources": []})
+    for size in (1, 2, 3, 7):
+        extractor = JsonStringExtractor()
+        text = "".join(extractor.feed(body[i:i + size]) for i in range(0, len(body), size))
+        assert text == ANSWER
+        assert extractor.state == "done"
+
+
+def test_json_body_streams_answer_and_payload(serve):
+    body = json.dumps({"answer": ANSWER, "conversationId": "c1"})
+    pieces = [body[i:i + 10] for i in range(0, len(body), 10)]
+    client = serve("application/json", pieces)
+
+    stream = client.ask_stream("q")
+    chunks = list(stream)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == ANSWER
+    assert stream.payload == {"answer": ANSWER, "conversationId": "c1"}
+    assert stream.stats["stream_format"] == "json"
+    assert 0 < stream.stats["stream_ttft_ms"] <= stream.stats["stream_total_ms"]
+    assert stream.stats["stream_gap_max_ms"] > 0
+
+
+def test_sse_events_and_done_marker(serve):
+    events = [f"data: {json.dumps({'delta': word})}\n\n" for word in ("Step", " one", " two")]
+    client = serve("text/event-stream", events + ["data: [DONE]\n\n", "data: ignored\n\n"])
+
+    stream = client.ask_stream("q")
+
+    assert stream.read() == "Step one two"
+    assert stream.stats["stream_format"] == "sse"
+    assert stream.stats["stream_chunks"] == 3
+
+
+def test_buffer_is_bounded(serve):
+    body = json.dumps({"answer": "x" * 5000})
+    client = serve("application/json", [body[i:i + 500] for i in range(0, len(body), 500)], 0)
+
+    stream = client.ask_stream("q", max_buffer=100)
+    stream.read()
+
+    assert len(stream.text) == 100
+    assert stream.truncated
+    assert stream.payload is None
+    assert stream.stats["stream_chars"] == 5000
+
+
+def test_expect_aborts_early(serve):
+    body = json.dumps({"answer": "unrelated text " * 50})
+    client = serve("application/json", [body[i:i + 20] for i in range(0, len(body), 20)])
+
+    stream = client.ask_stream("q")
+    with pytest.raises(AssertionError):
+        stream.expect(lambda text: "binder" in text, within_chars=40)
+
+    assert stream.aborted
+    assert stream.stats["stream_chars"] < len(body)
+
+
+def test_replay_only_stream_never_touches_the_network():
+    fetches = []
+
+    def token_provider():
+        fetches.append(1)
+        return {"access_token": "t", "user_id": "u"}
+
+    client = AskClient("http://127.0.0.1:1/qa/v2/ask", token_provider,
+                       cache=ResponseCache(path=None, mode="replay-only"))
+    with pytest.raises(CacheMiss):
+        client.ask_stream("What is RIM?")
+    assert fetches == [] and client.requests_sent == 0
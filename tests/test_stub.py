@@ -0,0 +1,102 @@
+import http.client
+import json
+
+import pytest
+import requests
+
+from teh_ai.cassette import CassetteRecorder, interaction_key, load_cassette
+from teh_ai.client import AskClient
+from teh_ai.runner import ask_many
+from teh_ai.stub import StubServer
+
+RECORDED_HEADERS = {"Content-Type": "application/json", "Date": "Mon, 01 Jan 2024 00:00:00 GMT",
+                    "Server": "gateway", "x-amzn-RequestId": "req-1"}
+
+
+def interaction(message, answer, latency=0.0):
+    return {"request": {"params": {"message": message}}, "latency": latency,
+            "response": {"status": 200, "headers": RECORDED_HEADERS,
+                         "body": json.dumps({"answer": answer})}}
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(*interactions):
+        server = StubServer({interaction_key(i["request"]["params"]): [i] for i in interactions})
+        servers.append(server)
+        return server, server.start()
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def client(base_url, recorder=None):
+    return AskClient(f"{base_url}/qa/v2/ask", lambda: {"access_token": "secret", "user_id": "u"},
+                     recorder=recorder)
+
+
+def test_cassette_round_trip(stub, tmp_path):
+    _, base_url = stub(interaction("What is RIM?", "Regulatory Information Management"))
+    recorder = CassetteRecorder(tmp_path / "qa.jsonl")
+    payload, _ = client(base_url, recorder).ask("What is RIM?")
+    recorder.close()
+
+    recorded = load_cassette(tmp_path / "qa.jsonl")
+    (key, [entry]), = recorded.items()
+    assert key == ("What is RIM?", None, "false")
+    assert entry["request"]["headers"]["Authorization"] == "<redacted>"
+    assert entry["response"]["headers"]["x-amzn-RequestId"] == "req-1"
+
+    replay, replay_url = stub(entry)
+    assert client(replay_url).ask("What is RIM?")[0] == payload
+    assert replay.served == 1
+    with pytest.raises(requests.HTTPError):
+        client(replay_url).ask("Never recorded")
+
+
+def test_replayed_headers_are_sent_once(stub):
+    _, base_url = stub(interaction("q", "a"))
+    connection = http.client.HTTPConnection(base_url.removeprefix("http://"))
+    connection.request("GET", "/qa/v2/ask?message=q")
+    headers = connection.getresponse().msg
+    connection.close()
+
+    assert len(headers.get_all("Date")) == 1
+    assert len(headers.get_all("Server")) == 1
+    assert headers["x-amzn-RequestId"] == "req-1"
+
+
+def test_keep_alive_replies_are_not_delayed(stub):
+    _, base_url = stub(interaction("q", "a"))
+    ask = client(base_url)
+    ask.ask("q")
+    stats = [ask.ask("q")[1] for _ in range(5)]
+
+    assert all(s["connection_reused"] for s in stats)
+    # two small writes per reply used to wait ~40 ms for the client's delayed ACK
+    assert min(s["elapsed_seconds"] for s in stats) < 0.02
+
+
+def test_failed_calls_do_not_report_the_previous_stats(stub):
+    _, base_url = stub(interaction("first", "one"))
+    tokens = iter([{"access_token": "secret", "user_id": "u"}])
+
+    def token_provider():
+        data = next(tokens, None)
+        if data is None:
+            raise RuntimeError("token endpoint down")
+        return data
+
+    results = ask_many(["first", "second"], concurrency=1,
+                       client=AskClient(f"{base_url}/qa/v2/ask", token_provider))
+    assert results[0]["stats"]["status_code"] == 200
+    assert results[1]["error"] == "token endpoint down" and results[1]["stats"] == {}
+
+    refused = AskClient("http://127.0.0.1:1/qa/v2/ask",
+                        lambda: {"access_token": "secret", "user_id": "u"})
+    refused._local.stats = {"status_code": 200}
+    with pytest.raises(requests.ConnectionError):
+        refused.ask("first")
+    assert refused.last_stats == {}
@@ -0,0 +1,86 @@
+import logging
+import threading
+
+import pytest
+
+from teh_ai.testlog import TestLogCapture
+
+
+@pytest.fixture
+def capture(tmp_path):
+    capture = TestLogCapture(log_dir=tmp_path / "logs", max_lines=3)
+    yield capture
+    capture.close()
+
+
+def test_records_are_routed_to_their_test(capture):
+    capture.for_test("t1", "first").info("one")
+    capture.for_test("t2", "second").warning("two")
+    capture.start("t2")
+    logging.getLogger("teh_ai.browser").warning("from a library, on another thread")
+    worker = threading.Thread(target=logging.getLogger("teh_ai.browser").error, args=("threaded",))
+    worker.start()
+    worker.join()
+
+    assert [line.split("] ", 1)[1] for line in capture.lines("t1")] == ["first: one"]
+    assert [line.split("] ", 1)[1] for line in capture.lines("t2")] == [
+        "second: two", "teh_ai.browser: from a library, on another thread", "teh_ai.browser: threaded"]
+
+
+@pytest.fixture
+def unconfigured_package_logger():
+    """The ``teh_ai`` logger without a level (the session capture has set one)."""
+    package = logging.getLogger("teh_ai")
+    level = package.level
+    package.setLevel(logging.NOTSET)
+    yield package
+    package.setLevel(level)
+
+
+def test_library_info_records_are_captured(unconfigured_package_logger, tmp_path):
+    capture = TestLogCapture(log_dir=tmp_path)
+    capture.start("t1")
+    logging.getLogger("teh_ai.client").info("library info")
+    logging.getLogger("teh_ai.client").debug("library debug")
+    lines = capture.lines("t1")
+    capture.close()
+
+    assert [line.split("] ", 1)[1] for line in lines] == ["teh_ai.client: library info"]
+    assert unconfigured_package_logger.level == logging.NOTSET
+
+
+def test_configured_package_level_is_kept(unconfigured_package_logger, tmp_path):
+    unconfigured_package_logger.setLevel(logging.ERROR)
+    capture = TestLogCapture(log_dir=tmp_path)
+    capture.start("t1")
+    logging.getLogger("teh_ai.client").warning("below the configured level")
+    lines = capture.lines("t1")
+    capture.close()
+
+    assert lines == [] and unconfigured_package_logger.level == logging.ERROR
+
+
+def test_buffers_are_bounded_and_flushed_only_on_demand(capture, tmp_path):
+    log = capture.for_test("t1", "test_x[a b]")
+    for i in range(5):
+        log.debug("line %d", i)
+
+    assert not (tmp_path / "logs").exists()
+    path = capture.flush("t1", "test_x[a b]")
+    assert path.name == "test_x_a_b_.log"
+    assert [line.rsplit(": ", 1)[1] for line in path.read_text().splitlines()] == \
+        ["line 2", "line 3", "line 4"]
+
+    capture.for_test("t2").info("passed test")
+    capture.discard("t2")
+    assert capture.flush("t2") is None
+    assert capture.buffered_tests() == 0
+
+
+def test_no_logger_is_created_per_test(capture):
+    before = len(logging.Logger.manager.loggerDict)
+    for i in range(100):
+        capture.for_test(f"t{i}", f"test_{i}").info("hello")
+        capture.discard(f"t{i}")
+
+    assert len(logging.Logger.manager.loggerDict) == before
@@ -0,0 +1,138 @@
+import base64
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from teh_ai.token_provider import EXPIRY_SKEW, FileLock, TokenProvider, jwt_expiry
+
+
+def make_jwt(expires_in):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + expires_in}).encode())
+    return f"e30.{payload.decode().rstrip('=')}.sig"
+
+
+class CountingFetch:
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        return make_jwt(self.expires_in), "user", None
+
+
+def test_jwt_expiry():
+    assert jwt_expiry(make_jwt(100)) == pytest.approx(time.time() + 100, abs=2)
+    assert jwt_expiry("not-a-jwt") is None
+
+
+def test_file_lock_is_exclusive_and_takes_over_stale_locks(tmp_path):
+    path = str(tmp_path / "token.lock")
+    with FileLock(path):
+        assert os.path.exists(path)
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.3, poll=0.05).acquire()
+    assert not os.path.exists(path)
+
+    open(path, "w").close()
+    old = time.time() - 600
+    os.utime(path, (old, old))
+    lock = FileLock(path, timeout=1, stale_after=300)
+    lock.acquire()
+    assert open(path).read() == str(os.getpid())
+    lock.release()
+
+
+def test_stale_takeover_never_removes_a_fresh_lock(tmp_path, monkeypatch):
+    path = str(tmp_path / "token.lock")
+    open(path, "w").close()
+    old = time.time() - 600
+    os.utime(path, (old, old))
+    seen_stale = os.stat(path)
+    first = FileLock(path, stale_after=300)
+    first.acquire()     # takes the stale lock over and now holds a fresh one
+
+    real_stat, looks = os.stat, []
+
+    def stat(target, *args, **kwargs):
+        if target == path and not looks:
+            looks.append(target)
+            return seen_stale   # the second waiter looked before the first took over
+        return real_stat(target, *args, **kwargs)
+    monkeypatch.setattr(os, "stat", stat)
+
+    with pytest.raises(TimeoutError):
+        FileLock(path, timeout=0.3, poll=0.05, stale_after=300).acquire()
+    assert looks and os.path.exists(path)
+    assert [name for name in os.listdir(tmp_path)] == ["token.lock"]
+    first.release()
+
+
+def test_waiters_on_a_stale_lock_hold_it_one_at_a_time(tmp_path):
+    path = str(tmp_path / "token.lock")
+    open(path, "w").close()
+    old = time.time() - 600
+    os.utime(path, (old, old))
+    holders, overlaps = [], []
+    start = threading.Barrier(8)
+
+    def worker():
+        lock = FileLock(path, timeout=10, stale_after=300, poll=0.01)
+        start.wait()
+        with lock:
+            holders.append(1)
+            overlaps.append(len(holders))
+            time.sleep(0.01)
+            holders.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(overlaps) == 8 and max(overlaps) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_cache_file_is_reread_only_when_its_mtime_changes(tmp_path):
+    token_file = tmp_path / "token_cache.json"
+    fetch = CountingFetch()
+    provider = TokenProvider(str(token_file), fetch)
+    provider._scheduler = object()      # no background renewal in this test
+
+    def write(token):
+        token_file.write_text(json.dumps({"access_token": token, "user_id": "u",
+                                          "conversation_id": None,
+                                          "expires_at": time.time() + 3600}))
+
+    write("first")
+    assert provider.get()["access_token"] == "first"
+    mtime = os.stat(token_file).st_mtime_ns
+
+    write("second")     # same mtime: the in-memory copy is still used
+    os.utime(token_file, ns=(mtime, mtime))
+    assert provider.get()["access_token"] == "first"
+
+    os.utime(token_file, ns=(mtime + 10**9, mtime + 10**9))    # another worker refreshed it
+    assert provider.get()["access_token"] == "second"
+    assert fetch.calls == 0
+
+
+@pytest.mark.parametrize("expires_in", [200, EXPIRY_SKEW - 30])
+def test_short_lived_tokens_do_not_cause_a_refresh_loop(tmp_path, expires_in):
+    fetch = CountingFetch(expires_in)
+    provider = TokenProvider(str(tmp_path / "token_cache.json"), fetch, refresh_margin=300)
+
+    data = provider.get()
+    for _ in range(100):
+        provider.get()
+    time.sleep(0.5)     # let the scheduler run
+
+    assert fetch.calls == 1
+    assert provider._margin(data) == pytest.approx(max(expires_in - EXPIRY_SKEW, 0) / 2, abs=1)